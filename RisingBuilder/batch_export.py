@@ -0,0 +1,86 @@
+"""
+Headless batch PDF export for saved rosters.
+
+    python batch_export.py rosters/ exports/ --workers 8 --ref-tables
+
+Renders every *.json roster in a folder (Streamlit or Qt save format) in a
+process pool. Each worker keeps its own CODEX_CACHE, so a codex is loaded
+and indexed once per worker no matter how many rosters use it. Failures are
+reported per file and make the command exit non-zero.
+"""
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional, Tuple
+
+from codex import CODEX_CACHE
+from reports import write_roster_pdf
+from utils import ensure_folder, read_json
+
+_codex_dir = Path("codexes")
+_default_codex: Optional[Path] = None
+
+def _init_worker(codex_dir: str, default_codex: Optional[str]):
+    global _codex_dir, _default_codex
+    _codex_dir = Path(codex_dir)
+    _default_codex = Path(default_codex) if default_codex else None
+
+def export_one(roster_path: str, out_dir: str, include_ref_tables: bool = False) -> Tuple[str, Optional[str]]:
+    """Renders one saved roster; returns (pdf path, None) or (roster path, error message)."""
+    try:
+        data = read_json(Path(roster_path))
+        entries = data.get("roster", data.get("roster_entries"))
+        if entries is None: raise ValueError("no roster entries in file")
+        codex_file = data.get("codex_file")
+        codex_path = _codex_dir / codex_file if codex_file else _default_codex
+        if codex_path is None: raise ValueError("roster does not name its codex; pass --codex")
+        codex = CODEX_CACHE.load(codex_path)
+        out = Path(out_dir) / (Path(roster_path).stem + ".pdf")
+        write_roster_pdf(entries, codex, data.get("points_limit", 1500), str(out),
+                         include_ref_tables=include_ref_tables,
+                         roster_name=data.get("roster_name") or Path(roster_path).stem)
+        return str(out), None
+    except Exception as e:
+        detail = traceback.format_exception_only(type(e), e)[-1].strip()
+        return roster_path, detail
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Render a folder of saved rosters to PDF.")
+    ap.add_argument("rosters", type=Path, help="folder of saved roster .json files")
+    ap.add_argument("out", type=Path, nargs="?", default=Path("exports"), help="output folder (default: exports)")
+    ap.add_argument("--codex-dir", type=Path, default=Path("codexes"))
+    ap.add_argument("--codex", type=Path, help="codex for rosters that do not name one")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--ref-tables", action="store_true", help="append the game reference tables")
+    args = ap.parse_args(argv)
+
+    files = sorted(str(p) for p in args.rosters.glob("*.json"))
+    if not files:
+        print(f"No roster files in {args.rosters}", file=sys.stderr)
+        return 1
+    ensure_folder(args.out)
+
+    failures = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(str(args.codex_dir), str(args.codex) if args.codex else None)) as pool:
+        futures = [pool.submit(export_one, f, str(args.out), args.ref_tables) for f in files]
+        for fut in as_completed(futures):
+            path, error = fut.result()
+            if error:
+                failures.append((path, error))
+                print(f"FAILED {path}: {error}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    done = len(files) - len(failures)
+    rate = done / elapsed if elapsed else 0.0
+    print(f"Exported {done}/{len(files)} rosters to {args.out} in {elapsed:.2f}s "
+          f"({rate:.1f} rosters/sec, {args.workers} workers)")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+import re
+import struct
+import threading
+from itertools import count
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from codex_pack import fresh_pack_for, load_pack
+from constants import SLOTS
+from points import CompiledUnit, compile_codex
+from search import SearchIndex
+from tooltips import TooltipIndex
+from utils import read_json
+
+_versions = count(1)
+
+# Combined item names like "Diresword & Shuriken pistol"
+_COMPOUND = re.compile(r' & | and |, ')
+# The codex auditor also splits on "/" and "+"
+_AUDIT_SPLIT = re.compile(r' & | and |, | / | \+ ')
+
+Ref = Tuple[str, str]  # (section, canonical name), section is "weapons", "rules" or "wargear"
+
+def freeze(value):
+    """Deep read-only view of parsed JSON: dicts become mapping proxies, lists become tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def thaw(value):
+    """Mutable deep copy of a frozen codex, for the editor."""
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+def _name_index(section: Mapping[str, Any]) -> Tuple[Mapping[str, Any], Mapping[str, str]]:
+    # Lazy pack sections are already read-only; copying them would decode every record
+    exact = MappingProxyType(dict(section)) if isinstance(section, dict) else section
+    folded: Dict[str, str] = {}
+    for name in section:
+        folded.setdefault(name.casefold(), name)
+    return exact, MappingProxyType(folded)
+
+class Codex:
+    """
+    Read-only index over a loaded codex dict. Built once per load (or save)
+    so frontends never scan the raw unit/weapon/rule lists on refresh.
+    The underlying dict is kept as `data` for the editor dialogs and for
+    serialising back to disk; rebuild the Codex after mutating it.
+    """
+    __slots__ = ("data", "name", "version", "units", "costs", "_by_id", "_by_slot",
+                 "_weapons", "_weapons_cf", "_rules", "_rules_cf", "_wargear", "_wargear_cf",
+                 "_tooltips", "_search", "_refs", "_audit_parts")
+
+    def __init__(self, data: Optional[Mapping[str, Any]]):
+        data = data if data is not None else {}
+        slot_order = {s: i for i, s in enumerate(SLOTS)}
+        units = sorted(
+            (u for u in data.get("units", []) if u.get("id")),
+            key=lambda u: (slot_order.get(u.get("slot", ""), 999), u.get("name", "")),
+        )
+        by_slot: Dict[str, list] = {}
+        for u in units:
+            by_slot.setdefault(u.get("slot", ""), []).append(u)
+
+        w, w_cf = _name_index(data.get("weapons", {}))
+        r, r_cf = _name_index(data.get("rules", {}))
+        g, g_cf = _name_index(data.get("wargear", {}))
+        set_ = object.__setattr__
+        set_(self, "data", data)
+        set_(self, "name", data.get("codex_name", "Unknown Army"))
+        set_(self, "version", next(_versions))
+        set_(self, "units", tuple(units))
+        set_(self, "costs", MappingProxyType(compile_codex(data)))
+        set_(self, "_by_id", MappingProxyType({u["id"]: u for u in units}))
+        set_(self, "_by_slot", MappingProxyType({s: tuple(v) for s, v in by_slot.items()}))
+        set_(self, "_weapons", w); set_(self, "_weapons_cf", w_cf)
+        set_(self, "_rules", r); set_(self, "_rules_cf", r_cf)
+        set_(self, "_wargear", g); set_(self, "_wargear_cf", g_cf)
+        set_(self, "_tooltips", None)
+        set_(self, "_search", None)
+
+        # Decomposition of every item name the units use, so renderers and the
+        # auditor never split names in their loops. A rebuilt Codex (editor
+        # save, reload) gets a fresh table.
+        choice_names = {c.get("name", "") for u in units for o in u.get("options", []) for c in o.get("choices", [])}
+        item_names = choice_names.union(*(u.get("wargear", ()) for u in units), *(u.get("special_rules", ()) for u in units))
+        set_(self, "_refs", MappingProxyType({n: self._decompose(n) for n in item_names}))
+        set_(self, "_audit_parts", MappingProxyType(
+            {n: tuple(p.strip() for p in _AUDIT_SPLIT.split(n) if p.strip()) for n in choice_names}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Codex is immutable; build a new one instead")
+
+    def __bool__(self) -> bool:
+        return bool(self.data)
+
+    # --- Units ---
+    def unit(self, unit_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(unit_id)
+
+    def unit_slot(self, unit_id: Optional[str]) -> Optional[str]:
+        u = self._by_id.get(unit_id)
+        return u.get("slot") if u else None
+
+    def units_in_slot(self, slot: str) -> Tuple[Dict[str, Any], ...]:
+        """Units for one force-org slot, sorted by name."""
+        return self._by_slot.get(slot, ())
+
+    def compiled(self, unit_id: Optional[str]) -> Optional[CompiledUnit]:
+        return self.costs.get(unit_id)
+
+    # --- Weapons / Rules / Wargear ---
+    @property
+    def weapons(self) -> Mapping[str, Any]: return self._weapons
+    @property
+    def rules(self) -> Mapping[str, Any]: return self._rules
+    @property
+    def wargear(self) -> Mapping[str, Any]: return self._wargear
+
+    @staticmethod
+    def _find(exact, folded, name: str, fold: bool):
+        if name in exact: return name, exact[name]
+        if fold:
+            key = folded.get(name.casefold())
+            if key is not None: return key, exact[key]
+        return None
+
+    def find_weapon(self, name: str, fold: bool = True) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Returns (canonical_name, stats) by exact name, then case-insensitively."""
+        return self._find(self._weapons, self._weapons_cf, name, fold)
+
+    def find_rule(self, name: str, fold: bool = True) -> Optional[Tuple[str, Dict[str, Any]]]:
+        return self._find(self._rules, self._rules_cf, name, fold)
+
+    def find_wargear(self, name: str, fold: bool = True) -> Optional[Tuple[str, Dict[str, Any]]]:
+        return self._find(self._wargear, self._wargear_cf, name, fold)
+
+    # --- Item references ---
+    def _decompose(self, name: str) -> Tuple[Ref, ...]:
+        if name in self._weapons: return (("weapons", name),)
+        if name in self._rules: return (("rules", name),)
+        if name in self._wargear: return (("wargear", name),)
+        parts = _COMPOUND.split(name)
+        if len(parts) > 1: return tuple(r for p in parts for r in self._decompose(p))
+        base = name.split(" (")[0]
+        if base != name: return self._decompose(base)
+        return ()
+
+    def refs(self, name: str) -> Tuple[Ref, ...]:
+        """Weapons/rules/wargear an item name refers to: exact, then its "&"/"and"/"," parts, then without a "(...)" note."""
+        hit = self._refs.get(name)
+        return hit if hit is not None else self._decompose(name)
+
+    def audit_parts(self, choice_name: str) -> Tuple[str, ...]:
+        """A choice name split the way the codex auditor checks it."""
+        hit = self._audit_parts.get(choice_name)
+        return hit if hit is not None else tuple(p.strip() for p in _AUDIT_SPLIT.split(choice_name) if p.strip())
+
+    # --- Tooltips ---
+    @property
+    def tooltips(self) -> TooltipIndex:
+        """Substring matcher over weapon/wargear/rule names, built on first use."""
+        if self._tooltips is None:
+            object.__setattr__(self, "_tooltips", TooltipIndex(self.data))
+        return self._tooltips
+
+    def tooltip_matches(self, label: str):
+        """Every (section, name, definition) whose name appears in label; memoised per label."""
+        return self.tooltips.match(label)
+
+    # --- Search ---
+    @property
+    def search(self) -> SearchIndex:
+        """Fuzzy unit search over names, weapons, wargear, rules and option choices, built on first use."""
+        if self._search is None:
+            object.__setattr__(self, "_search", SearchIndex(self))
+        return self._search
+
+class CodexCache:
+    """
+    Process-wide codex loader. Each file is parsed once per (path, mtime, size)
+    and shared as a frozen Codex by every caller (all Streamlit sessions, the
+    Qt combo); a changed file on disk is re-parsed on the next load(). Safe
+    to call from worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Tuple[int, int], Codex]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def load(self, path) -> Codex:
+        path = Path(path)
+        key = str(path.resolve())
+        st = path.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == stamp:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            if cached is not None: self.invalidations += 1
+        # Parse outside the lock so a background preload never blocks a hit on another codex
+        data = self._read(path)
+        data.setdefault("codex_name", path.stem)
+        data.setdefault("units", [])
+        data.setdefault("rules", {})
+        data.setdefault("weapons", {})
+        data.setdefault("wargear", {})
+        codex = Codex(freeze(data))
+        with self._lock:
+            self._entries[key] = (stamp, codex)
+        return codex
+
+    def peek(self, path) -> Optional[Codex]:
+        """The cached Codex for path if it is still current on disk, without loading it."""
+        path = Path(path)
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        cached = self._entries.get(str(path.resolve()))
+        return cached[1] if cached is not None and cached[0] == (st.st_mtime_ns, st.st_size) else None
+
+    @staticmethod
+    def _read(path: Path) -> Dict[str, Any]:
+        """Prefers an up-to-date compiled .rbpack next to the JSON (see codex_pack.py)."""
+        pack = fresh_pack_for(path)
+        if pack is not None:
+            try:
+                return load_pack(pack)
+            except (ValueError, KeyError, struct.error):
+                pass
+        return read_json(path)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None: self._entries.clear()
+            else: self._entries.pop(str(Path(path).resolve()), None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations, "cached": len(self._entries)}
+
+CODEX_CACHE = CodexCache()
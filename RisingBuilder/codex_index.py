@@ -0,0 +1,225 @@
+"""
+Library-wide index over every codex in codexes/, for questions such as
+"every weapon with S8+ AP2 across all factions" or "all units with Deep
+Strike".
+
+Each codex contributes flat rows (weapons with numeric S/AP/range, units
+with slot, minimum points and rules, rule definitions) built once from the
+shared CODEX_CACHE Codex. refresh() stats the folder and rebuilds only the
+rows of files that were added, changed or removed, so queries always see
+the current files at the cost of a few stat() calls.
+
+    python codex_index.py weapons --min-s 8 --max-ap 2
+    python codex_index.py units --rule "deep strike" --max-points 150
+    python codex_index.py rules fleet
+"""
+import argparse
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from codex import CODEX_CACHE
+from points import entry_cost, mandatory_picks
+
+DEFAULT_FOLDER = Path("codexes")
+
+@dataclass(frozen=True)
+class WeaponRow:
+    codex: str
+    name: str
+    S: Optional[int]          # strongest numeric mode ("4/8" -> 8); None for "User", "x2", ...
+    AP: Optional[int]         # best numeric AP; None for "-"
+    range: Optional[int]      # inches, first value of "24\"/12\""; None for Template, "-", ...
+    S_text: str
+    AP_text: str
+    range_text: str
+    type: str
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} ({self.codex}): {self.range_text} S{self.S_text} AP{self.AP_text} {self.type}"
+
+@dataclass(frozen=True)
+class UnitRow:
+    codex: str
+    unit_id: str
+    name: str
+    slot: str
+    points: float             # cheapest legal size with its mandatory picks
+    rules: Tuple[str, ...]
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} ({self.codex}, {self.slot}, {self.points:g} pts)"
+
+@dataclass(frozen=True)
+class RuleRow:
+    codex: str
+    name: str
+    summary: str
+    units: Tuple[str, ...]    # names of the units that have it
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} ({self.codex}, {len(self.units)} units)"
+
+def _numbers(text) -> List[int]:
+    return [int(n) for n in re.findall(r"\d+", str(text or ""))]
+
+def _weapon_row(codex_name: str, name: str, w) -> WeaponRow:
+    strengths = [_numbers(s) for s in str(w.get("S", "")).split("/")]
+    strengths = [n[0] for n in strengths if len(n) == 1 and n[0] <= 10]   # skip "2D6", "x2"...
+    aps = [n for n in _numbers(w.get("AP")) if 1 <= n <= 6]
+    rng = _numbers(str(w.get("range", "")).split("/")[0])
+    return WeaponRow(codex_name, name, max(strengths) if strengths else None, min(aps) if aps else None,
+                     rng[0] if rng else None, str(w.get("S", "-")), str(w.get("AP", "-")),
+                     str(w.get("range", "-")), str(w.get("type", "")))
+
+def _unit_row(codex, u) -> UnitRow:
+    size = u.get("min_size", 1)
+    cu = codex.compiled(u["id"])
+    points = entry_cost({"size": size, "selected": mandatory_picks(u, size, cu)}, cu) if cu else u.get("base_points", 0)
+    return UnitRow(codex.name, u["id"], u.get("name", u["id"]), u.get("slot", ""), points,
+                   tuple(u.get("special_rules", ())))
+
+def _rows(codex):
+    weapons = tuple(_weapon_row(codex.name, n, w) for n, w in codex.weapons.items())
+    units = tuple(_unit_row(codex, u) for u in codex.units)
+    holders: Dict[str, List[str]] = {}
+    for u in units:
+        for r in u.rules: holders.setdefault(r.casefold(), []).append(u.name)
+    rules = tuple(RuleRow(codex.name, n, str((d or {}).get("summary", "")), tuple(holders.get(n.casefold(), ())))
+                  for n, d in codex.rules.items())
+    return weapons, units, rules
+
+class CodexIndex:
+    """Thread-safe; every query refreshes first, which is a stat() per file when nothing changed."""
+
+    def __init__(self, folder: Path = DEFAULT_FOLDER):
+        self.folder = Path(folder)
+        self._lock = threading.Lock()
+        self._files: Dict[str, Tuple[object, tuple]] = {}   # resolved path -> (Codex, its rows)
+        self._weapons: Tuple[WeaponRow, ...] = ()
+        self._units: Tuple[UnitRow, ...] = ()
+        self._rules: Tuple[RuleRow, ...] = ()
+        self.rebuilds = 0   # codex files (re)indexed so far
+
+    def refresh(self) -> List[str]:
+        """Re-indexes added or changed codex files and drops deleted ones; returns the paths that changed."""
+        with self._lock:
+            changed = []
+            paths = {str(p.resolve()): p for p in sorted(self.folder.glob("*.json"), key=lambda p: p.name)}
+            for key in [k for k in self._files if k not in paths]:
+                del self._files[key]; changed.append(key)
+            for key, path in paths.items():
+                try: codex = CODEX_CACHE.load(path)   # a cache hit unless the file changed
+                except Exception as e:
+                    print(f"Skipping {path.name}: {e}")
+                    continue
+                cached = self._files.get(key)
+                if cached is not None and cached[0] is codex: continue
+                self._files[key] = (codex, _rows(codex))
+                self.rebuilds += 1
+                changed.append(key)
+            if changed:
+                rows = [self._files[k][1] for k in paths if k in self._files]
+                self._weapons = tuple(w for r in rows for w in r[0])
+                self._units = tuple(u for r in rows for u in r[1])
+                self._rules = tuple(x for r in rows for x in r[2])
+            return changed
+
+    @property
+    def codexes(self) -> List[str]:
+        self.refresh()
+        return sorted({u.codex for u in self._units})
+
+    def weapons(self, min_s: Optional[int] = None, max_s: Optional[int] = None, max_ap: Optional[int] = None,
+                min_range: Optional[int] = None, max_range: Optional[int] = None, name: str = "", type: str = "",
+                codex: str = "") -> List[WeaponRow]:
+        """`max_ap` 2 means AP2 or better (AP1); numeric filters skip weapons without that number."""
+        self.refresh()
+        name, type, codex = name.casefold(), type.casefold(), codex.casefold()
+        return [w for w in self._weapons
+                if (min_s is None or (w.S is not None and w.S >= min_s))
+                and (max_s is None or (w.S is not None and w.S <= max_s))
+                and (max_ap is None or (w.AP is not None and w.AP <= max_ap))
+                and (min_range is None or (w.range is not None and w.range >= min_range))
+                and (max_range is None or (w.range is not None and w.range <= max_range))
+                and (not name or name in w.name.casefold())
+                and (not type or type in w.type.casefold())
+                and (not codex or codex in w.codex.casefold())]
+
+    def units(self, slot: str = "", min_points: Optional[float] = None, max_points: Optional[float] = None,
+              rule: str = "", name: str = "", codex: str = "") -> List[UnitRow]:
+        """`rule` matches any part of a rule name ("deep" finds Deep Strike), case-insensitively."""
+        self.refresh()
+        rule, name, codex = rule.casefold(), name.casefold(), codex.casefold()
+        return [u for u in self._units
+                if (not slot or u.slot == slot)
+                and (min_points is None or u.points >= min_points)
+                and (max_points is None or u.points <= max_points)
+                and (not rule or any(rule in r.casefold() for r in u.rules))
+                and (not name or name in u.name.casefold())
+                and (not codex or codex in u.codex.casefold())]
+
+    def rules(self, name: str = "", codex: str = "") -> List[RuleRow]:
+        self.refresh()
+        name, codex = name.casefold(), codex.casefold()
+        return [r for r in self._rules
+                if (not name or name in r.name.casefold()) and (not codex or codex in r.codex.casefold())]
+
+_indexes: Dict[Path, CodexIndex] = {}
+_indexes_lock = threading.Lock()
+
+def codex_index(folder: Path = DEFAULT_FOLDER) -> CodexIndex:
+    """Process-wide index per codex folder."""
+    key = Path(folder).resolve()
+    with _indexes_lock:
+        if key not in _indexes: _indexes[key] = CodexIndex(folder)
+        return _indexes[key]
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Query weapons, units and rules across every codex.")
+    ap.add_argument("--codex-dir", type=Path, default=Path(__file__).parent / "codexes")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--codex", default="", help="only codexes whose name contains this")
+    sub = ap.add_subparsers(dest="what", required=True)
+    w = sub.add_parser("weapons", parents=[common], help="weapons by S, AP and range")
+    w.add_argument("name", nargs="?", default="")
+    w.add_argument("--min-s", type=int); w.add_argument("--max-s", type=int)
+    w.add_argument("--max-ap", type=int, help="AP this good or better")
+    w.add_argument("--min-range", type=int); w.add_argument("--max-range", type=int)
+    w.add_argument("--type", default="", help="weapon type contains, e.g. Heavy")
+    u = sub.add_parser("units", parents=[common], help="units by slot, points and rules")
+    u.add_argument("name", nargs="?", default="")
+    u.add_argument("--slot", default="")
+    u.add_argument("--rule", default="")
+    u.add_argument("--min-points", type=float); u.add_argument("--max-points", type=float)
+    r = sub.add_parser("rules", parents=[common], help="rule definitions and the units that have them")
+    r.add_argument("name", nargs="?", default="")
+    args = ap.parse_args(argv)
+
+    index = CodexIndex(args.codex_dir)
+    t = time.perf_counter()
+    index.refresh()
+    built = time.perf_counter() - t
+    t = time.perf_counter()
+    if args.what == "weapons":
+        rows = index.weapons(args.min_s, args.max_s, args.max_ap, args.min_range, args.max_range, args.name,
+                             args.type, args.codex)
+    elif args.what == "units":
+        rows = index.units(args.slot, args.min_points, args.max_points, args.rule, args.name, args.codex)
+    else:
+        rows = index.rules(args.name, args.codex)
+    took = time.perf_counter() - t
+    for row in rows: print(row.label)
+    print(f"{len(rows)} {args.what} from {len(index.codexes)} codexes "
+          f"(index built in {built * 1000:.1f} ms, query {took * 1000:.2f} ms)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,385 @@
+"""
+Compiled binary codex packs.
+
+`python codex_pack.py` compiles every codexes/*.json into a sibling .rbpack:
+units, option groups, choices and statlines become fixed-size struct records,
+and every string lives in one shared string table that is only decoded when a
+field is actually read. Weapons, rules and wargear are exposed as lazy
+read-only mappings, so rule summaries and weapon notes are never decoded
+unless something looks them up.
+
+CodexCache.load() transparently prefers a pack whose recorded source
+mtime/size still match the JSON next to it; editing the JSON (or saving it
+from the editor) makes the pack stale and it is ignored until rebuilt.
+"""
+import json
+import struct
+import sys
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+PACK_SUFFIX = ".rbpack"
+MAGIC = b"RBPK"
+FORMAT_VERSION = 1
+NONE = 0xFFFFFFFF
+
+HEADER = struct.Struct("<4sHHqQI")   # magic, version, reserved, source mtime_ns, source size, sections
+SECTION = struct.Struct("<4sII")     # tag, offset, length
+
+# Tagged scalar: (tag, payload). Strings are string-table ids.
+T_MISSING, T_INT, T_STR, T_JSON, T_BOOL = range(5)
+VAL = "Bi"
+
+STAT_KEYS = ("name", "WS", "BS", "S", "T", "W", "I", "A", "Ld", "Sv", "Front", "Side", "Rear")
+PROFILE = struct.Struct("<" + VAL * len(STAT_KEYS) + "QI")           # stats, key order, extras
+CHOICE = struct.Struct("<" + VAL * 4 + "I")                           # id, name, points, points_mode, extras
+GROUP = struct.Struct("<" + VAL * 5 + "III")                          # ids/limits, choices start/count, extras
+UNIT_SCALARS = ("id", "name", "slot", "unique", "base_points", "points_per_model", "min_size",
+                "max_size", "default_size", "unit_type", "is_transport", "profile_type",
+                "enable_twin_link_discount")
+UNIT_LISTS = ("wargear", "special_rules", "dedicated_transports", "options_text")
+# scalars, profile idx, sub_profiles (keys start, count, first profile), options start/count,
+# 4 string lists (start, count), extras, key order (up to 16 keys)
+UNIT = struct.Struct("<" + VAL * len(UNIT_SCALARS) + "I" + "III" + "II" + "II" * len(UNIT_LISTS) + "I" + "16s")
+UNIT_KEYS = UNIT_SCALARS + ("profile", "sub_profiles", "options") + UNIT_LISTS
+WEAPON_KEYS = ("range", "S", "AP", "type", "notes")
+WEAPON = struct.Struct("<I" + VAL * len(WEAPON_KEYS) + "QI")          # name, fields, key order, extras
+GROUP_KEYS = ("group_id", "group_name", "min_select", "max_select", "linked_to_size")
+CHOICE_KEYS = ("id", "name", "points", "points_mode")
+TEXT = struct.Struct("<I" + VAL + "I")                                # name, summary, extras
+U32 = struct.Struct("<I")
+
+# --- Writing ---
+class _Builder:
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self.lists: List[int] = []
+
+    def s(self, text: str) -> int:
+        sid = self._ids.get(text)
+        if sid is None:
+            sid = self._ids[text] = len(self.strings)
+            self.strings.append(text)
+        return sid
+
+    def val(self, d: Mapping, key: str) -> Tuple[int, int]:
+        if key not in d: return (T_MISSING, 0)
+        v = d[key]
+        if isinstance(v, bool): return (T_BOOL, int(v))
+        if isinstance(v, int) and -2**31 <= v < 2**31: return (T_INT, v)
+        if isinstance(v, str): return (T_STR, self.s(v))
+        return (T_JSON, self.s(json.dumps(v, ensure_ascii=False)))
+
+    def extras(self, d: Mapping, known) -> int:
+        rest = {k: v for k, v in d.items() if k not in known}
+        return self.s(json.dumps(rest, ensure_ascii=False)) if rest else NONE
+
+    def str_list(self, d: Mapping, key: str) -> Tuple[int, int]:
+        items = d.get(key)
+        if not _is_str_list(items): return (NONE, 0)
+        start = len(self.lists)
+        self.lists.extend(self.s(x) for x in items)
+        return (start, len(items))
+
+def _is_str_list(items) -> bool:
+    return isinstance(items, list) and all(isinstance(x, str) for x in items)
+
+def _is_dict_list(items) -> bool:
+    return isinstance(items, list) and all(isinstance(x, dict) for x in items)
+
+def _fits(key: str, v) -> bool:
+    """Whether a unit value has the shape its struct slot stores; anything else goes to the unit's extras JSON."""
+    if key in UNIT_SCALARS: return True
+    if key in UNIT_LISTS: return _is_str_list(v)
+    if key == "profile": return isinstance(v, dict)
+    if key == "sub_profiles": return isinstance(v, dict) and all(isinstance(p, dict) for p in v.values())
+    return _is_dict_list(v)   # options
+
+def _order(d: Mapping, keys) -> int:
+    """Packs the source key order into 4-bit slots so dicts decode in their original order."""
+    code = 0
+    for i, k in enumerate(k for k in d if k in keys):
+        code |= (keys.index(k) + 1) << (4 * i)
+    return code
+
+def _flat(pairs):
+    return [x for p in pairs for x in p]
+
+def build_pack(data: Dict[str, Any], source_stat=None) -> bytes:
+    b = _Builder()
+    profiles, choices, groups, units = [], [], [], []
+
+    def add_profile(p: Mapping) -> int:
+        profiles.append(PROFILE.pack(*_flat(b.val(p, k) for k in STAT_KEYS), _order(p, STAT_KEYS), b.extras(p, STAT_KEYS)))
+        return len(profiles) - 1
+
+    for u in data.get("units", []):
+        packed = tuple(k for k in UNIT_KEYS if k in u and _fits(k, u[k]))
+        prof = add_profile(u["profile"]) if "profile" in packed else NONE
+        subs = u.get("sub_profiles")
+        if "sub_profiles" in packed:
+            sub_keys = b.str_list({"k": list(subs)}, "k")
+            sub_first = len(profiles)
+            for p in subs.values(): add_profile(p)
+        else:
+            sub_keys, sub_first = (NONE, 0), NONE
+        opt_start = len(groups)
+        if "options" in packed:
+            for g in u["options"]:
+                ch_start = len(choices)
+                has_choices = _is_dict_list(g.get("choices"))   # otherwise kept in the group's extras
+                for c in (g["choices"] if has_choices else ()):
+                    choices.append(CHOICE.pack(*_flat(b.val(c, k) for k in CHOICE_KEYS), b.extras(c, CHOICE_KEYS)))
+                known = GROUP_KEYS + (("choices",) if has_choices else ())
+                groups.append(GROUP.pack(*_flat(b.val(g, k) for k in GROUP_KEYS),
+                                         ch_start if has_choices else NONE, len(choices) - ch_start, b.extras(g, known)))
+        order = bytes(UNIT_KEYS.index(k) + 1 for k in u if k in UNIT_KEYS)[:16].ljust(16, b"\0")
+        units.append(UNIT.pack(
+            *_flat(b.val(u, k) for k in UNIT_SCALARS), prof,
+            sub_keys[0], sub_keys[1], sub_first,
+            opt_start if "options" in packed else NONE, len(groups) - opt_start,
+            *_flat(b.str_list(u, k) if k in packed else (NONE, 0) for k in UNIT_LISTS),
+            b.extras(u, packed), order))
+
+    weapons = [WEAPON.pack(b.s(n), *_flat(b.val(w, k) for k in WEAPON_KEYS), _order(w, WEAPON_KEYS), b.extras(w, WEAPON_KEYS))
+               for n, w in data.get("weapons", {}).items()]
+    rules = [TEXT.pack(b.s(n), *b.val(r, "summary"), b.extras(r, ("summary",))) for n, r in data.get("rules", {}).items()]
+    gear = [TEXT.pack(b.s(n), *b.val(g, "summary"), b.extras(g, ("summary",))) for n, g in data.get("wargear", {}).items()]
+    top_known = ("codex_name", "rules", "wargear", "weapons", "units")
+    meta = U32.pack(b.s(json.dumps({"codex_name": data.get("codex_name"), "order": list(data),
+                                    "extras": {k: v for k, v in data.items() if k not in top_known}}, ensure_ascii=False)))
+
+    blobs = [s.encode("utf-8") for s in b.strings]
+    offsets, pos = [0], 0
+    for blob in blobs:
+        pos += len(blob); offsets.append(pos)
+    strs = U32.pack(len(blobs)) + struct.pack(f"<{len(offsets)}I", *offsets) + b"".join(blobs)
+
+    sections = [
+        (b"META", meta), (b"STRS", strs), (b"LIST", struct.pack(f"<{len(b.lists)}I", *b.lists)),
+        (b"PROF", b"".join(profiles)), (b"CHOI", b"".join(choices)), (b"GRUP", b"".join(groups)),
+        (b"UNIT", b"".join(units)), (b"WEAP", b"".join(weapons)), (b"RULE", b"".join(rules)), (b"GEAR", b"".join(gear)),
+    ]
+    mtime_ns, size = source_stat if source_stat else (0, 0)
+    out = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, 0, mtime_ns, size, len(sections)))
+    offset = len(out) + SECTION.size * len(sections)
+    for tag, blob in sections:
+        out += SECTION.pack(tag, offset, len(blob))
+        offset += len(blob)
+    for _, blob in sections: out += blob
+    return bytes(out)
+
+def pack_path(json_path: Path) -> Path:
+    return json_path.with_suffix(PACK_SUFFIX)
+
+def compile_codex_file(json_path: Path) -> Path:
+    json_path = Path(json_path)
+    st = json_path.stat()
+    data = json.loads(json_path.read_text(encoding="utf-8-sig"))
+    out = pack_path(json_path)
+    out.write_bytes(build_pack(data, (st.st_mtime_ns, st.st_size)))
+    return out
+
+# --- Reading ---
+class _Strings:
+    def __init__(self, buf: memoryview):
+        (n,) = U32.unpack_from(buf, 0)
+        self._offsets = struct.unpack_from(f"<{n + 1}I", buf, 4)
+        self._blob = buf[4 + 4 * (n + 1):]
+        self._cache: Dict[int, str] = {}
+
+    def __getitem__(self, sid: int) -> str:
+        s = self._cache.get(sid)
+        if s is None:
+            s = self._cache[sid] = str(self._blob[self._offsets[sid]:self._offsets[sid + 1]], "utf-8")
+        return s
+
+class _Pack:
+    def __init__(self, raw: bytes):
+        from codex import freeze
+        buf = memoryview(raw)
+        magic, version, _, self.src_mtime_ns, self.src_size, n = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("not a compatible codex pack")
+        self.sections = {}
+        for i in range(n):
+            tag, off, length = SECTION.unpack_from(buf, HEADER.size + i * SECTION.size)
+            self.sections[tag] = buf[off:off + length]
+        self.strings = _Strings(self.sections[b"STRS"])
+        lists = self.sections[b"LIST"]
+        self.lists = struct.unpack_from(f"<{len(lists) // 4}I", lists) if len(lists) else ()
+        self.freeze = freeze
+
+    def records(self, tag: bytes, rec: struct.Struct) -> List[tuple]:
+        return list(rec.iter_unpack(self.sections[tag])) if len(self.sections[tag]) else []
+
+    def extras(self, sid: int) -> Dict[str, Any]:
+        return {} if sid == NONE else self.freeze(json.loads(self.strings[sid]))
+
+    def str_list(self, start: int, count: int) -> Optional[Tuple[str, ...]]:
+        if start == NONE: return None
+        s = self.strings
+        return tuple(s[i] for i in self.lists[start:start + count])
+
+    def fields(self, keys, vals, order: int = 0) -> Dict[str, Any]:
+        """Decodes tagged values into a dict, in the recorded key order (or keys order)."""
+        slots = _SLOTS.get(order)
+        if slots is None:
+            slots, code = [], order
+            while code:
+                slots.append((code & 0xF) - 1); code >>= 4
+            slots = _SLOTS[order] = tuple(slots)
+        s = self.strings
+        out = {}
+        for i in slots or range(len(keys)):
+            tag = vals[2 * i]
+            if tag == T_MISSING: continue
+            payload = vals[2 * i + 1]
+            if tag == T_STR: out[keys[i]] = s[payload]
+            elif tag == T_INT: out[keys[i]] = payload
+            elif tag == T_BOOL: out[keys[i]] = bool(payload)
+            else: out[keys[i]] = self.freeze(json.loads(s[payload]))
+        return out
+
+_SLOTS: Dict[int, Tuple[int, ...]] = {}
+
+class LazySection(Mapping):
+    """Read-only name -> definition mapping whose records are decoded on first lookup."""
+
+    def __init__(self, pack: _Pack, records: List[tuple], decode):
+        self._pack = pack
+        self._index = {pack.strings[r[0]]: r for r in records}
+        self._decode = decode
+        self._cache: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str):
+        hit = self._cache.get(name)
+        if hit is None:
+            hit = self._cache[name] = MappingProxyType(self._decode(self._pack, self._index[name]))
+        return hit
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, name) -> bool:
+        return name in self._index
+
+def _decode_weapon(pack: _Pack, r: tuple) -> Dict[str, Any]:
+    n = 2 * len(WEAPON_KEYS)
+    d = pack.fields(WEAPON_KEYS, r[1:1 + n], r[1 + n])
+    d.update(pack.extras(r[2 + n]))
+    return d
+
+def _decode_text(pack: _Pack, r: tuple) -> Dict[str, Any]:
+    d = pack.fields(("summary",), r[1:3])
+    d.update(pack.extras(r[3]))
+    return d
+
+def _decode_units(pack: _Pack) -> Tuple[Mapping[str, Any], ...]:
+    """Units are decoded eagerly (the Codex index needs all of them) straight into frozen form."""
+    profiles = pack.records(b"PROF", PROFILE)
+    choices = pack.records(b"CHOI", CHOICE)
+    groups = pack.records(b"GRUP", GROUP)
+    ns = 2 * len(STAT_KEYS)
+
+    def profile(i):
+        r = profiles[i]
+        d = pack.fields(STAT_KEYS, r, r[ns])
+        if r[ns + 1] != NONE: d.update(pack.extras(r[ns + 1]))
+        return MappingProxyType(d)
+
+    def choice(c):
+        ch = pack.fields(CHOICE_KEYS, c)
+        if c[8] != NONE: ch.update(pack.extras(c[8]))
+        return MappingProxyType(ch)
+
+    def group(r):
+        g = pack.fields(GROUP_KEYS, r)
+        if r[10] != NONE:
+            g["choices"] = tuple(choice(c) for c in choices[r[10]:r[10] + r[11]])
+        if r[12] != NONE: g.update(pack.extras(r[12]))
+        return MappingProxyType(g)
+
+    units = []
+    nsc = 2 * len(UNIT_SCALARS)
+    for r in pack.records(b"UNIT", UNIT):
+        u = pack.fields(UNIT_SCALARS, r)
+        prof, sub_start, sub_count, sub_first, opt_start, opt_count = r[nsc:nsc + 6]
+        if prof != NONE: u["profile"] = profile(prof)
+        if sub_start != NONE:
+            keys = pack.str_list(sub_start, sub_count)
+            u["sub_profiles"] = MappingProxyType({k: profile(sub_first + i) for i, k in enumerate(keys)})
+        if opt_start != NONE:
+            u["options"] = tuple(group(g) for g in groups[opt_start:opt_start + opt_count])
+        pos = nsc + 6
+        for k in UNIT_LISTS:
+            items = pack.str_list(r[pos], r[pos + 1]); pos += 2
+            if items is not None: u[k] = items
+        if r[pos] != NONE: u.update(pack.extras(r[pos]))
+        order = [UNIT_KEYS[i - 1] for i in r[pos + 1] if i]
+        units.append(MappingProxyType({k: u[k] for k in order if k in u} | u))
+    return tuple(units)
+
+def load_pack(path: Path) -> Dict[str, Any]:
+    """
+    Top-level codex dict whose sections are already read-only (units as
+    tuples of mapping proxies, weapons/rules/wargear as LazySection), so
+    codex.freeze() leaves them as they are.
+    """
+    pack = _Pack(Path(path).read_bytes())
+    (meta_id,) = U32.unpack_from(pack.sections[b"META"], 0)
+    meta = json.loads(pack.strings[meta_id])
+    sections = {
+        "codex_name": meta["codex_name"],
+        "units": _decode_units(pack),
+        "weapons": LazySection(pack, pack.records(b"WEAP", WEAPON), _decode_weapon),
+        "rules": LazySection(pack, pack.records(b"RULE", TEXT), _decode_text),
+        "wargear": LazySection(pack, pack.records(b"GEAR", TEXT), _decode_text),
+    }
+    sections.update(meta["extras"])
+    return {k: sections[k] for k in meta["order"] if k in sections}
+
+def fresh_pack_for(json_path: Path) -> Optional[Path]:
+    """The pack next to json_path, if it was compiled from the JSON currently on disk."""
+    pack = pack_path(json_path)
+    try:
+        st = json_path.stat()
+        with open(pack, "rb") as f:
+            head = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(head) < HEADER.size: return None
+    magic, version, _, mtime_ns, size, _ = HEADER.unpack(head)
+    if magic != MAGIC or version != FORMAT_VERSION: return None
+    return pack if (mtime_ns, size) == (st.st_mtime_ns, st.st_size) else None
+
+def _bench(paths: List[Path], rounds: int = 200) -> None:
+    from codex import Codex, freeze
+    for p in paths:
+        def timed(load):
+            t = time.perf_counter()
+            for _ in range(rounds): Codex(freeze(load()))
+            return (time.perf_counter() - t) / rounds * 1000
+        j = timed(lambda: json.loads(p.read_text(encoding="utf-8-sig")))
+        k = timed(lambda: load_pack(pack_path(p)))
+        print(f"{p.name}: json {j:.2f} ms, pack {k:.2f} ms ({p.stat().st_size} -> {pack_path(p).stat().st_size} bytes)")
+
+def main(argv: List[str]) -> int:
+    bench = "--bench" in argv
+    args = [a for a in argv if a != "--bench"]
+    paths = [Path(a) for a in args] or sorted((Path(__file__).parent / "codexes").glob("*.json"))
+    for p in paths:
+        out = compile_codex_file(p)
+        print(f"Compiled {p.name} -> {out.name}")
+    if bench: _bench(paths)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
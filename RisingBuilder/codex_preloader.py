@@ -0,0 +1,103 @@
+from pathlib import Path
+from typing import Dict, List
+
+from PySide6.QtCore import QFileSystemWatcher, QObject, QRunnable, QThreadPool, Signal
+
+from codex import CODEX_CACHE
+from utils import ensure_folder
+
+class _LoadSignals(QObject):
+    loaded = Signal(str)
+    failed = Signal(str, str)
+
+class _LoadTask(QRunnable):
+    def __init__(self, path: Path, signals: _LoadSignals):
+        super().__init__()
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        try:
+            CODEX_CACHE.load(self.path)
+        except Exception as e:
+            self.signals.failed.emit(str(self.path), str(e))
+            return
+        self.signals.loaded.emit(str(self.path))
+
+class CodexDirectory(QObject):
+    """
+    Watches a codex folder and keeps every *.json in it parsed and indexed in
+    CODEX_CACHE from a background thread pool, so picking a faction in the
+    combo is a cache hit rather than a parse on the GUI thread.
+
+    `paths` is the current listing (resolved, sorted by name); it is only
+    re-globbed when the folder changes. A changed file invalidates just that
+    codex and queues it for reloading.
+    """
+    listingChanged = Signal()
+    codexChanged = Signal(str)   # resolved path of a codex edited on disk
+    loaded = Signal(str)
+    failed = Signal(str, str)
+
+    def __init__(self, folder: Path, parent=None):
+        super().__init__(parent)
+        self.folder = Path(folder)
+        ensure_folder(self.folder)
+        self.paths: List[Path] = []
+        self._pending: Dict[str, None] = {}
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)  # parsing is CPU-bound; one worker keeps the GUI responsive
+        self._signals = _LoadSignals(self)
+        self._signals.loaded.connect(self._on_loaded)
+        self._signals.failed.connect(self._on_failed)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.addPath(str(self.folder))
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._rescan()
+
+    def _rescan(self) -> bool:
+        paths = sorted((p.resolve() for p in self.folder.glob("*.json")), key=lambda p: p.name)
+        if paths == self.paths: return False
+        gone = set(self.paths) - set(paths)
+        for p in gone: CODEX_CACHE.invalidate(p)
+        if self._watcher.files(): self._watcher.removePaths(self._watcher.files())
+        if paths: self._watcher.addPaths([str(p) for p in paths])
+        self.paths = paths
+        return True
+
+    def preload(self, path: Path):
+        key = str(path)
+        if key in self._pending or CODEX_CACHE.peek(path) is not None: return
+        self._pending[key] = None
+        self._pool.start(_LoadTask(path, self._signals))
+
+    def preload_all(self):
+        for p in self.paths: self.preload(p)
+
+    def _on_directory_changed(self, _):
+        if self._rescan():
+            self.listingChanged.emit()
+            self.preload_all()
+
+    def _on_file_changed(self, path: str):
+        p = Path(path)
+        CODEX_CACHE.invalidate(p)
+        # Editors often save by replacing the file, which drops it from the watch list
+        if p.exists():
+            if path not in self._watcher.files(): self._watcher.addPath(path)
+            self.codexChanged.emit(path)
+            self.preload(p)
+        elif self._rescan():
+            self.listingChanged.emit()
+
+    def _on_loaded(self, path: str):
+        self._pending.pop(path, None)
+        self.loaded.emit(path)
+
+    def _on_failed(self, path: str, error: str):
+        self._pending.pop(path, None)
+        self.failed.emit(path, error)
+
+    def wait(self, msecs: int = -1) -> bool:
+        return self._pool.waitForDone(msecs)
@@ -0,0 +1,104 @@
+"""
+GitHub issue list and feedback reports for the app sidebar, without
+blocking a rerun on the network.
+
+The issue list is a TTL cache shared by every session in the process. An
+expired value is still returned at once while one background thread
+refreshes it. Failures and GitHub's rate-limit headers push the next
+attempt back. Feedback is posted from a single background worker over a
+pooled requests.Session; the caller gets a Future to poll.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_ROOT = "https://api.github.com"
+
+class IssueTracker:
+    def __init__(self, owner: str, repo: str, token: str, api_root: str = API_ROOT,
+                 ttl: float = 300.0, timeout: float = 3.0, retry_after: float = 30.0):
+        self.url = f"{api_root.rstrip('/')}/repos/{owner}/{repo}/issues"
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.headers.update({"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"})
+        self._lock = threading.Lock()
+        self._issues: List[Dict[str, Any]] = []
+        self._fetched = 0.0        # time of the last successful fetch (0 = never)
+        self._next_try = 0.0       # no refresh before this (ttl or failure back-off)
+        self._reset_at = 0.0       # GitHub rate limit exhausted until this time
+        self._refreshing: Optional[threading.Thread] = None
+        self._outbox = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feedback")
+        self.error: Optional[str] = None
+
+    # --- Issue list ---
+    def issues(self, wait: float = 0.0) -> List[Dict[str, Any]]:
+        """The cached issues, starting a background refresh when they are stale. Never blocks longer than `wait`."""
+        with self._lock:
+            if time.time() >= max(self._next_try, self._reset_at) and self._refreshing is None:
+                self._refreshing = threading.Thread(target=self._refresh, name="issue-refresh", daemon=True)
+                self._refreshing.start()
+            worker, cached = self._refreshing, self._issues
+        if worker is not None and wait > 0:
+            worker.join(wait)
+            with self._lock: cached = self._issues
+        return cached
+
+    def _refresh(self):
+        issues, next_try, reset_at, error = None, time.time() + self.retry_after, 0.0, None
+        try:
+            r = self.session.get(self.url, params={"state": "all", "sort": "updated", "direction": "desc", "per_page": 20},
+                                 timeout=self.timeout)
+            if r.status_code == 200:
+                issues, next_try = r.json(), time.time() + self.ttl
+            else:
+                error = f"GitHub returned {r.status_code}"
+            if r.headers.get("X-RateLimit-Remaining") == "0":
+                reset_at = float(r.headers.get("X-RateLimit-Reset", 0))
+        except (requests.RequestException, ValueError) as e:
+            error = str(e)
+        with self._lock:
+            if issues is not None:
+                self._issues, self._fetched = issues, time.time()
+            self._next_try, self._reset_at, self.error, self._refreshing = next_try, reset_at, error, None
+
+    def invalidate(self):
+        """Refresh on the next issues() call (rate limits still apply)."""
+        with self._lock: self._next_try = 0.0
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the last successful fetch, None if there has not been one."""
+        return time.time() - self._fetched if self._fetched else None
+
+    # --- Feedback ---
+    def submit(self, title: str, body: str) -> "Future[Dict[str, Any]]":
+        """Queues a new issue; the Future resolves to GitHub's response or raises its error."""
+        return self._outbox.submit(self._post, title, body)
+
+    def _post(self, title: str, body: str) -> Dict[str, Any]:
+        r = self.session.post(self.url, json={"title": title, "body": body}, timeout=max(self.timeout, 10.0))
+        r.raise_for_status()
+        self.invalidate()
+        return r.json()
+
+    def close(self):
+        self._outbox.shutdown(wait=True)
+        self.session.close()
+
+_trackers: Dict[Tuple[str, str, str, str], IssueTracker] = {}
+_trackers_lock = threading.Lock()
+
+def tracker(owner: str, repo: str, token: str, api_root: str = API_ROOT) -> IssueTracker:
+    """Process-wide tracker per repository, shared by all sessions."""
+    key = (owner, repo, token, api_root)
+    with _trackers_lock:
+        if key not in _trackers: _trackers[key] = IssueTracker(owner, repo, token, api_root)
+        return _trackers[key]
\ No newline at end of file
@@ -9,9 +9,11 @@ from PySide6.QtWidgets import (
     QTextEdit, QMessageBox, QFileDialog
 )
 
-from utils import ensure_folder, read_json, write_json, find_default_codex_file, make_backup, unique_id, slugify
-from constants import SLOTS
-from ui_editors import UnitEditorDialog, RulesManagerDialog, WeaponsManagerDialog, WargearManagerDialog
+from utils import ensure_folder, write_json, find_default_codex_file, make_backup, unique_id, slugify
+from codex import Codex, CODEX_CACHE, thaw
+from codex_index import codex_index
+from codex_preloader import CodexDirectory
+from ui_editors import UnitEditorDialog, RulesManagerDialog, WeaponsManagerDialog, WargearManagerDialog, CodexIndexDialog
 from ui_roster import RosterBuilderWidget
 
 class MainWindow(QMainWindow):
@@ -19,7 +21,11 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.setWindowTitle("40k 5th Army Builder")
         self.codex_path: Optional[Path] = None
-        self.codex_data: Dict[str, Any] = {"codex_name": "Unnamed Codex", "units": []}
+        self._codex_data: Optional[Dict[str, Any]] = {"codex_name": "Unnamed Codex", "units": []}
+        self.codex = Codex(self._codex_data)
+        self._saved_mtime: Optional[int] = None   # st_mtime_ns of our last save, to skip its change signal
+        self.codex_dir = CodexDirectory(Path("codexes"), self)
+        self.codex_dir.codexChanged.connect(self._on_codex_file_changed)
 
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
@@ -43,6 +49,8 @@ class MainWindow(QMainWindow):
         self.weapons_btn.clicked.connect(self.open_weapons_manager)
         self.wargear_btn = QPushButton("Wargear...")
         self.wargear_btn.clicked.connect(self.open_wargear_manager)
+        self.all_codexes_btn = QPushButton("All Codexes...")
+        self.all_codexes_btn.clicked.connect(self.open_codex_index)
 
         top.addWidget(QLabel("Codex:"))
         top.addWidget(self.codex_name_edit, stretch=1)
@@ -50,6 +58,7 @@ class MainWindow(QMainWindow):
         top.addWidget(self.rules_btn)
         top.addWidget(self.weapons_btn)
         top.addWidget(self.wargear_btn)
+        top.addWidget(self.all_codexes_btn)
         top.addWidget(self.save_btn)
 
         splitter = QSplitter(Qt.Horizontal)
@@ -90,6 +99,7 @@ class MainWindow(QMainWindow):
         self.tabs.addTab(self.roster_tab, "Roster Builder")
 
         self.load_startup_codex()
+        self.codex_dir.preload_all()
 
     # [Methods: transport_units, unit_name_by_id, load_startup_codex, load_codex, 
     # open_codex, open_rules_manager, open_weapons_manager, open_wargear_manager,
@@ -98,9 +108,20 @@ class MainWindow(QMainWindow):
     #
     # Copy these methods from your original main.py
 
+    @property
+    def codex_data(self) -> Dict[str, Any]:
+        return self.ensure_editable()
+
+    def ensure_editable(self) -> Dict[str, Any]:
+        """Cached codexes are frozen and shared; the editor works on its own mutable copy."""
+        if self._codex_data is None:
+            self._codex_data = thaw(self.codex.data)
+            self.codex = Codex(self._codex_data)
+        return self._codex_data
+
     def transport_units(self) -> list:
         out = []
-        for u in self.codex_data.get("units", []):
+        for u in self.codex.units:
             if bool(u.get("is_transport", False)) or (u.get("slot") == "Dedicated Transport"):
                 out.append(u)
         return out
@@ -116,25 +137,35 @@ class MainWindow(QMainWindow):
             return
         self.load_codex(default)
 
-    def load_codex(self, path: Path):
+    def load_codex(self, path: Path, keep_roster: bool = False):
         try:
-            data = read_json(path)
-            data.setdefault("codex_name", path.stem)
-            data.setdefault("units", [])
-            data.setdefault("rules", {})
-            data.setdefault("weapons", {})
-            data.setdefault("wargear", {})
+            codex = CODEX_CACHE.load(path)
         except Exception as e:
             QMessageBox.critical(self, "Failed to open codex", f"{path}\n\n{e}")
             return
         self.codex_path = path
-        self.codex_data = data
-        self.codex_name_edit.setText(self.codex_data.get("codex_name", path.stem))
+        self.codex = codex
+        self._codex_data = None
+        self.codex_name_edit.setText(codex.name)
         self.refresh_unit_list()
         self.detail.setPlainText("")
         self.statusBar().showMessage(f"Opened: {path}")
         if hasattr(self, "roster_tab"):
-            self.roster_tab.on_codex_loaded()
+            self.roster_tab.on_codex_loaded(keep_roster)
+
+    def _on_codex_file_changed(self, path: str):
+        """Reloads the open codex when it changes on disk, asking first if the editor has unsaved edits."""
+        if self.codex_path is None or Path(path) != self.codex_path.resolve(): return
+        try: mtime = self.codex_path.stat().st_mtime_ns
+        except OSError: return
+        if mtime == self._saved_mtime: return   # our own save
+        if self._codex_data is not None and QMessageBox.question(
+                self, "Codex changed on disk",
+                f"{path} was changed outside the editor.\n\nReload it and discard your unsaved edits?") != QMessageBox.Yes:
+            self.statusBar().showMessage(f"Codex changed on disk: {path} (not reloaded)")
+            return
+        self.load_codex(self.codex_path, keep_roster=True)
+        self.statusBar().showMessage(f"Reloaded: {path} (changed on disk)")
 
     def open_codex(self):
         ensure_folder(Path("codexes"))
@@ -145,14 +176,20 @@ class MainWindow(QMainWindow):
     def open_rules_manager(self):
         if self.codex_path is None: return
         RulesManagerDialog(self, self.codex_data).exec()
+        self.reindex_codex()
 
     def open_weapons_manager(self):
         if self.codex_path is None: return
         WeaponsManagerDialog(self, self.codex_data).exec()
+        self.reindex_codex()
 
     def open_wargear_manager(self):
         if self.codex_path is None: return
         WargearManagerDialog(self, self.codex_data).exec()
+        self.reindex_codex()
+
+    def open_codex_index(self):
+        CodexIndexDialog(self, codex_index(self.codex_dir.folder)).exec()
 
     def save_codex(self):
         if self.codex_path is None: return
@@ -163,16 +200,21 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Save failed", str(e))
             return
+        CODEX_CACHE.invalidate(self.codex_path)
+        self._saved_mtime = self.codex_path.stat().st_mtime_ns
+        self.reindex_codex()
+        self._codex_data = None   # nothing unsaved; the next edit takes a fresh copy
         self.statusBar().showMessage(f"Saved: {self.codex_path}")
         if hasattr(self, "roster_tab"):
-            self.roster_tab.on_codex_loaded()
+            self.roster_tab.on_codex_loaded(keep_roster=True)
+
+    def reindex_codex(self):
+        """Rebuilds the Codex index after codex_data has been edited in place."""
+        self.codex = Codex(self.codex_data)
 
     def refresh_unit_list(self):
         self.unit_list.clear()
-        units = self.codex_data.get("units", [])
-        slot_order = {s: i for i, s in enumerate(SLOTS)}
-        units_sorted = sorted(units, key=lambda u: (slot_order.get(u.get("slot", ""), 999), u.get("name", "")))
-        for u in units_sorted:
+        for u in self.codex.units:
             name = u.get("name", "Unnamed")
             slot = u.get("slot", "Unknown")
             item = QListWidgetItem(f"[{slot}] {name}")
@@ -180,9 +222,7 @@ class MainWindow(QMainWindow):
             self.unit_list.addItem(item)
 
     def get_unit_by_id(self, unit_id: str) -> Optional[Dict[str, Any]]:
-        for u in self.codex_data.get("units", []):
-            if u.get("id") == unit_id: return u
-        return None
+        return self.codex.unit(unit_id)
 
     def add_unit(self):
         dlg = UnitEditorDialog(self, available_transports=self.transport_units())
@@ -190,6 +230,7 @@ class MainWindow(QMainWindow):
         unit = dlg.get_unit()
         unit["id"] = unique_id(f"{unit['slot']}_{slugify(unit['name'])}", {u.get("id") for u in self.codex_data["units"]})
         self.codex_data["units"].append(unit)
+        self.reindex_codex()
         self.refresh_unit_list()
         self.save_codex()
 
@@ -197,6 +238,7 @@ class MainWindow(QMainWindow):
         item = self.unit_list.currentItem()
         if not item: return
         unit_id = item.data(Qt.UserRole)
+        self.ensure_editable()
         unit = self.get_unit_by_id(unit_id)
         if not unit: return
         dlg = UnitEditorDialog(self, available_transports=self.transport_units())
@@ -208,6 +250,7 @@ class MainWindow(QMainWindow):
             if u["id"] == unit_id:
                 self.codex_data["units"][i] = updated
                 break
+        self.reindex_codex()
         self.refresh_unit_list()
         self.save_codex()
 
@@ -217,6 +260,7 @@ class MainWindow(QMainWindow):
         unit_id = item.data(Qt.UserRole)
         if QMessageBox.question(self, "Delete?", f"Delete unit?") == QMessageBox.Yes:
             self.codex_data["units"] = [u for u in self.codex_data["units"] if u["id"] != unit_id]
+            self.reindex_codex()
             self.refresh_unit_list()
             self.detail.setPlainText("")
             self.save_codex()
@@ -227,7 +271,7 @@ class MainWindow(QMainWindow):
             return
         unit = self.get_unit_by_id(current.data(Qt.UserRole))
         if unit:
-            self.detail.setPlainText(str(unit)) # Simplified for brevity
+            self.detail.setPlainText(str(thaw(unit))) # Simplified for brevity
 
 def main():
     app = QApplication(sys.argv)
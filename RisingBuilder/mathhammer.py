@@ -0,0 +1,243 @@
+"""
+Mathhammer: hits, wounds, unsaved wounds and kills for every shooting weapon
+of one codex against every profile of another, as full probability
+distributions, in one batched NumPy computation.
+
+The threshold rules are the same ones the printed reference tables use
+(reports.draw_game_reference_tables draws them from the functions here).
+Vehicles are resolved with armour penetration and the damage chart: a
+"wound" is a glancing or penetrating hit, a kill is a Wrecked or Explodes
+result. NumPy is optional; only cross_matrix() needs it.
+"""
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+    HAVE_NUMPY = True
+except ImportError:
+    np = None
+    HAVE_NUMPY = False
+
+NO_AP = 7        # AP "-": never denies a save
+NO_SAVE = 7      # Sv "-": nothing to roll
+
+# --- Reference table rules (thresholds on a D6; None = cannot succeed) ---
+def to_hit_shooting(bs: int) -> int:
+    return {1: 6, 2: 5, 3: 4, 4: 3}.get(bs, 2)
+
+def to_hit_assault(attacker_ws: int, defender_ws: int) -> int:
+    if defender_ws > 2 * attacker_ws: return 5
+    if attacker_ws > defender_ws: return 3
+    return 4
+
+def to_wound(s: int, t: int) -> Optional[int]:
+    diff = s - t
+    if diff >= 2: return 2
+    if diff >= -2: return 4 - diff
+    return None
+
+def chance(threshold: Optional[int]) -> float:
+    """Probability of rolling `threshold`+ on a D6."""
+    if threshold is None: return 0.0
+    return min(max((7 - threshold) / 6, 0.0), 1.0)
+
+def damage_chance(ap: int, glancing: bool) -> float:
+    """Probability of a Wrecked (5) or Explodes! (6+) result on the vehicle damage chart."""
+    mod = (1 if ap == 1 else -1 if ap == NO_AP else 0) - (2 if glancing else 0)
+    return chance(5 - mod)
+
+# --- Codex parsing ---
+@dataclass(frozen=True)
+class WeaponMode:
+    name: str        # codex weapon name
+    S: int
+    AP: int
+    shots: str       # "3", "D3", "D6" or "RF" (rapid fire)
+    twin_linked: bool
+    lance: bool
+    mode: str = ""   # "S4" for one strength of a "4/8" weapon
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} ({self.mode})" if self.mode else self.name
+
+@dataclass(frozen=True)
+class Target:
+    name: str
+    T: int = 0
+    W: int = 1
+    Sv: int = NO_SAVE
+    armour: Optional[Tuple[int, int, int]] = None   # (Front, Side, Rear) for vehicles
+
+def _int(value) -> Optional[int]:
+    try: return int(str(value).strip())
+    except ValueError: return None
+
+def _shots(kind: str) -> Optional[str]:
+    first = re.split(r"\s*/\s*", kind or "")[0].strip()
+    if first.startswith("Rapid Fire"): return "RF"
+    if first.startswith("Pistol"): return "1"
+    if re.match(r"(Ordnance|Large Blast|Blast)", first): return "1"
+    m = re.match(r"(Assault|Aslt|Heavy)\s+(\d+|D3|D6)$", first)
+    return m.group(2) if m else None
+
+def weapon_modes(codex) -> List[WeaponMode]:
+    """Shooting weapons with a fixed strength; "4/8"-style entries give one mode per value."""
+    out = []
+    for name, w in codex.weapons.items():
+        shots = _shots(w.get("type", ""))
+        if shots is None: continue
+        strengths = str(w.get("S", "")).split("/")
+        aps = str(w.get("AP", "")).split("/")
+        notes = w.get("notes", "")
+        for i, s_text in enumerate(strengths):
+            s = _int(s_text)
+            if s is None: continue
+            ap = _int(aps[min(i, len(aps) - 1)])
+            out.append(WeaponMode(name, s, ap if ap is not None else NO_AP, shots,
+                                  "twin-linked" in notes.lower(), "lance" in notes.lower(),
+                                  f"S{s}" if len(strengths) > 1 else ""))
+    return out
+
+def targets(codex) -> List[Target]:
+    """Every unit profile and sub-profile with usable stats."""
+    out = []
+    for u in codex.units:
+        profiles = [(u.get("name", u.get("id")), u.get("profile"))]
+        profiles += [(f"{u.get('name')} ({p.get('name', k)})", p) for k, p in u.get("sub_profiles", {}).items()]
+        for label, p in profiles:
+            if not p: continue
+            armour = tuple(_int(p.get(f)) for f in ("Front", "Side", "Rear"))
+            if all(a is not None for a in armour):
+                out.append(Target(label, armour=armour))
+                continue
+            t, w = _int(p.get("T")), _int(p.get("W"))
+            if t is None: continue
+            sv = _int(str(p.get("Sv", "")).rstrip("+"))
+            out.append(Target(label, t, w or 1, sv if sv is not None else NO_SAVE))
+    return out
+
+# --- Distributions ---
+def _shot_pmf(shots: str, models: int, rapid_fire_close: bool) -> List[float]:
+    if shots == "RF": one = [0.0] * (2 if rapid_fire_close else 1) + [1.0]
+    elif shots == "D3": one = [0.0] + [1 / 3] * 3
+    elif shots == "D6": one = [0.0] + [1 / 6] * 6
+    else: one = [0.0] * int(shots) + [1.0]
+    pmf = [1.0]
+    for _ in range(models):
+        nxt = [0.0] * (len(pmf) + len(one) - 1)
+        for i, a in enumerate(pmf):
+            for j, b in enumerate(one): nxt[i + j] += a * b
+        pmf = nxt
+    return pmf
+
+@dataclass
+class Matrix:
+    """Distributions indexed [weapon, target, count]."""
+    weapons: List[WeaponMode]
+    targets: List[Target]
+    hits: "np.ndarray"
+    wounds: "np.ndarray"     # glancing + penetrating hits against vehicles
+    unsaved: "np.ndarray"
+    kills: "np.ndarray"      # models removed; vehicles: 0 or 1
+
+    def mean(self, which: str = "unsaved") -> "np.ndarray":
+        pmf = getattr(self, which)
+        return pmf @ np.arange(pmf.shape[-1])
+
+    def p_kill(self) -> "np.ndarray":
+        return 1.0 - self.kills[..., 0]
+
+def _binomial_mix(shot_pmf, p):
+    """sum_n P(n shots) * Binomial(n, p), batched: shot_pmf (W, N), p (W, T) -> (W, T, N)."""
+    W, N = shot_pmf.shape
+    dist = np.zeros(p.shape + (N,))
+    dist[..., 0] = 1.0
+    out = dist * shot_pmf[:, None, 0:1]
+    q = 1.0 - p
+    for n in range(1, N):
+        dist[..., 1:n + 1] = dist[..., 1:n + 1] * q[..., None] + dist[..., 0:n] * p[..., None]
+        dist[..., 0] *= q
+        out += dist * shot_pmf[:, None, n:n + 1]
+    return out
+
+# Recent matrices keyed on (codex name, Codex.version) pairs rather than the Codex
+# objects, so a reloaded codex does not keep its predecessor alive
+MATRIX_CACHE_SIZE = 8
+_matrices: "OrderedDict[tuple, Matrix]" = OrderedDict()
+_matrices_lock = threading.Lock()
+
+def cross_matrix(attacker, defender, bs: int = 4, models: int = 1, facing: str = "Front",
+                 cover: Optional[int] = None, rapid_fire_close: bool = False) -> Matrix:
+    """Every shooting weapon of `attacker` against every profile of `defender`."""
+    if not HAVE_NUMPY: raise RuntimeError("The mathhammer engine needs numpy (pip install numpy).")
+    key = (attacker.name, attacker.version, defender.name, defender.version, bs, models, facing, cover, rapid_fire_close)
+    with _matrices_lock:
+        hit = _matrices.get(key)
+        if hit is not None:
+            _matrices.move_to_end(key)
+            return hit
+    m = _cross_matrix(attacker, defender, bs, models, facing, cover, rapid_fire_close)
+    with _matrices_lock:
+        _matrices[key] = m
+        while len(_matrices) > MATRIX_CACHE_SIZE: _matrices.popitem(last=False)
+    return m
+
+def _cross_matrix(attacker, defender, bs, models, facing, cover, rapid_fire_close) -> Matrix:
+    ws, ts = weapon_modes(attacker), targets(defender)
+    pmfs = [_shot_pmf(w.shots, models, rapid_fire_close) for w in ws]
+    shot_pmf = np.zeros((len(ws), max([2] + [len(p) for p in pmfs])))
+    for i, p in enumerate(pmfs): shot_pmf[i, :len(p)] = p
+
+    S = np.array([w.S for w in ws])[:, None]
+    AP = np.array([w.AP for w in ws])[:, None]
+    lance = np.array([w.lance for w in ws])[:, None]
+    p_hit = chance(to_hit_shooting(bs))
+    twin = np.array([w.twin_linked for w in ws])
+    hit = np.where(twin, 1 - (1 - p_hit) ** 2, p_hit)[:, None] * np.ones((1, len(ts)))
+
+    vehicle = np.array([t.armour is not None for t in ts])[None, :]
+    side = ("Front", "Side", "Rear").index(facing)
+    AV = np.array([t.armour[side] if t.armour else 0 for t in ts])[None, :]
+    AV = np.where(lance, np.minimum(AV, 12), AV)
+    T = np.array([t.T for t in ts])[None, :]
+    Wt = np.array([t.W for t in ts])[None, :]
+    Sv = np.array([t.Sv for t in ts])[None, :]
+
+    # To wound (infantry): the reference table, as a lookup on S - T
+    table = np.array([chance(to_wound(d, 0)) for d in range(-10, 11)])
+    p_wound = table[np.clip(S - T, -10, 10) + 10]
+    # Armour penetration: D6 + S beats AV (penetrating) or equals it (glancing)
+    p_pen = np.clip((6 - (AV - S)) / 6, 0, 1)
+    p_glance = np.where((AV - S >= 1) & (AV - S <= 6), 1 / 6, 0)
+    wound = np.where(vehicle, p_pen + p_glance, p_wound)
+
+    armour = np.where(AP > Sv, (7 - Sv) / 6, 0)
+    save = np.maximum(armour, chance(cover) if cover else 0)
+    unsaved = np.where(vehicle, 1 - (chance(cover) if cover else 0), 1 - save)
+
+    pen_roll = np.array([damage_chance(w.AP, False) for w in ws])[:, None]
+    glance_roll = np.array([damage_chance(w.AP, True) for w in ws])[:, None]
+    destroy = pen_roll * p_pen + glance_roll * p_glance
+
+    hits = _binomial_mix(shot_pmf, hit)
+    wounds = _binomial_mix(shot_pmf, hit * wound)
+    unsaved_pmf = _binomial_mix(shot_pmf, hit * wound * unsaved)
+
+    # Kills: infantry lose one model per W unsaved wounds (instant death at S >= 2T);
+    # a vehicle dies at its first destroying result
+    K = unsaved_pmf.shape[-1]
+    per_model = np.where(S >= 2 * T, 1, Wt)
+    idx = np.arange(K)[None, None, :] // per_model[..., None]
+    kills = np.zeros_like(unsaved_pmf)
+    wi, ti, _ = np.indices(unsaved_pmf.shape)
+    np.add.at(kills, (wi, ti, idx), unsaved_pmf)
+    p_dead = 1 - _binomial_mix(shot_pmf, hit * unsaved * destroy)[..., 0]
+    kills[..., 0] = np.where(vehicle, 1 - p_dead, kills[..., 0])
+    kills[..., 1] = np.where(vehicle, p_dead, kills[..., 1])
+    kills[..., 2:] = np.where(vehicle[..., None], 0, kills[..., 2:])
+    return Matrix(ws, ts, hits, wounds, unsaved_pmf, kills)
\ No newline at end of file
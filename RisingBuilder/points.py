@@ -0,0 +1,107 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
+
+from constants import FORCE_ORG_LIMITS_5E
+
+@dataclass(frozen=True)
+class CompiledUnit:
+    """Pre-resolved cost table for one unit: group_id -> choice_id -> (points, mode)."""
+    unit_id: str
+    slot: str
+    base_points: int = 0
+    points_per_model: int = 0
+    twin_link_discount: bool = False
+    groups: Dict[str, Dict[str, Tuple[int, str]]] = field(default_factory=dict)
+
+def compile_unit(unit: Dict[str, Any]) -> CompiledUnit:
+    groups: Dict[str, Dict[str, Tuple[int, str]]] = {}
+    for opt in unit.get("options", []):
+        gid = opt.get("group_id")
+        if gid is None: continue
+        table = groups.setdefault(gid, {})
+        for c in opt.get("choices", []):
+            cid = c.get("id")
+            if cid is None or cid in table: continue
+            table[cid] = (c.get("points", 0), c.get("points_mode", "flat"))
+    return CompiledUnit(
+        unit_id=unit.get("id", ""),
+        slot=unit.get("slot", ""),
+        base_points=unit.get("base_points", 0),
+        points_per_model=unit.get("points_per_model", 0),
+        twin_link_discount=bool(unit.get("enable_twin_link_discount")),
+        groups=groups,
+    )
+
+def compile_codex(codex_data: Dict[str, Any]) -> Dict[str, CompiledUnit]:
+    """Builds the per-unit cost tables once per codex load."""
+    return {u["id"]: compile_unit(u) for u in (codex_data or {}).get("units", []) if u.get("id")}
+
+def _pick_counts(picks) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for cid in (picks if isinstance(picks, list) else [picks]):
+        if isinstance(cid, str): counts[cid] = counts.get(cid, 0) + 1
+    return counts
+
+def entry_cost(entry: Dict[str, Any], cu: CompiledUnit):
+    size = entry.get("size", 1)
+    cost = cu.base_points + cu.points_per_model * size
+    flat_counts: Dict[str, List[int]] = {}
+
+    for gid, picks in entry.get("selected", {}).items():
+        table = cu.groups.get(gid)
+        if not table: continue
+        for cid, qty in _pick_counts(picks).items():
+            hit = table.get(cid)
+            if hit is None: continue
+            pts, mode = hit
+            if mode == "per_model":
+                cost += pts * size
+            else:
+                cost += pts * qty
+                tracked = flat_counts.setdefault(cid, [0, pts])
+                tracked[0] += qty
+
+    # Twin-linked pairs of the same flat-cost pick are charged at half price
+    if cu.twin_link_discount:
+        for count, pts in flat_counts.values():
+            pairs = count // 2
+            if pairs > 0: cost -= pairs * (pts * 0.5)
+    return cost
+
+def mandatory_picks(unit: Dict[str, Any], size: int, cu: CompiledUnit) -> Dict[str, List[str]]:
+    """Cheapest picks that satisfy every option group's min_select."""
+    selected: Dict[str, List[str]] = {}
+    for g in unit.get("options", []):
+        need = g.get("min_select", 0)
+        choices = list(g.get("choices", []))
+        if need <= 0 or not choices: continue
+        most = size if g.get("linked_to_size") else g.get("max_select", 1)
+        need = min(need, most)
+
+        def one(c):
+            pts, mode = cu.groups.get(g.get("group_id"), {}).get(c.get("id"), (0, "flat"))
+            return pts * size if mode == "per_model" else pts
+        choices.sort(key=one)
+        if g.get("linked_to_size") or len(choices) == 1:
+            selected[g["group_id"]] = [choices[0]["id"]] * need
+        else:
+            selected[g["group_id"]] = [c["id"] for c in choices[:need]]
+    return selected
+
+def evaluate_roster(roster: Iterable[Dict[str, Any]], compiled: Dict[str, CompiledUnit]):
+    """
+    Single pass over the roster: stores each entry's 'calculated_cost' and
+    returns (total_points, force_org_counts). Attached entries (with a
+    parent_id) add points but do not use a force-org slot.
+    """
+    total = 0
+    counts = {k: 0 for k in FORCE_ORG_LIMITS_5E}
+    for entry in roster:
+        cu = compiled.get(entry.get("unit_id"))
+        if cu is None: continue
+        cost = entry_cost(entry, cu)
+        entry["calculated_cost"] = cost
+        total += cost
+        if not entry.get("parent_id") and cu.slot in counts:
+            counts[cu.slot] += 1
+    return total, counts
@@ -1,7 +1,52 @@
 from fpdf import FPDF
-import re
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from mathhammer import to_hit_assault, to_hit_shooting, to_wound
+from resolved import resolve_roster
+
+@dataclass(frozen=True)
+class PageTemplate:
+    """One pre-rendered page: a compressed content stream placed as a Form XObject."""
+    stream: bytes
+    fonts: Dict[int, str]   # font index used in the stream -> fpdf font key
+    width: float            # page size in points
+    height: float
 
 class PDF(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._templates: List[PageTemplate] = []
+        self._template_objs: Dict[int, int] = {}
+
+    def stamp_template(self, tpl: PageTemplate):
+        """Draws a pre-rendered page template onto the current page."""
+        family, style, size = self.font_family, self.font_style, self.font_size_pt
+        for key in tpl.fonts.values():  # register any font the template needs
+            self.set_font(key.rstrip("BI"), key[len(key.rstrip("BI")):])
+        if family: self.set_font(family, style, size)
+        if tpl not in self._templates: self._templates.append(tpl)
+        self._out(f"q /TPL{self._templates.index(tpl) + 1} Do Q")
+
+    def _putimages(self):
+        super()._putimages()
+        for idx, tpl in enumerate(self._templates, 1):
+            fonts = " ".join(f"/F{i} {self.fonts[key]['n']} 0 R" for i, key in tpl.fonts.items())
+            self._newobj()
+            self._template_objs[idx] = self.n
+            self._out(f"<</Type /XObject /Subtype /Form /BBox [0 0 {tpl.width:.2f} {tpl.height:.2f}]"
+                      f" /Resources <</ProcSet [/PDF /Text] /Font <<{fonts}>> >>"
+                      f" /Filter /FlateDecode /Length {len(tpl.stream)}>>")
+            self._putstream(tpl.stream)
+            self._out("endobj")
+
+    def _putxobjectdict(self):
+        super()._putxobjectdict()
+        for idx, n in self._template_objs.items():
+            self._out(f"/TPL{idx} {n} 0 R")
+
     def header(self):
         # Header handled manually
         pass
@@ -63,27 +108,10 @@ def draw_profile_table(pdf, profiles_list):
             pdf.cell(stat_width, 5, val, 1, 0, 'C')
         pdf.ln()
 
-def draw_weapon_table(pdf, weapon_names, weapons_db):
-    """Draws inline weapon stats for the specific unit."""
-    if not weapon_names or not weapons_db: return
-
-    valid_weapons = []
-    seen = set()
-    
-    for name in sorted(list(set(weapon_names))):
-        stats = weapons_db.get(name)
-        # Partial match attempt
-        if not stats:
-            for db_key in weapons_db.keys():
-                if db_key in name:
-                    stats = weapons_db[db_key]
-                    break
-        
-        if stats and name not in seen:
-            valid_weapons.append((name, stats))
-            seen.add(name)
-
-    if not valid_weapons: return
+def draw_weapon_table(pdf, weapons):
+    """Draws inline weapon stats for the specific unit from resolved (name, stats) pairs."""
+    if not weapons: return
+    valid_weapons = sorted(weapons, key=lambda w: w[0])
 
     # Draw Table
     pdf.set_font("Arial", 'B', 7)
@@ -127,10 +155,9 @@ def draw_game_reference_tables(pdf):
     pdf.cell(10, row_h, "BS", 1, 0, 'C', True)
     pdf.cell(15, row_h, "To Hit", 1, 1, 'C', True)
     pdf.set_font("Arial", '', 7)
-    bs_vals = {1: "6+", 2: "5+", 3: "4+", 4: "3+"}
     for i in range(1, 11):
         pdf.set_x(bs_x)
-        val = bs_vals.get(i, "2+")
+        val = f"{to_hit_shooting(i)}+"
         pdf.cell(10, row_h, str(i), 1, 0, 'C')
         pdf.cell(15, row_h, val, 1, 1, 'C')
 
@@ -157,9 +184,7 @@ def draw_game_reference_tables(pdf):
         pdf.set_fill_color(240, 240, 240)
         pdf.cell(head_w, row_h, f"WS {a_ws}", 1, 0, 'C', True)
         for d_ws in range(1, 11):
-            val = "4+"
-            if d_ws > (2 * a_ws): val = "5+"
-            elif a_ws > d_ws: val = "3+"
+            val = f"{to_hit_assault(a_ws, d_ws)}+"
             pdf.cell(col_w, row_h, val, 1, 0, 'C')
         pdf.ln()
 
@@ -184,13 +209,8 @@ def draw_game_reference_tables(pdf):
         pdf.set_fill_color(240, 240, 240)
         pdf.cell(head_w, row_h, f"Str {s}", 1, 0, 'C', True)
         for t in range(1, 11):
-            diff = s - t
-            if diff >= 2: val = "2+"
-            elif diff == 1: val = "3+"
-            elif diff == 0: val = "4+"
-            elif diff == -1: val = "5+"
-            elif diff == -2: val = "6+"
-            else: val = "-"
+            need = to_wound(s, t)
+            val = f"{need}+" if need else "-"
             pdf.cell(col_w, row_h, val, 1, 0, 'C')
         pdf.ln()
 
@@ -248,53 +268,77 @@ def draw_game_reference_tables(pdf):
         pdf.set_x(x_start + 135)
         pdf.cell(55, 6, mod, 1, 1, 'L')
 
-def write_roster_pdf(roster, codex_data, points_limit, filename, get_unit_callback, include_ref_tables=False, roster_name="Army Roster"):
+# --- Cached reference pages ---
+# Reference tables per edition. Each set is drawn once per page format into a
+# scratch document; its pages become PageTemplates that every later export
+# stamps in as Form XObjects, so no table cell is laid out or compressed again.
+REFERENCE_TABLES = {
+    "5e": draw_game_reference_tables,
+}
+_ref_template_cache: Dict[Tuple[str, float, float], List[PageTemplate]] = {}
+_ref_template_lock = threading.Lock()
+
+def _can_stamp(pdf):
+    # Form XObjects hook into the classic PyFPDF resource writer
+    return isinstance(pdf, PDF) and isinstance(getattr(pdf, "pages", None), dict) and isinstance(pdf.pages.get(pdf.page), str)
+
+def _render_reference_templates(edition, width_pt, height_pt) -> List[PageTemplate]:
+    scratch = PDF(orientation='P', unit='mm', format=(width_pt * 25.4 / 72, height_pt * 25.4 / 72))
+    scratch.set_auto_page_break(auto=True, margin=15)
+    scratch.add_page()
+    first = scratch.page
+    REFERENCE_TABLES[edition](scratch)
+    fonts = {f['i']: key for key, f in scratch.fonts.items()}
+    return [PageTemplate(zlib.compress(scratch.pages[n].encode('latin-1')), fonts, width_pt, height_pt)
+            for n in range(first, scratch.page + 1)]
+
+def reference_templates(edition, width_pt, height_pt) -> List[PageTemplate]:
+    """Page templates for one edition's tables at one page size, rendered on first use."""
+    key = (edition, round(width_pt, 2), round(height_pt, 2))
+    with _ref_template_lock:
+        cached = _ref_template_cache.get(key)
+        if cached is None:
+            cached = _ref_template_cache[key] = _render_reference_templates(edition, width_pt, height_pt)
+    return cached
+
+def stamp_reference_tables(pdf, edition="5e"):
+    """Adds an edition's reference tables on fresh pages."""
+    pdf.add_page()
+    if not _can_stamp(pdf):
+        REFERENCE_TABLES[edition](pdf)
+        return
+    for n, tpl in enumerate(reference_templates(edition, pdf.w_pt, pdf.h_pt)):
+        if n: pdf.add_page()
+        pdf.stamp_template(tpl)
+
+def _pdf_bytes(pdf):
+    out = pdf.output(dest='S')
+    return out.encode('latin-1') if isinstance(out, str) else bytes(out)
+
+def write_roster_pdf(roster, codex, points_limit, target, include_ref_tables=False, roster_name="Army Roster", edition="5e"):
+    """Writes the roster PDF to target, a filename or a writable binary stream."""
+    data = render_roster_pdf(roster, codex, points_limit, include_ref_tables, roster_name, edition)
+    if hasattr(target, "write"):
+        target.write(data)
+        return
+    with open(target, "wb") as f: f.write(data)
+
+def _draw_entry_options(pdf, r):
+    options_text = []
+    if r.unit.get("wargear"): options_text.append("Base: " + ", ".join(r.unit["wargear"]))
+    for name, count in r.options:
+        options_text.append(f"{count}x {name}" if count > 1 else name)
+    if options_text: pdf.multi_cell(0, 5, "   " + ", ".join(options_text))
+
+def render_roster_pdf(roster, codex, points_limit, include_ref_tables=False, roster_name="Army Roster", edition="5e") -> bytes:
+    """Builds the roster PDF in memory and returns it; nothing is written to disk."""
     pdf = PDF(orientation='P', unit='mm', format='A4')
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
 
     # --- 1. DATA COLLECTION ---
-    total_pts = 0
-    slot_counts = {"HQ": 0, "Troops": 0, "Elites": 0, "Fast Attack": 0, "Heavy Support": 0}
-    active_weapons = set()
-    active_rules = set()
-    
-    # Recursive collector to handle combined names like "Weapon & Shield"
-    def collect_refs(name_list):
-        for name in name_list:
-            found = False
-            # 1. Try Exact Matches
-            if name in codex_data.get('weapons', {}): 
-                active_weapons.add(name)
-                found = True
-            elif name in codex_data.get('rules', {}): 
-                active_rules.add(name)
-                found = True
-            elif name in codex_data.get('wargear', {}): 
-                active_rules.add(name)
-                found = True
-            
-            # 2. If not found, try splitting combined strings
-            if not found:
-                parts = re.split(r' & | and |, ', name)
-                if len(parts) > 1:
-                    collect_refs(parts)
-
-    for entry in roster:
-        u = get_unit_callback(entry['unit_id'])
-        if not u: continue
-        total_pts += entry.get('calculated_cost', 0)
-        if not entry.get("parent_id") and u.get("slot") in slot_counts:
-            slot_counts[u["slot"]] += 1
-        collect_refs(u.get("wargear", []))
-        collect_refs(u.get("special_rules", []))
-        if "selected" in entry:
-            for gid, picks in entry["selected"].items():
-                opt_def = next((o for o in u.get("options", []) if o.get("group_id") == gid), None)
-                if not opt_def: continue
-                for choice in opt_def.get("choices", []):
-                    if isinstance(picks, list) and choice["id"] in picks: collect_refs([choice["name"]])
-                    elif picks == choice["id"]: collect_refs([choice["name"]])
+    res = resolve_roster(roster, codex)
+    total_pts, slot_counts = res.total, res.slot_counts
 
     # --- 2. HEADER ---
     pdf.set_font('Arial', 'B', 16)
@@ -304,7 +348,7 @@ def write_roster_pdf(roster, codex_data, points_limit, filename, get_unit_callba
     pdf.ln(5)
 
     pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 8, f"Codex: {codex_data.get('codex_name', 'Unknown Army')}", ln=True)
+    pdf.cell(0, 8, f"Codex: {codex.name}", ln=True)
     pdf.set_font("Arial", 'B', 10)
     pdf.cell(50, 8, f"Points: {total_pts} / {points_limit}", border=1, align='C')
     fo_text = f"HQ: {slot_counts['HQ']}/2   Troops: {slot_counts['Troops']}/6   Elites: {slot_counts['Elites']}/3   Fast: {slot_counts['Fast Attack']}/3   Heavy: {slot_counts['Heavy Support']}/3"
@@ -312,136 +356,56 @@ def write_roster_pdf(roster, codex_data, points_limit, filename, get_unit_callba
     pdf.ln(8)
 
     # --- 3. ROSTER LISTING ---
-    slots_order = ["HQ", "Troops", "Elites", "Fast Attack", "Heavy Support", "Dedicated Transport"]
-    for slot in slots_order:
-        slot_units = [e for e in roster if not e.get("parent_id") and get_unit_callback(e['unit_id'])['slot'] == slot]
-        if not slot_units: continue
-        
+    for slot, slot_units in res.by_slot.items():
         # SMART FLOW: Only add page if very low, otherwise just print header
         check_space(pdf, 20)
         pdf.chapter_title(slot)
-        
-        for entry in slot_units:
+
+        for r in slot_units:
             # CHECK SPACE BEFORE STARTING UNIT
             # A full unit entry takes ~50mm (Header, Profile, Options)
             check_space(pdf, 50)
-            
-            u = get_unit_callback(entry['unit_id'])
-            
+
             # --- Unit Name ---
             pdf.set_font("Arial", 'B', 11)
             pdf.set_fill_color(240, 240, 240)
-            name_str = f"{u['name']}"
-            if entry.get("custom_name"): name_str = f"{entry['custom_name']} ({u['name']})"
-            if entry.get("size", 1) > 1: name_str += f" (x{entry['size']})"
+            name_str = r.title
+            if r.size > 1: name_str += f" (x{r.size})"
             pdf.cell(150, 7, name_str, 1, 0, 'L', True)
-            pdf.cell(40, 7, f"{entry.get('calculated_cost', 0)} pts", 1, 1, 'C', True)
+            pdf.cell(40, 7, f"{r.cost} pts", 1, 1, 'C', True)
             pdf.ln(1)
 
-            # --- PROFILES ---
-            profiles_to_print = []
-            if "profile" in u: profiles_to_print.append( ("Unit Profile", u["profile"]) )
-            if "sub_profiles" in u and "selected" in entry:
-                all_picked_ids = []
-                for picks in entry["selected"].values():
-                    if isinstance(picks, list): all_picked_ids.extend(picks)
-                    else: all_picked_ids.append(picks)
-                for key, sub_prof in u["sub_profiles"].items():
-                    if key in all_picked_ids: profiles_to_print.append( (sub_prof.get("name", key), sub_prof) )
-            draw_profile_table(pdf, profiles_to_print)
-            
-            # --- INLINE WEAPONS (Parent) ---
-            unit_weapons = []
-            weapons_db = codex_data.get("weapons", {})
-            for item in u.get("wargear", []):
-                if item in weapons_db: unit_weapons.append(item)
-            if "selected" in entry:
-                for gid, picks in entry["selected"].items():
-                    opt_def = next((o for o in u.get("options", []) if o.get("group_id") == gid), None)
-                    if not opt_def: continue
-                    for choice in opt_def.get("choices", []):
-                        c_qty = picks.count(choice["id"]) if isinstance(picks, list) else (1 if picks == choice["id"] else 0)
-                        if c_qty > 0: unit_weapons.append(choice["name"])
-            
-            draw_weapon_table(pdf, unit_weapons, weapons_db)
+            draw_profile_table(pdf, r.profiles)
+            draw_weapon_table(pdf, r.weapons)
 
             # --- OPTIONS TEXT ---
             pdf.set_font("Arial", size=10)
-            options_text = []
-            if u.get("wargear"): options_text.append("Base: " + ", ".join(u["wargear"]))
-            if "selected" in entry:
-                for gid, picks in entry["selected"].items():
-                    opt_def = next((o for o in u.get("options", []) if o.get("group_id") == gid), None)
-                    if not opt_def: continue
-                    for choice in opt_def.get("choices", []):
-                        count = picks.count(choice["id"]) if isinstance(picks, list) else (1 if picks == choice["id"] else 0)
-                        if count > 0:
-                            item_str = choice['name']
-                            if count > 1: item_str = f"{count}x {item_str}"
-                            options_text.append(item_str)
-            if options_text: pdf.multi_cell(0, 5, "   " + ", ".join(options_text))
-            if u.get("special_rules"):
+            _draw_entry_options(pdf, r)
+            if r.unit.get("special_rules"):
                 pdf.set_font("Arial", 'I', 9)
-                pdf.multi_cell(0, 5, "   Rules: " + ", ".join(u["special_rules"]))
+                pdf.multi_cell(0, 5, "   Rules: " + ", ".join(r.unit["special_rules"]))
 
             # --- CHILDREN ---
-            children = [c for c in roster if c.get("parent_id") == entry["id"]]
-            for child in children:
-                uc = get_unit_callback(child['unit_id'])
+            for c in r.children:
                 pdf.ln(2)
                 pdf.set_font("Arial", 'B', 10)
                 pdf.cell(10, 5, "  >", 0, 0)
-                
-                c_name = uc['name']
-                if child.get("custom_name"): c_name = f"{child['custom_name']} ({uc['name']})"
-                
-                pdf.cell(0, 5, f"Attached: {c_name} ({child.get('calculated_cost', 0)} pts)", ln=True)
-                
-                c_profs = []
-                if "profile" in uc: c_profs.append( ("Profile", uc["profile"]) )
-                if "sub_profiles" in uc and "selected" in child:
-                    all_picked_c_ids = []
-                    for picks in child["selected"].values():
-                        if isinstance(picks, list): all_picked_c_ids.extend(picks)
-                        else: all_picked_c_ids.append(picks)
-                    for key, sub_prof in uc["sub_profiles"].items():
-                        if key in all_picked_c_ids: c_profs.append( (sub_prof.get("name", key), sub_prof) )
-                
-                draw_profile_table(pdf, c_profs)
-
-                # --- INLINE WEAPONS (Child) ---
-                c_weapons = []
-                for item in uc.get("wargear", []):
-                    if item in weapons_db: c_weapons.append(item)
-                if "selected" in child:
-                    for gid, picks in child["selected"].items():
-                        opt_def = next((o for o in uc.get("options", []) if o.get("group_id") == gid), None)
-                        if not opt_def: continue
-                        for choice in opt_def.get("choices", []):
-                            c_qty = picks.count(choice["id"]) if isinstance(picks, list) else (1 if picks == choice["id"] else 0)
-                            if c_qty > 0: c_weapons.append(choice["name"])
-                
-                draw_weapon_table(pdf, c_weapons, weapons_db)
-
-                c_opts = []
-                if "selected" in child:
-                    for gid, picks in child["selected"].items():
-                        opt_def = next((o for o in uc.get("options", []) if o.get("group_id") == gid), None)
-                        if not opt_def: continue
-                        for choice in opt_def.get("choices", []):
-                            count = picks.count(choice["id"]) if isinstance(picks, list) else (1 if picks == choice["id"] else 0)
-                            if count > 0: c_opts.append(f"{choice['name']}")
-                if c_opts:
+                pdf.cell(0, 5, f"Attached: {c.title} ({c.cost} pts)", ln=True)
+
+                draw_profile_table(pdf, [("Profile", p) if n == "Unit Profile" else (n, p) for n, p in c.profiles])
+                draw_weapon_table(pdf, c.weapons)
+
+                if c.options:
                     pdf.set_font("Arial", size=9)
                     pdf.cell(10, 5, "", 0, 0)
-                    pdf.multi_cell(0, 5, ", ".join(c_opts))
+                    pdf.multi_cell(0, 5, ", ".join(name for name, _ in c.options))
             pdf.ln(4)
 
     # --- 4. APPENDIX ---
     # SMART FLOW: Don't force page break unless needed
     check_space(pdf, 50)
     pdf.chapter_title("Reference: Weapons")
-    
+
     pdf.set_font("Arial", 'B', 9)
     pdf.set_fill_color(220, 220, 220)
     pdf.cell(60, 6, "Name", 1, 0, 'L', True)
@@ -450,37 +414,22 @@ def write_roster_pdf(roster, codex_data, points_limit, filename, get_unit_callba
     pdf.cell(15, 6, "AP", 1, 0, 'C', True)
     pdf.cell(40, 6, "Type", 1, 0, 'C', True)
     pdf.cell(40, 6, "Notes", 1, 1, 'L', True)
-    
+
     pdf.set_font("Arial", '', 9)
-    sorted_weps = sorted(list(active_weapons))
-    weapons_db = codex_data.get('weapons', {})
-    
-    for w_name in sorted_weps:
-        w_stats = weapons_db.get(w_name)
-        if not w_stats:
-            for key in weapons_db.keys():
-                if key in w_name: w_stats = weapons_db[key]; break
-        if w_stats:
-            pdf.cell(60, 6, w_name, 1, 0, 'L')
-            pdf.cell(20, 6, str(w_stats.get('range', '-')), 1, 0, 'C')
-            pdf.cell(15, 6, str(w_stats.get('S', '-')), 1, 0, 'C')
-            pdf.cell(15, 6, str(w_stats.get('AP', '-')), 1, 0, 'C')
-            pdf.cell(40, 6, str(w_stats.get('type', '-')), 1, 0, 'C')
-            notes = str(w_stats.get('notes', '-'))
-            pdf.cell(40, 6, notes[:25], 1, 1, 'L')
+    for w_name, w_stats in res.weapons.items():
+        pdf.cell(60, 6, w_name, 1, 0, 'L')
+        pdf.cell(20, 6, str(w_stats.get('range', '-')), 1, 0, 'C')
+        pdf.cell(15, 6, str(w_stats.get('S', '-')), 1, 0, 'C')
+        pdf.cell(15, 6, str(w_stats.get('AP', '-')), 1, 0, 'C')
+        pdf.cell(40, 6, str(w_stats.get('type', '-')), 1, 0, 'C')
+        notes = str(w_stats.get('notes', '-'))
+        pdf.cell(40, 6, notes[:25], 1, 1, 'L')
 
     pdf.ln(10)
     check_space(pdf, 50)
     pdf.chapter_title("Reference: Rules & Wargear")
-    
-    sorted_rules = sorted(list(active_rules))
-    rules_db = codex_data.get('rules', {})
-    gear_db = codex_data.get('wargear', {})
-    
-    for r_name in sorted_rules:
-        desc = ""
-        if r_name in rules_db: desc = rules_db[r_name].get('summary', '')
-        elif r_name in gear_db: desc = gear_db[r_name].get('summary', '')
+
+    for r_name, desc in res.rules.items():
         if desc:
             check_space(pdf, 15) # Ensure title + at least 1 line fits
             pdf.set_font("Arial", 'B', 10)
@@ -490,7 +439,6 @@ def write_roster_pdf(roster, codex_data, points_limit, filename, get_unit_callba
             pdf.ln(2)
 
     if include_ref_tables:
-        draw_game_reference_tables(pdf)
+        stamp_reference_tables(pdf, edition)
 
-    try: pdf.output(filename)
-    except Exception as e: print(f"Error writing PDF: {e}")
+    return _pdf_bytes(pdf)
\ No newline at end of file
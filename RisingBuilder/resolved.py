@@ -0,0 +1,137 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from constants import SLOTS
+from roster import Roster
+
+Ref = Tuple[str, str, Mapping[str, Any]]  # ("weapon" | "rule", canonical name, definition)
+
+@dataclass
+class ResolvedEntry:
+    """One roster entry with everything a renderer needs already looked up."""
+    entry: Dict[str, Any]
+    unit: Mapping[str, Any]
+    depth: int
+    title: str                                   # "Custom (Unit)" or "Unit"
+    options: List[Tuple[str, int]]               # (choice name, count), in pick order
+    profiles: List[Tuple[str, Mapping[str, Any]]]      # unit profile + sub-profiles of picked choices
+    all_profiles: List[Tuple[str, Mapping[str, Any]]]  # unit profile + every sub-profile
+    weapons: List[Tuple[str, Mapping[str, Any]]]       # base and picked weapons with stats
+    rules: List[Tuple[str, str]]                 # (rule or wargear name, summary)
+    children: List["ResolvedEntry"] = field(default_factory=list)
+
+    @property
+    def cost(self):
+        return self.entry.get("calculated_cost", 0)
+
+    @property
+    def size(self) -> int:
+        return self.entry.get("size", 1)
+
+@dataclass
+class ResolvedRoster:
+    total: Any
+    slot_counts: Dict[str, int]
+    roots: List[ResolvedEntry]                   # root entries in roster order
+    by_slot: Dict[str, List[ResolvedEntry]]      # root entries, slots in SLOTS order
+    weapons: Dict[str, Mapping[str, Any]]        # every referenced weapon, sorted by name
+    rules: Dict[str, str]                        # every referenced rule/wargear summary, sorted by name
+
+    def walk(self):
+        """(slot, ResolvedEntry) depth-first in print order."""
+        for slot, roots in self.by_slot.items():
+            stack = list(reversed(roots))
+            while stack:
+                r = stack.pop()
+                yield slot, r
+                stack.extend(reversed(r.children))
+
+def resolve_refs(codex, name: str) -> Tuple[Ref, ...]:
+    """(kind, name, definition) for each weapon/rule/wargear an item name refers to."""
+    return tuple(("weapon" if section == "weapons" else "rule", key, getattr(codex, section)[key])
+                 for section, key in codex.refs(name))
+
+def _substring_weapon(codex, name: str) -> Optional[Mapping[str, Any]]:
+    # Case-sensitive, like the old linear scan; the matcher only narrows the candidates
+    for section, key, data in codex.tooltip_matches(name):
+        if section == "weapons" and key in name: return data
+    return None
+
+def _picked(unit, entry) -> List[Tuple[Mapping[str, Any], int]]:
+    groups = {o.get("group_id"): o for o in unit.get("options", [])}
+    out = []
+    for gid, picks in entry.get("selected", {}).items():
+        opt_def = groups.get(gid)
+        if not opt_def: continue
+        for choice in opt_def.get("choices", []):
+            count = picks.count(choice["id"]) if isinstance(picks, list) else (1 if picks == choice["id"] else 0)
+            if count > 0: out.append((choice, count))
+    return out
+
+def _resolve_entry(roster, codex, entry, depth, weapons, rules) -> Optional[ResolvedEntry]:
+    u = codex.unit(entry.get("unit_id"))
+    if not u: return None
+    title = f"{entry['custom_name']} ({u['name']})" if entry.get("custom_name") else u["name"]
+    picked = _picked(u, entry)
+
+    main = [("Unit Profile", u["profile"])] if "profile" in u else []
+    picked_ids = {c["id"] for c, _ in picked}
+    subs = u.get("sub_profiles", {})
+    profiles = main + [(p.get("name", k), p) for k, p in subs.items() if k in picked_ids]
+    all_profiles = main + [(p.get("name", k.capitalize()), p) for k, p in subs.items()]
+
+    own_weapons: Dict[str, Mapping[str, Any]] = {}
+    own_rules: Dict[str, str] = {}
+
+    def note(refs):
+        for kind, key, data in refs:
+            if kind == "weapon": weapons[key] = data
+            else:
+                rules.setdefault(key, data.get("summary", ""))
+                own_rules.setdefault(key, data.get("summary", ""))
+
+    for item in u.get("wargear", []):
+        refs = resolve_refs(codex, item)
+        note(refs)
+        if item in codex.weapons: own_weapons.setdefault(item, codex.weapons[item])
+    for item in u.get("special_rules", []):
+        note(resolve_refs(codex, item))
+    for choice, _ in picked:
+        refs = resolve_refs(codex, choice["name"])
+        note(refs)
+        found = [(key, data) for kind, key, data in refs if kind == "weapon"]
+        if not found:
+            stats = _substring_weapon(codex, choice["name"])
+            if stats is not None: found = [(choice["name"], stats)]
+        for key, data in found: own_weapons.setdefault(key, data)
+
+    resolved = ResolvedEntry(
+        entry=entry, unit=u, depth=depth, title=title,
+        options=[(c["name"], n) for c, n in picked],
+        profiles=profiles, all_profiles=all_profiles,
+        weapons=list(own_weapons.items()), rules=list(own_rules.items()),
+    )
+    for child in roster.children(entry):
+        r = _resolve_entry(roster, codex, child, depth + 1, weapons, rules)
+        if r is not None: resolved.children.append(r)
+    return resolved
+
+def resolve_roster(roster, codex) -> ResolvedRoster:
+    """Looks up units, picks, profiles, weapons and rules for the whole roster in one pass."""
+    if not isinstance(roster, Roster): roster = Roster(roster)
+    roster.bind(codex)
+    roster.refresh()
+    weapons: Dict[str, Mapping[str, Any]] = {}
+    rules: Dict[str, str] = {}
+    roots: List[ResolvedEntry] = []
+    by_slot: Dict[str, List[ResolvedEntry]] = {s: [] for s in SLOTS}
+    for root in roster.roots():
+        r = _resolve_entry(roster, codex, root, 0, weapons, rules)
+        if r is None: continue
+        roots.append(r)
+        if r.unit.get("slot") in by_slot: by_slot[r.unit["slot"]].append(r)
+    return ResolvedRoster(
+        total=roster.total, slot_counts=dict(roster.slot_counts), roots=roots,
+        by_slot={s: v for s, v in by_slot.items() if v},
+        weapons=dict(sorted(weapons.items())), rules=dict(sorted(rules.items())),
+    )
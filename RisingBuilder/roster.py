@@ -0,0 +1,217 @@
+from itertools import count
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from constants import FORCE_ORG_LIMITS_5E
+from points import entry_cost
+
+# Process-wide, so a replaced Roster never repeats a revision its predecessor had
+_revisions = count(1)
+
+class Roster:
+    """
+    Roster entries plus incrementally maintained points and force-org totals.
+
+    Entries stay plain dicts so they can be saved as-is. After mutating one in
+    place (size, picks) call touch(entry_id); refresh() then recalculates only
+    the touched entries and pushes the cost delta up through their ancestors,
+    so total, slot_counts and breakdown are O(1) reads after a single edit.
+
+    It also indexes entries by id and by parent_id, so children, ancestors
+    and subtree removal never scan the whole roster. An entry's parent_id
+    must not be changed after it has been added.
+    """
+
+    def __init__(self, entries: Optional[List[Dict[str, Any]]] = None, codex=None):
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._children: Dict[Optional[str], List[Dict[str, Any]]] = {None: []}
+        self._codex = None
+        self.revision = next(_revisions)
+        self._reset_totals()
+        for e in entries or []: self.add(e)
+        if codex is not None: self.bind(codex)
+
+    def _reset_totals(self):
+        self.total = 0
+        self.slot_counts = {k: 0 for k in FORCE_ORG_LIMITS_5E}
+        self.breakdown: Dict[str, Any] = {}  # root slot -> points incl. attached units
+        self.unique_counts: Dict[str, int] = {}
+        self._costs: Dict[str, Any] = {}     # entry id -> own points counted into totals
+        self._subtree: Dict[str, Any] = {}   # entry id -> own + attached points
+        self._charged: Dict[str, str] = {}   # entry id -> breakdown slot its points went to
+        self._bad_size: Dict[str, None] = {} # entry ids outside the unit's min/max size
+        self._dirty = set(self._by_id)
+
+    # --- Container ---
+    @property
+    def entries(self) -> List[Dict[str, Any]]:
+        """Entries in insertion order, as saved to disk."""
+        return list(self._by_id.values())
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, entry_id) -> bool:
+        return entry_id in self._by_id
+
+    def get(self, entry_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(entry_id)
+
+    def roots(self) -> List[Dict[str, Any]]:
+        """Top-level entries, in insertion order."""
+        return list(self._children[None])
+
+    def children(self, entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return list(self._children.get(entry["id"], ()))
+
+    def walk(self, entry: Dict[str, Any], depth: int = 0) -> Iterator[Tuple[Dict[str, Any], int]]:
+        """Depth-first (entry, depth) pairs for an entry and everything attached to it."""
+        stack, seen = [(entry, depth)], set()
+        while stack:
+            e, d = stack.pop()
+            if e["id"] in seen: continue
+            seen.add(e["id"])
+            yield e, d
+            stack.extend((c, d + 1) for c in reversed(self._children.get(e["id"], ())))
+
+    def ancestors(self, entry: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        seen = {entry.get("id")}
+        parent = self._by_id.get(entry.get("parent_id"))
+        while parent is not None and parent["id"] not in seen:
+            seen.add(parent["id"])
+            yield parent
+            parent = self._by_id.get(parent.get("parent_id"))
+
+    def root_of(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        root = entry
+        for root in self.ancestors(entry): pass
+        return root
+
+    # --- Binding ---
+    def bind(self, codex):
+        """Attaches the codex used for costs; a different codex version recalculates everything."""
+        if self._codex is not None and codex is not None and self._codex.version == codex.version: return
+        self._codex = codex
+        self._reset_totals()
+        self.revision = next(_revisions)
+        for e in self: self._count(e, +1)
+
+    def _unit(self, entry):
+        return self._codex.unit(entry.get("unit_id")) if self._codex else None
+
+    def _count(self, entry, sign):
+        u = self._unit(entry)
+        if not u: return
+        if not entry.get("parent_id") and u.get("slot") in self.slot_counts:
+            self.slot_counts[u["slot"]] += sign
+        if u.get("unique", False):
+            name = u.get("name", "")
+            self.unique_counts[name] = self.unique_counts.get(name, 0) + sign
+
+    # --- Mutations ---
+    def add(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        entry.setdefault("id", str(uuid.uuid4()))
+        entry.setdefault("parent_id", None)
+        entry.setdefault("selected", {})
+        self._by_id[entry["id"]] = entry
+        self._children.setdefault(entry["parent_id"] or None, []).append(entry)
+        self._count(entry, +1)
+        self._dirty.add(entry["id"])
+        self.revision = next(_revisions)
+        return entry
+
+    def touch(self, entry_id: str):
+        """Marks one entry as edited; its ancestors pick up the cost delta on refresh()."""
+        if entry_id in self._by_id:
+            self._dirty.add(entry_id)
+            self.revision = next(_revisions)
+
+    def remove(self, entry_id: str) -> List[str]:
+        """Removes an entry and everything attached to it; returns the removed ids."""
+        top = self._by_id.get(entry_id)
+        if top is None: return []
+        removed = [e["id"] for e, _ in self.walk(top)]
+        for eid in removed:
+            self._uncharge(self._by_id[eid])
+        pid = top["parent_id"] or None
+        siblings = self._children[pid]
+        siblings.remove(top)
+        if not siblings and pid is not None: del self._children[pid]
+        for eid in removed:
+            self._count(self._by_id.pop(eid), -1)
+            self._children.pop(eid, None)
+            self._dirty.discard(eid)
+            self._subtree.pop(eid, None)
+            self._bad_size.pop(eid, None)
+        self.revision = next(_revisions)
+        return removed
+
+    def clear(self):
+        self._by_id = {}
+        self._children = {None: []}
+        self._reset_totals()
+        self.revision = next(_revisions)
+
+    # --- Recalculation ---
+    def _apply(self, entry, delta, slot):
+        if not delta: return
+        self.total += delta
+        pts = self.breakdown.get(slot, 0) + delta
+        if pts: self.breakdown[slot] = pts
+        else: self.breakdown.pop(slot, None)
+        self._subtree[entry["id"]] = self._subtree.get(entry["id"], 0) + delta
+        for a in self.ancestors(entry):
+            self._subtree[a["id"]] = self._subtree.get(a["id"], 0) + delta
+
+    def _uncharge(self, entry):
+        eid = entry["id"]
+        old = self._costs.pop(eid, 0)
+        slot = self._charged.pop(eid, None)
+        if slot is not None: self._apply(entry, -old, slot)
+
+    def _charge_slot(self, entry, own_slot):
+        root_u = self._unit(self.root_of(entry))
+        return root_u.get("slot") if root_u else own_slot
+
+    def refresh(self) -> int:
+        """Recalculates touched entries only; returns how many were recalculated."""
+        if not self._dirty: return 0
+        n = 0
+        for eid in list(self._dirty):
+            entry = self._by_id.get(eid)
+            if entry is None: continue
+            cu = self._codex.compiled(entry.get("unit_id")) if self._codex else None
+            self._uncharge(entry)
+            if cu is None:
+                entry["calculated_cost"] = 0
+                continue
+            cost = entry_cost(entry, cu)
+            entry["calculated_cost"] = cost
+            slot = self._charge_slot(entry, cu.slot)
+            self._costs[eid] = cost
+            self._charged[eid] = slot
+            self._apply(entry, cost, slot)
+            u = self._codex.unit(entry.get("unit_id"))
+            if u.get("min_size", 1) <= entry.get("size", 1) <= u.get("max_size", 1):
+                self._bad_size.pop(eid, None)
+            else:
+                self._bad_size[eid] = None
+            n += 1
+        self._dirty.clear()
+        return n
+
+    def cost(self, entry_id: str):
+        return self._costs.get(entry_id, 0)
+
+    def subtree_cost(self, entry_id: str):
+        """Points for an entry plus everything attached to it."""
+        return self._subtree.get(entry_id, 0)
+
+    def size_violations(self) -> Iterator[tuple]:
+        """Yields (entry, unit) for entries outside the unit's min/max size (as of the last refresh)."""
+        for eid in self._bad_size:
+            e = self._by_id[eid]
+            yield e, self._unit(e)
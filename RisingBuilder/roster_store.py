@@ -0,0 +1,181 @@
+"""
+Shared roster library in one SQLite file (rosters/library.db, WAL mode).
+
+Each roster is a row with indexed codex, name, points total and updated
+time. Its entries are stored normalised, one row per entry with the unit id
+and unit name indexed, so "every list containing Karandras" is an index
+lookup rather than a scan of saved JSON. The entry dict itself is kept as
+JSON so nothing the builders store on an entry is lost.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils import ensure_folder
+
+DEFAULT_LIBRARY = Path("rosters") / "library.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rosters (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    codex_file TEXT,
+    codex_name TEXT,
+    points_limit INTEGER,
+    total INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rosters_codex ON rosters (codex_file, updated);
+CREATE INDEX IF NOT EXISTS rosters_name ON rosters (name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS rosters_total ON rosters (total);
+CREATE INDEX IF NOT EXISTS rosters_updated ON rosters (updated);
+CREATE TABLE IF NOT EXISTS entries (
+    roster_id TEXT NOT NULL REFERENCES rosters (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    entry_id TEXT NOT NULL,
+    parent_id TEXT,
+    unit_id TEXT,
+    unit_name TEXT,
+    size INTEGER,
+    cost INTEGER,
+    data TEXT NOT NULL,
+    PRIMARY KEY (roster_id, position)
+);
+CREATE INDEX IF NOT EXISTS entries_unit_name ON entries (unit_name COLLATE NOCASE, roster_id);
+CREATE INDEX IF NOT EXISTS entries_unit_id ON entries (unit_id, roster_id);
+"""
+
+@dataclass
+class RosterSummary:
+    id: str
+    name: str
+    codex_file: Optional[str]
+    codex_name: Optional[str]
+    points_limit: Optional[int]
+    total: int
+    units: int
+    updated: float
+
+    @property
+    def label(self) -> str:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.updated))
+        return f"{self.name} ({self.codex_name or self.codex_file or '?'}, {self.total} pts, {when})"
+
+class RosterStore:
+    """Thread-safe: every thread gets its own connection to the same WAL database."""
+    def __init__(self, path: Path = DEFAULT_LIBRARY):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._conn()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            ensure_folder(self.path.parent)
+            conn = sqlite3.connect(str(self.path), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- Writing ---
+    def save(self, roster, codex, name: str, points_limit: Optional[int] = None, codex_file: Optional[str] = None,
+             roster_id: Optional[str] = None) -> str:
+        """Inserts or replaces a roster (a Roster bound to `codex`); returns its library id."""
+        roster.bind(codex)
+        roster.refresh()
+        roster_id = roster_id or str(uuid.uuid4())
+        now = time.time()
+        rows = []
+        for pos, e in enumerate(roster.entries):
+            u = codex.unit(e.get("unit_id")) if codex else None
+            rows.append((roster_id, pos, e["id"], e.get("parent_id"), e.get("unit_id"), u.get("name") if u else None,
+                         e.get("size", 1), roster.cost(e["id"]), json.dumps(e, ensure_ascii=False)))
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO rosters (id, name, codex_file, codex_name, points_limit, total, units, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET name = excluded.name, codex_file = excluded.codex_file, "
+                "codex_name = excluded.codex_name, points_limit = excluded.points_limit, total = excluded.total, "
+                "units = excluded.units, updated = excluded.updated",
+                (roster_id, name, codex_file, codex.name if codex else None, points_limit, roster.total,
+                 len(roster.roots()), now, now))
+            conn.execute("DELETE FROM entries WHERE roster_id = ?", (roster_id,))
+            conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return roster_id
+
+    def delete(self, roster_id: str) -> bool:
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM rosters WHERE id = ?", (roster_id,)).rowcount > 0
+
+    # --- Reading ---
+    def load(self, roster_id: str) -> Optional[Dict[str, Any]]:
+        """The saved roster in the same shape as a Streamlit roster file (plus its id and total)."""
+        conn = self._conn()
+        row = conn.execute("SELECT name, codex_file, points_limit, total FROM rosters WHERE id = ?",
+                           (roster_id,)).fetchone()
+        if row is None: return None
+        entries = [json.loads(d) for (d,) in conn.execute(
+            "SELECT data FROM entries WHERE roster_id = ? ORDER BY position", (roster_id,))]
+        return {"id": roster_id, "roster_name": row[0], "codex_file": row[1], "points_limit": row[2],
+                "total": row[3], "roster": entries}
+
+    def list(self, codex_file: Optional[str] = None, search: str = "", unit: str = "",
+             min_points: Optional[int] = None, max_points: Optional[int] = None, limit: int = 200) -> List[RosterSummary]:
+        """Most recently updated first. `search` matches the roster name; `unit` a unit name or id it contains."""
+        where, args = [], []
+        if codex_file:
+            where.append("r.codex_file = ?"); args.append(codex_file)
+        if search:
+            where.append("r.name LIKE ? COLLATE NOCASE"); args.append(f"%{search}%")
+        if min_points is not None:
+            where.append("r.total >= ?"); args.append(min_points)
+        if max_points is not None:
+            where.append("r.total <= ?"); args.append(max_points)
+        if unit:
+            where.append("r.id IN (SELECT roster_id FROM entries WHERE unit_name = ? COLLATE NOCASE "
+                         "UNION SELECT roster_id FROM entries WHERE unit_id = ?)")
+            args += [unit, unit]
+        sql = ("SELECT r.id, r.name, r.codex_file, r.codex_name, r.points_limit, r.total, r.units, r.updated "
+               "FROM rosters r" + (" WHERE " + " AND ".join(where) if where else "") +
+               " ORDER BY r.updated DESC LIMIT ?")
+        return [RosterSummary(*row) for row in self._conn().execute(sql, args + [limit])]
+
+    def containing(self, unit: str, limit: int = 200) -> List[RosterSummary]:
+        """Rosters with at least one entry of the unit (name, case-insensitive, or id)."""
+        return self.list(unit=unit, limit=limit)
+
+    def unit_names(self, codex_file: Optional[str] = None) -> List[str]:
+        """Distinct unit names across the library, for search pickers."""
+        sql = "SELECT DISTINCT e.unit_name FROM entries e"
+        args: List[Any] = []
+        if codex_file:
+            sql += " JOIN rosters r ON r.id = e.roster_id WHERE r.codex_file = ?"; args.append(codex_file)
+        return sorted(n for (n,) in self._conn().execute(sql, args) if n)
+
+_stores: Dict[Path, RosterStore] = {}
+_stores_lock = threading.Lock()
+
+def library(path: Path = DEFAULT_LIBRARY) -> RosterStore:
+    """Process-wide store per database file."""
+    key = Path(path).resolve()
+    with _stores_lock:
+        if key not in _stores: _stores[key] = RosterStore(path)
+        return _stores[key]
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""
+Fuzzy search over a codex: unit names, the weapons, wargear and special
+rules they carry, and the names of their option choices.
+
+Every distinct name is indexed by its trigrams once per Codex, so a query
+only scores the names that share a trigram with it instead of scanning
+every unit. Substring matches rank first; otherwise the share of the
+query's trigrams found in a name gives typo tolerance ("meltgun" still
+finds Meltagun). Results are per unit, with the names that matched.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple
+
+# How strongly a match in each field counts towards a unit's rank
+FIELD_WEIGHTS = {"name": 1.0, "weapon": 0.9, "option": 0.85, "wargear": 0.85, "rule": 0.8}
+SECTION_FIELDS = {"weapons": "weapon", "wargear": "wargear", "rules": "rule"}
+MIN_SIMILARITY = 0.6
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class FuzzyMatcher:
+    """Trigram index over a fixed list of strings; query() returns (score, position) best first."""
+
+    def __init__(self, items: Iterable[str], cache_size: int = 1024):
+        self.items: List[str] = list(items)
+        self._folded = [s.casefold() for s in self.items]
+        self._grams: Dict[str, List[int]] = defaultdict(list)
+        for i, s in enumerate(self._folded):
+            for g in trigrams(s): self._grams[g].append(i)
+        self.query = lru_cache(maxsize=cache_size)(self._query)
+
+    def score(self, i: int, q: str, q_grams: Set[str], shared: int) -> float:
+        text = self._folded[i]
+        if text == q: return 2.0
+        if text.startswith(q): return 1.6
+        if q in text: return 1.3
+        return shared / len(q_grams)
+
+    def _query(self, q: str, min_similarity: float = MIN_SIMILARITY) -> Tuple[Tuple[float, int], ...]:
+        q = q.strip().casefold()
+        if not q: return ()
+        if len(q) < 3:   # too short for trigrams to say anything: plain substring
+            hits = [(self.score(i, q, {q}, 0), i) for i, s in enumerate(self._folded) if q in s]
+        else:
+            q_grams = trigrams(q)
+            shared: Dict[int, int] = defaultdict(int)
+            for g in q_grams:
+                for i in self._grams.get(g, ()): shared[i] += 1
+            hits = [(self.score(i, q, q_grams, n), i) for i, n in shared.items()]
+            hits = [h for h in hits if h[0] >= min_similarity]
+        hits.sort(key=lambda h: (-h[0], self._folded[h[1]]))
+        return tuple(hits)
+
+@dataclass(frozen=True)
+class SearchHit:
+    unit_id: str
+    score: float
+    matches: Tuple[Tuple[str, str], ...]   # (field, matched name), best first
+
+    @property
+    def reason(self) -> str:
+        """What matched, for display (each name once): empty for a unit-name match."""
+        seen = {name.casefold() for field, name in self.matches if field == "name"}
+        parts = []
+        for field, name in self.matches:
+            if name.casefold() in seen: continue
+            seen.add(name.casefold())
+            parts.append(f"{field}: {name}")
+        return ", ".join(parts)
+
+class SearchIndex:
+    """Built once per Codex (see Codex.search); results are memoised per query."""
+
+    def __init__(self, codex, cache_size: int = 512):
+        postings: Dict[str, Dict[Tuple[str, str], None]] = defaultdict(dict)   # name -> {(unit_id, field)}
+        for u in codex.units:
+            uid = u["id"]
+            def add(name: str, field: str):
+                if name: postings[name][(uid, field)] = None
+            add(u.get("name", ""), "name")
+            for name in u.get("wargear", ()):
+                add(name, "wargear")
+                for section, ref in codex.refs(name): add(ref, SECTION_FIELDS[section])
+            for name in u.get("special_rules", ()):
+                add(name, "rule")
+                for section, ref in codex.refs(name): add(ref, SECTION_FIELDS[section])
+            for g in u.get("options", ()):
+                for c in g.get("choices", ()):
+                    add(c.get("name", ""), "option")
+                    for section, ref in codex.refs(c.get("name", "")): add(ref, SECTION_FIELDS[section])
+        self._names = list(postings)
+        self._postings: List[Tuple[Tuple[str, str], ...]] = [tuple(postings[n]) for n in self._names]
+        self._matcher = FuzzyMatcher(self._names, cache_size=cache_size)
+        self.query = lru_cache(maxsize=cache_size)(self._query)
+
+    def _query(self, q: str, limit: int = 50) -> Tuple[SearchHit, ...]:
+        best: Dict[str, float] = {}
+        matches: Dict[str, Dict[Tuple[str, str], float]] = defaultdict(dict)
+        for score, i in self._matcher.query(q):
+            for uid, field in self._postings[i]:
+                s = score * FIELD_WEIGHTS[field]
+                key = (field, self._names[i])
+                if s > matches[uid].get(key, 0.0): matches[uid][key] = s
+                if s > best.get(uid, 0.0): best[uid] = s
+        ranked = sorted(best, key=lambda uid: -best[uid])[:limit]
+        return tuple(SearchHit(uid, best[uid], tuple(sorted(matches[uid], key=lambda k: -matches[uid][k])))
+                     for uid in ranked)
\ No newline at end of file
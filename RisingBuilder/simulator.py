@@ -0,0 +1,298 @@
+"""
+Monte Carlo battle simulator: one roster entry shoots another, charges it
+and fights a round of close combat, repeated for millions of trials.
+
+    python simulator.py --bench --trials 2000000 --workers 4
+
+Dice are drawn as vectorised NumPy binomials across a whole batch of
+trials. Batches are sharded over a process pool, and each shard gets its
+own generator spawned from one SeedSequence. The same seed therefore
+gives the same histograms for any worker count.
+
+Covered rules: to-hit/to-wound from the reference tables, twin-linked and
+"re-roll hits" effects, Rending, Poisoned, power weapons, cover,
+invulnerable saves, Feel No Pain, Instant Death and Eternal Warrior,
+Furious Charge and the charge bonus attack. They are read from the same
+profiles, weapons and rule summaries that play mode shows. Wounds are
+pooled per unit, and vehicles are not simulated.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, Optional
+
+from codex import CODEX_CACHE
+from mathhammer import HAVE_NUMPY, NO_AP, NO_SAVE, _int, _shots, chance, to_hit_assault, to_hit_shooting, to_wound
+from resolved import resolve_roster
+
+if HAVE_NUMPY:
+    import numpy as np
+
+SHARD_TRIALS = 100_000   # trials per shard; fixed so results do not depend on the worker count
+OUTCOMES = ("wiped", "won", "drawn", "lost", "no_combat")
+
+@dataclass(frozen=True)
+class Attack:
+    name: str
+    count: int               # models using it
+    S: int
+    AP: int = NO_AP
+    shots: str = "1"         # shooting only: "2", "D3", "D6" or "RF"
+    reroll_hits: bool = False
+    rending: bool = False
+    poisoned: bool = False
+    ignores_armour: bool = False   # power weapons
+    extra_attacks: int = 0
+
+@dataclass(frozen=True)
+class Side:
+    name: str
+    models: int
+    WS: int = 4
+    BS: int = 4
+    S: int = 4
+    T: int = 4
+    W: int = 1
+    I: int = 4
+    A: int = 1
+    Sv: int = NO_SAVE
+    invulnerable: int = NO_SAVE
+    feel_no_pain: bool = False
+    eternal_warrior: bool = False
+    furious_charge: bool = False
+    shooting: tuple = ()
+    melee: tuple = ()
+
+@dataclass
+class SimResult:
+    trials: int
+    seed: int
+    workers: int
+    elapsed: float
+    defender_losses: "np.ndarray"    # histogram: models removed from the defender
+    attacker_losses: "np.ndarray"    # histogram: models removed from the attacker
+    outcomes: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def trials_per_sec(self) -> float:
+        return self.trials / self.elapsed if self.elapsed else 0.0
+
+    def share(self, outcome: str) -> float:
+        return self.outcomes.get(outcome, 0) / self.trials if self.trials else 0.0
+
+# --- Reading a resolved entry ---
+_INV = re.compile(r"(\d)\+\s*(?:invulnerable|inv\b)", re.I)
+_REROLL_HITS = re.compile(r"twin-linked|re-?roll(?: failed)? (?:to )?hits?", re.I)
+
+def _strength(text, base: int) -> Optional[int]:
+    text = str(text).strip()
+    if text in ("User", "-", ""): return base
+    if text.startswith("+"): return base + (_int(text[1:]) or 0)
+    if text.lower().startswith("x"): return min(10, base * (_int(text[1:]) or 1))
+    return _int(text.split("/")[0])
+
+def _carriers(r, name, codex) -> int:
+    """Models using a weapon: everyone for unit wargear, otherwise the number of picks that give it."""
+    if name in r.unit.get("wargear", []): return r.size
+    n = sum(count for opt, count in r.options if opt == name or ("weapons", name) in codex.refs(opt))
+    return min(r.size, n) if n else r.size
+
+def side_from(r, codex) -> Side:
+    """A simulator Side from a resolved.ResolvedEntry (its main profile, weapons and rules)."""
+    p = dict(r.profiles[0][1]) if r.profiles else {}
+    if _int(p.get("Front")) is not None: raise ValueError(f"{r.title}: vehicles are not simulated")
+    stat = lambda k, d: _int(p.get(k)) if _int(p.get(k)) is not None else d
+    s = stat("S", 3)
+    text = " ".join(f"{name} {summary}" for name, summary in r.rules) + " " + " ".join(o for o, _ in r.options)
+    inv = [int(m) for m in _INV.findall(text)]
+    sv = _int(str(p.get("Sv", "")).rstrip("+"))
+
+    shooting, base, melee = [], [], []
+    for name, w in r.weapons:
+        notes = str(w.get("notes", ""))
+        kind = str(w.get("type", ""))
+        common = dict(reroll_hits=bool(_REROLL_HITS.search(notes)), rending="rending" in notes.lower(),
+                      poisoned="poisoned" in notes.lower())
+        if kind.startswith("Melee"):
+            ws = _strength(w.get("S", "User"), s)
+            if ws is None: continue
+            melee.append(Attack(name, _carriers(r, name, codex), ws, _int(w.get("AP")) or NO_AP,
+                                ignores_armour="power weapon" in f"{name} {notes}".lower(),
+                                extra_attacks=1 if "+1A" in notes.replace(" ", "") else 0, **common))
+            continue
+        shots = _shots(kind)
+        ws = _int(str(w.get("S", "")).split("/")[0])
+        if shots is None or ws is None: continue
+        ap = _int(str(w.get("AP", "")).split("/")[0])
+        attack = Attack(name, _carriers(r, name, codex), ws, ap if ap is not None else NO_AP, shots, **common)
+        (base if name in r.unit.get("wargear", []) else shooting).append((kind.startswith("Pistol"), attack))
+    # Each model fires one weapon: picked weapons first, the rest use the unit's main (non-pistol) gun
+    shooting = [a for _, a in shooting]
+    rest = r.size - sum(a.count for a in shooting)
+    if base and rest > 0: shooting.append(replace(min(base, key=lambda b: b[0])[1], count=rest))
+    return Side(r.title, r.size, stat("WS", 4), stat("BS", 4), s, stat("T", 4), stat("W", 1), stat("I", 4),
+                stat("A", 1), sv if sv is not None else NO_SAVE, min(inv, default=NO_SAVE),
+                "feel no pain" in text.lower(), "eternal warrior" in text.lower(),
+                "furious charge" in text.lower(), tuple(shooting), tuple(melee))
+
+# --- Dice ---
+def _resolve(rng, dice, attack: Attack, target: Side, p_hit: float, cover: Optional[int]):
+    """Unsaved wounds and whether each counts as Instant Death, from `dice` attacks per trial."""
+    if attack.reroll_hits: p_hit = 1 - (1 - p_hit) ** 2
+    hits = rng.binomial(dice, p_hit)
+    p_wound = chance(to_wound(attack.S, target.T))
+    if attack.poisoned: p_wound = max(p_wound, chance(4))
+    if attack.rending:
+        sixes = rng.binomial(hits, 1 / 6)
+        wounds = rng.binomial(hits - sixes, max(p_wound - 1 / 6, 0) * 6 / 5)
+    else:
+        sixes = np.zeros_like(hits)
+        wounds = rng.binomial(hits, p_wound)
+    instant = attack.S >= 2 * target.T and not target.eternal_warrior
+
+    def unsaved(n, ap, power):
+        armour = NO_SAVE if power or ap <= target.Sv else target.Sv
+        best = min(armour, target.invulnerable, cover or NO_SAVE)
+        left = rng.binomial(n, 1 - chance(best)) if best < NO_SAVE else n
+        if target.feel_no_pain and not (power or ap <= 2 or instant):
+            left = left - rng.binomial(left, 0.5)
+        return left
+
+    # Rending wounds are AP2
+    return unsaved(wounds, attack.AP, attack.ignores_armour) + unsaved(sixes, 2, attack.ignores_armour), instant
+
+def _apply(pool, wounds, instant, target: Side):
+    return np.maximum(pool - wounds * (target.W if instant else 1), 0)
+
+def _alive(pool, side: Side):
+    return -(-pool // side.W)
+
+def _shots_fired(rng, n, attack: Attack, rapid_fire_close: bool):
+    if attack.shots == "D3": return rng.integers(1, 4, (n, attack.count)).sum(axis=1)
+    if attack.shots == "D6": return rng.integers(1, 7, (n, attack.count)).sum(axis=1)
+    per = (2 if rapid_fire_close else 1) if attack.shots == "RF" else int(attack.shots)
+    return np.full(n, per * attack.count)
+
+def _strike(rng, striker: Side, alive, target: Side, charging: bool):
+    """Close combat attacks from `alive` striker models; returns unsaved wounds per trial by kind."""
+    p_hit = chance(to_hit_assault(striker.WS, target.WS))
+    bonus = 1 if charging else 0
+    s_bonus = 1 if charging and striker.furious_charge else 0
+    results = []
+    left = alive.copy()
+    for a in striker.melee:
+        users = np.minimum(left, a.count)
+        left = left - users
+        dice = users * (striker.A + bonus + a.extra_attacks)
+        results.append(_resolve(rng, dice, replace(a, S=a.S + s_bonus), target, p_hit, None))
+    basic = Attack("Close combat", 0, striker.S + s_bonus)
+    results.append(_resolve(rng, left * (striker.A + bonus), basic, target, p_hit, None))
+    return results
+
+def _run_shard(attacker: Side, defender: Side, trials: int, seed, cover, rapid_fire_close, shoot, assault):
+    rng = np.random.default_rng(seed)
+    d_pool = np.full(trials, defender.models * defender.W)
+    a_pool = np.full(trials, attacker.models * attacker.W)
+    p_hit = chance(to_hit_shooting(attacker.BS))
+    if shoot:
+        for a in attacker.shooting:
+            wounds, instant = _resolve(rng, _shots_fired(rng, trials, a, rapid_fire_close), a, defender, p_hit, cover)
+            d_pool = _apply(d_pool, wounds, instant, defender)
+
+    fought = d_pool > 0 if assault else np.zeros(trials, bool)
+    caused = np.zeros(trials, np.int64)
+    suffered = np.zeros(trials, np.int64)
+    if assault:
+        a_init = attacker.I + (1 if attacker.furious_charge else 0)
+        steps = sorted({a_init, defender.I}, reverse=True)
+        for step in steps:
+            a_alive, d_alive = _alive(a_pool, attacker), _alive(d_pool, defender)
+            a_alive, d_alive = np.where(fought, a_alive, 0), np.where(fought, d_alive, 0)
+            if step == a_init:
+                before = d_pool
+                for wounds, instant in _strike(rng, attacker, a_alive, defender, True):
+                    d_pool = _apply(d_pool, wounds, instant, defender)
+                caused += before - d_pool
+            if step == defender.I:
+                before = a_pool
+                for wounds, instant in _strike(rng, defender, d_alive, attacker, False):
+                    a_pool = _apply(a_pool, wounds, instant, attacker)
+                suffered += before - a_pool
+
+    d_lost = defender.models - _alive(d_pool, defender)
+    a_lost = attacker.models - _alive(a_pool, attacker)
+    outcome = np.select([d_pool == 0, ~fought, caused > suffered, caused == suffered],
+                        [0, 4, 1, 2], default=3)
+    return (np.bincount(d_lost, minlength=defender.models + 1), np.bincount(a_lost, minlength=attacker.models + 1),
+            np.bincount(outcome, minlength=len(OUTCOMES)))
+
+def simulate(attacker: Side, defender: Side, trials: int = 1_000_000, seed: int = 0, workers: Optional[int] = None,
+             cover: Optional[int] = None, rapid_fire_close: bool = False, shoot: bool = True,
+             assault: bool = True) -> SimResult:
+    """Outcome histograms over `trials` shooting + charge exchanges, reproducible for a given seed."""
+    if not HAVE_NUMPY: raise RuntimeError("The battle simulator needs numpy (pip install numpy).")
+    shards = [SHARD_TRIALS] * (trials // SHARD_TRIALS) + ([trials % SHARD_TRIALS] if trials % SHARD_TRIALS else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(shards))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(shards)))
+    args = [(attacker, defender, n, s, cover, rapid_fire_close, shoot, assault) for n, s in zip(shards, seeds)]
+    start = time.perf_counter()
+    if workers == 1:
+        parts = [_run_shard(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_run_shard, *zip(*args)))
+    elapsed = time.perf_counter() - start
+    d_hist = sum(p[0] for p in parts)
+    a_hist = sum(p[1] for p in parts)
+    outcomes = sum(p[2] for p in parts)
+    return SimResult(trials, seed, workers, elapsed, d_hist, a_hist,
+                     {name: int(n) for name, n in zip(OUTCOMES, outcomes)})
+
+# --- Benchmark ---
+def _side_for(codex, unit_id, size=None) -> Side:
+    u = codex.unit(unit_id)
+    if not u: raise SystemExit(f"unknown unit {unit_id!r} in {codex.name}")
+    res = resolve_roster([{"unit_id": unit_id, "size": size or u.get("default_size", 1), "selected": {}}], codex)
+    return side_from(res.roots[0], codex)
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Monte Carlo shooting + assault exchanges between two units.")
+    ap.add_argument("--codex", type=Path, help="attacker codex (default: first in codexes/)")
+    ap.add_argument("--target-codex", type=Path, help="defender codex (default: same as attacker)")
+    ap.add_argument("--attacker", help="attacker unit id (default: first Troops unit)")
+    ap.add_argument("--defender", help="defender unit id (default: first Troops unit)")
+    ap.add_argument("--trials", type=int, default=1_000_000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--bench", action="store_true", help="also time a single worker and report trials/sec per core")
+    args = ap.parse_args(argv)
+
+    codex_path = args.codex or sorted((Path(__file__).parent / "codexes").glob("*.json"))[0]
+    a_codex = CODEX_CACHE.load(codex_path)
+    d_codex = CODEX_CACHE.load(args.target_codex) if args.target_codex else a_codex
+    first = lambda c: next(u["id"] for u in c.units_in_slot("Troops"))
+    attacker = _side_for(a_codex, args.attacker or first(a_codex))
+    defender = _side_for(d_codex, args.defender or first(d_codex))
+
+    res = simulate(attacker, defender, args.trials, args.seed, args.workers)
+    print(f"{attacker.name} x{attacker.models} vs {defender.name} x{defender.models}: {res.trials:,} trials")
+    for name in OUTCOMES:
+        print(f"  {name:<10} {res.share(name):7.2%}")
+    mean = (res.defender_losses * np.arange(len(res.defender_losses))).sum() / res.trials
+    print(f"  defender loses {mean:.2f} models on average")
+    print(f"{res.trials_per_sec:,.0f} trials/sec with {res.workers} workers "
+          f"({res.trials_per_sec / res.workers:,.0f} per core)")
+    if args.bench and res.workers > 1:
+        single = simulate(attacker, defender, args.trials, args.seed, 1)
+        same = all(single.outcomes[k] == res.outcomes[k] for k in OUTCOMES)
+        print(f"{single.trials_per_sec:,.0f} trials/sec on 1 worker; "
+              f"speed-up x{res.trials_per_sec / single.trials_per_sec:.2f}; identical histograms: {same}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""
+Optimal list search: the top-N legal rosters under a points limit for a
+chosen objective (model count, scoring units or per-unit weights).
+
+Every unit is expanded into configurations (size, cheapest picks that
+satisfy the option groups' min_select, optionally one of its dedicated
+transports). A depth-first branch and bound then fills the force-org
+slots in turn, honouring FORCE_ORG_LIMITS_5E and `unique`; it is pruned
+by a memoised bounded-knapsack upper bound over the remaining slots.
+Lists of equal value are ranked by points spent, highest first.
+
+The search is over units only: sizes and transports, never optional
+upgrades, which none of the objectives value. Spare points are left for
+the player (or the fill-remaining suggestions) to spend on upgrades.
+"""
+import heapq
+import math
+import time
+import uuid
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from constants import FORCE_ORG_LIMITS_5E
+from points import entry_cost, mandatory_picks
+
+OBJECTIVES = {
+    "models": "Model count",
+    "scoring": "Scoring units (Troops)",
+    "weights": "Custom unit weights",
+}
+SCORING_SLOTS = ("Troops",)
+_BUDGET_GRAIN = 5  # points; the upper bound is memoised per (slot, slots left, budget rounded up)
+
+@dataclass(frozen=True)
+class Config:
+    """One way to field a unit: its size and mandatory picks, plus an optional dedicated transport."""
+    unit_id: str
+    slot: str
+    size: int
+    selected: Tuple[Tuple[str, Tuple[str, ...]], ...]
+    cost: float
+    value: float
+    unique: bool = False
+    transport: Optional["Config"] = None
+
+@dataclass
+class Solution:
+    value: float
+    cost: float
+    configs: List[Config] = field(default_factory=list)
+
+    def to_entries(self) -> List[Dict[str, Any]]:
+        """Roster entries ready for Roster(...)."""
+        out = []
+        for c in self.configs:
+            root = {"id": str(uuid.uuid4()), "unit_id": c.unit_id, "size": c.size,
+                    "selected": {g: list(p) for g, p in c.selected}, "parent_id": None}
+            out.append(root)
+            if c.transport is not None:
+                t = c.transport
+                out.append({"id": str(uuid.uuid4()), "unit_id": t.unit_id, "size": t.size,
+                            "selected": {g: list(p) for g, p in t.selected}, "parent_id": root["id"]})
+        return out
+
+@dataclass
+class SearchResult:
+    solutions: List[Solution]
+    nodes: int
+    elapsed: float
+    complete: bool  # False when the time budget ran out or the search was cancelled
+
+def _unit_value(objective, unit, size, weights) -> float:
+    if objective == "models": return size
+    if objective == "scoring": return 1 if unit.get("slot") in SCORING_SLOTS else 0
+    return float(weights.get(unit.get("id"), 0))
+
+def build_configs(codex, objective="models", weights=None) -> Dict[str, List[Config]]:
+    """Configurations per force-org slot, best value per point first."""
+    weights = weights or {}
+    per_slot: Dict[str, List[Config]] = {s: [] for s in FORCE_ORG_LIMITS_5E}
+
+    def plain(u, size):
+        cu = codex.compiled(u["id"])
+        sel = mandatory_picks(u, size, cu)
+        cost = entry_cost({"size": size, "selected": sel}, cu)
+        return Config(u["id"], u.get("slot", ""), size, tuple((g, tuple(p)) for g, p in sel.items()),
+                      cost, _unit_value(objective, u, size, weights), bool(u.get("unique")))
+
+    for u in codex.units:
+        if u.get("slot") not in per_slot or codex.compiled(u["id"]) is None: continue
+        transports = []
+        for tid in u.get("dedicated_transports", []):
+            t = codex.unit(tid)
+            if t and codex.compiled(tid) is not None:
+                transports.append(plain(t, t.get("min_size", 1)))
+        for size in range(u.get("min_size", 1), max(u.get("min_size", 1), u.get("max_size", 1)) + 1):
+            base = plain(u, size)
+            per_slot[u["slot"]].append(base)
+            for t in transports:
+                # Objectives count the transport's own models/weight too (scoring: it is not a Troops unit)
+                t_value = t.size if objective == "models" else (0 if objective == "scoring" else t.value)
+                per_slot[u["slot"]].append(Config(base.unit_id, base.slot, base.size, base.selected,
+                                                  base.cost + t.cost, base.value + t_value, base.unique, t))
+    for configs in per_slot.values():
+        configs.sort(key=lambda c: (-(c.value / c.cost if c.cost > 0 else math.inf), -c.value, c.cost))
+    return per_slot
+
+def solve(codex, points_limit, objective="models", weights=None, top_n=5, time_budget=5.0,
+          progress: Optional[Callable[[float, int, Optional[float]], bool]] = None,
+          limits: Dict[str, Tuple[int, int]] = FORCE_ORG_LIMITS_5E) -> SearchResult:
+    """
+    Top-N legal rosters by (value, points spent). progress(fraction of the
+    time budget used, nodes explored, best value so far) is called
+    periodically; returning False cancels the search.
+    """
+    per_slot = build_configs(codex, objective, weights)
+    slots = [s for s in limits if s in per_slot]
+    configs = [per_slot[s] for s in slots]
+    mins = [limits[s][0] for s in slots]
+    maxs = [limits[s][1] for s in slots]
+    cheapest = [min((c.cost for c in cs), default=math.inf) for cs in configs]
+    # Points still needed to reach the minimum of every slot after index i
+    need_after = [0.0] * (len(slots) + 1)
+    for i in range(len(slots) - 1, -1, -1):
+        need_after[i] = need_after[i + 1] + (mins[i] * cheapest[i] if mins[i] else 0)
+
+    # Pareto-optimal (cost, value) pairs per slot for the relaxed bound
+    frontier = []
+    for cs in configs:
+        best, pts = -math.inf, []
+        for c in sorted(cs, key=lambda c: (c.cost, -c.value)):
+            if c.value > best:
+                pts.append((c.cost, c.value)); best = c.value
+        frontier.append(pts)
+
+    @lru_cache(maxsize=None)
+    def bound(i, left, budget):
+        """Max value from slot i (with `left` picks remaining there) onwards, ignoring uniqueness and minimums."""
+        if i >= len(slots): return 0.0
+        best = bound(i + 1, maxs[i + 1] if i + 1 < len(slots) else 0, budget)
+        if left > 0:
+            for cost, value in frontier[i]:
+                if cost > budget: break
+                rest = budget - cost
+                best = max(best, value + bound(i, left - 1, math.ceil(rest / _BUDGET_GRAIN) * _BUDGET_GRAIN))
+        return best
+
+    def upper(i, left, budget):
+        return bound(i, left, math.ceil(budget / _BUDGET_GRAIN) * _BUDGET_GRAIN)
+
+    heap: List[Tuple[float, float, int, List[Config]]] = []
+    seq = 0
+    nodes = 0
+    start = time.perf_counter()
+    deadline = start + time_budget
+    stopped = False
+
+    def record(value, spent, picks):
+        nonlocal seq
+        seq += 1
+        item = (value, spent, seq, list(picks))
+        if len(heap) < top_n: heapq.heappush(heap, item)
+        elif (value, spent) > heap[0][:2]: heapq.heapreplace(heap, item)
+
+    picks: List[Config] = []
+    used_unique = set()
+
+    def dfs(i, start_j, count, budget, value):
+        nonlocal nodes, stopped
+        nodes += 1
+        if nodes & 1023 == 0:
+            now = time.perf_counter()
+            best = max(heap)[0] if heap else None
+            if now > deadline or (progress and progress(min(1.0, (now - start) / time_budget), nodes, best) is False):
+                stopped = True
+        if stopped: return
+        if i == len(slots):
+            record(value, points_limit - budget, picks)
+            return
+        # Equal-value branches stay open unless the worst kept list already spends the whole limit,
+        # since ties are ranked by points spent
+        if len(heap) >= top_n:
+            best_here = value + upper(i, maxs[i] - count, budget)
+            if best_here < heap[0][0] or (best_here == heap[0][0] and heap[0][1] >= points_limit): return
+        if budget < max(0, mins[i] - count) * cheapest[i] + need_after[i + 1]: return
+
+        cs = configs[i]
+        if count < maxs[i]:
+            for j in range(start_j, len(cs)):
+                c = cs[j]
+                if c.cost > budget or (c.unique and c.unit_id in used_unique): continue
+                picks.append(c)
+                if c.unique: used_unique.add(c.unit_id)
+                dfs(i, j, count + 1, budget - c.cost, value + c.value)
+                if c.unique: used_unique.discard(c.unit_id)
+                picks.pop()
+                if stopped: return
+        if count >= mins[i]:
+            dfs(i + 1, 0, 0, budget, value)
+
+    dfs(0, 0, 0, points_limit, 0.0)
+    elapsed = time.perf_counter() - start
+    if progress: progress(1.0, nodes, max(heap)[0] if heap else None)
+    ranked = sorted(heap, key=lambda h: (-h[0], -h[1], h[2]))
+    return SearchResult([Solution(v, c, p) for v, c, _, p in ranked], nodes, elapsed, not stopped)
+
+def describe(solution: Solution, codex) -> str:
+    """One line per unit, e.g. "Dire Avengers x10 + Wave Serpent (215 pts)"."""
+    lines = []
+    for c in solution.configs:
+        u = codex.unit(c.unit_id) or {}
+        text = u.get("name", c.unit_id) + (f" x{c.size}" if c.size > 1 else "")
+        if c.transport is not None:
+            text += " + " + (codex.unit(c.transport.unit_id) or {}).get("name", c.transport.unit_id)
+        lines.append(f"{text} ({c.cost:g} pts)")
+    return "\n".join(lines)
@@ -1,16 +1,27 @@
 import streamlit as st
 import json
 import uuid
-import requests
 import re
 import pandas as pd
 from pathlib import Path
 from PIL import Image
-from reports import write_roster_pdf
+from reports import render_roster_pdf
+from codex import CODEX_CACHE
+from codex_index import codex_index
+from constants import SLOTS
+from roster import Roster
+from roster_store import library
+from issue_tracker import tracker
+from resolved import resolve_roster
+from solver import OBJECTIVES, describe, solve
+from suggestions import apply_suggestion, suggest
+from mathhammer import HAVE_NUMPY, cross_matrix
+from simulator import OUTCOMES, side_from, simulate
 
 # --- Setup & Configuration ---
 BASE_DIR = Path(__file__).parent
 CODEX_DIR = BASE_DIR / "codexes"
+SIM_WORKERS = 1   # sessions share the server's cores; the CLI --bench path uses them all
 CODEX_DIR.mkdir(exist_ok=True)
 
 icon_path = BASE_DIR / "app_icon.ico"
@@ -22,7 +33,7 @@ else:
 st.set_page_config(page_title="Rising Builder", page_icon=app_icon, layout="wide")
 
 if "roster" not in st.session_state:
-    st.session_state.roster = []
+    st.session_state.roster = Roster()
 if "roster_name" not in st.session_state:
     st.session_state.roster_name = "My Army List"
 if "active_unit_id" not in st.session_state:
@@ -30,105 +41,60 @@ if "active_unit_id" not in st.session_state:
 
 # --- Helper Functions ---
 def load_codex(filepath):
+    # Shared by every session in this process; only re-parsed when the file changes
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return CODEX_CACHE.load(filepath)
     except Exception as e:
         st.error(f"Error loading codex: {e}")
         return None
 
+def set_codex(codex):
+    st.session_state.codex = codex
+    st.session_state.codex_data = codex.data if codex else None
+
+def get_codex():
+    return st.session_state.get("codex")
+
+def replace_roster(roster):
+    """Swaps in a new Roster and drops the outputs cached for the old one."""
+    st.session_state.roster = roster
+    for key in ("text_export_cache", "resolved_cache"): st.session_state.pop(key, None)
+
 def get_unit_by_id(unit_id):
-    if not st.session_state.get("codex_data"): return None
-    for u in st.session_state.codex_data.get("units", []):
-        if u["id"] == unit_id:
-            return u
-    return None
-
-def get_tooltip(item_name, codex_data):
-    if not codex_data or not item_name: return None
-    query = item_name.lower()
+    codex = get_codex()
+    return codex.unit(unit_id) if codex else None
+
+TOOLTIP_ICONS = {"weapons": "⚔️", "wargear": "⚙️", "rules": "📜"}
+
+def get_tooltip(item_name, codex):
+    if not codex or not item_name: return None
     matches = []
-    
-    # 1. Search Weapons
-    weps = codex_data.get("weapons", {})
-    for name, stats in weps.items():
-        n = name.lower()
-        if n in query:
-            matches.append(f"⚔️ [{name}] Rng: {stats.get('range', '-')}, S: {stats.get('S', '-')}, AP: {stats.get('AP', '-')}, Type: {stats.get('type', '-')}. {stats.get('notes', '')}")
-
-    # 2. Search Wargear
-    gear = codex_data.get("wargear", {})
-    for name, data in gear.items():
-        n = name.lower()
-        if n in query:
-            matches.append(f"⚙️ [{name}] {data.get('summary', '')}")
-            
-    # 3. Search Rules
-    rules = codex_data.get("rules", {})
-    for name, data in rules.items():
-        n = name.lower()
-        if n in query:
-            matches.append(f"📜 [{name}] {data.get('summary', '')}")
-    
+    for section, name, d in codex.tooltip_matches(item_name):
+        if section == "weapons":
+            matches.append(f"{TOOLTIP_ICONS[section]} [{name}] Rng: {d.get('range', '-')}, S: {d.get('S', '-')}, AP: {d.get('AP', '-')}, Type: {d.get('type', '-')}. {d.get('notes', '')}")
+        else:
+            matches.append(f"{TOOLTIP_ICONS[section]} [{name}] {d.get('summary', '')}")
     if not matches: return None
     return "\n\n".join(matches)
 
-def fetch_github_issues():
+def get_issue_tracker():
+    # One tracker per repository for the whole process: cached issues and the feedback queue are shared
     try:
-        token = st.secrets["github"]["token"]
-        owner = st.secrets["github"]["owner"]
-        repo = st.secrets["github"]["repo"]
-        api_url = f"https://api.github.com/repos/{owner}/{repo}/issues"
-        params = { "state": "all", "sort": "updated", "direction": "desc", "per_page": 20 }
-        headers = { "Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json" }
-        response = requests.get(api_url, headers=headers, params=params)
-        if response.status_code == 200: return response.json()
-        return []
-    except Exception: return []
+        gh = st.secrets["github"]
+        return tracker(gh["owner"], gh["repo"], gh["token"])
+    except Exception: return None
+
+def fetch_github_issues():
+    # Never waits on the network: serves the cached list and refreshes it in the background when stale
+    t = get_issue_tracker()
+    return t.issues() if t else []
 
 # --- CORE LOGIC ---
 def calculate_roster():
-    total_pts = 0
-    counts = {"HQ": 0, "Troops": 0, "Elites": 0, "Fast Attack": 0, "Heavy Support": 0}
-    
-    for entry in st.session_state.roster:
-        u = get_unit_by_id(entry["unit_id"])
-        if not u: continue
-        
-        cost = u.get("base_points", 0) + u.get("points_per_model", 0) * entry.get("size", 1)
-        selection_tracker = {}
-        
-        for gid, picks in entry.get("selected", {}).items():
-            opt_def = next((o for o in u.get("options", []) if o.get("group_id") == gid), None)
-            if not opt_def: continue
-            
-            for choice in opt_def.get("choices", []):
-                c_qty = picks.count(choice["id"]) if isinstance(picks, list) else (1 if picks == choice["id"] else 0)
-                if c_qty > 0:
-                    pts = choice.get("points", 0)
-                    if choice.get("points_mode") == "per_model":
-                        cost += pts * entry.get("size", 1)
-                    else:
-                        cost += pts * c_qty
-                        cid = choice["id"]
-                        if cid not in selection_tracker:
-                            selection_tracker[cid] = {"count": 0, "points": pts}
-                        selection_tracker[cid]["count"] += c_qty
-
-        if u.get("enable_twin_link_discount"):
-            for cid, data in selection_tracker.items():
-                pairs = data["count"] // 2
-                if pairs > 0:
-                    discount = pairs * (data["points"] * 0.5)
-                    cost -= discount
-
-        entry["calculated_cost"] = cost
-        total_pts += cost
-        
-        if not entry.get("parent_id") and u.get("slot") in counts:
-            counts[u["slot"]] += 1
-            
-    return total_pts, counts
+    roster = st.session_state.roster
+    roster.bind(get_codex())
+    roster.refresh()
+    return roster.total, roster.slot_counts
 
 def validate_roster(limit, curr_pts, slots):
     issues = []
@@ -139,72 +105,70 @@ def validate_roster(limit, curr_pts, slots):
     if slots["HQ"] < 1: issues.append("⚠️ **HQ:** Need at least 1.")
     if slots["Troops"] < 2: issues.append("⚠️ **Troops:** Need at least 2.")
     
-    unique_counter = {}
-    for entry in st.session_state.roster:
-        u = get_unit_by_id(entry["unit_id"])
-        if not u: continue
+    roster = st.session_state.roster
+    for entry, u in roster.size_violations():
         min_s = u.get("min_size", 1)
         max_s = u.get("max_size", 1)
         if entry["size"] < min_s: issues.append(f"⚠️ **{u['name']}:** Size {entry['size']} too small (Min {min_s}).")
         if entry["size"] > max_s: issues.append(f"⚠️ **{u['name']}:** Size {entry['size']} too large (Max {max_s}).")
-        if u.get("unique", False):
-            if u["name"] in unique_counter: issues.append(f"❌ **Unique:** You cannot take '{u['name']}' more than once.")
-            unique_counter[u["name"]] = True
+    for name, count in roster.unique_counts.items():
+        for _ in range(count - 1): issues.append(f"❌ **Unique:** You cannot take '{name}' more than once.")
     return issues
 
+def get_resolved_roster():
+    """Resolved roster shared by the text export and play mode; rebuilt only after an edit."""
+    roster, codex = st.session_state.roster, get_codex()
+    key = (roster.revision, codex.version)
+    cached = st.session_state.get("resolved_cache")
+    if not cached or cached[0] != key:
+        cached = (key, resolve_roster(roster, codex))
+        st.session_state.resolved_cache = cached
+    return cached[1]
+
 def generate_text_summary(roster, codex_name, limit):
-    curr_pts, _ = calculate_roster()
-    txt = [f"{codex_name} - {st.session_state.roster_name}", f"Total: {curr_pts}/{limit} pts", "-"*30]
-    
-    def print_entry(entry, depth=0):
-        u = get_unit_by_id(entry["unit_id"])
-        if not u: return []
-        indent = "  " * depth
-        prefix = "• " if depth == 0 else "> "
-        name_str = f"{u['name']}"
-        if entry.get("custom_name"): name_str = f"{entry['custom_name']} ({u['name']})"
-        if entry.get("size", 1) > 1: name_str += f" x{entry['size']}"
-        
-        lines = [f"{indent}{prefix}{name_str} [{entry.get('calculated_cost', 0)} pts]"]
-        
-        opts = []
-        if "selected" in entry:
-            for gid, picks in entry["selected"].items():
-                opt_def = next((o for o in u.get("options", []) if o.get("group_id") == gid), None)
-                if not opt_def: continue
-                for choice in opt_def.get("choices", []):
-                    count = picks.count(choice["id"]) if isinstance(picks, list) else (1 if picks == choice["id"] else 0)
-                    if count > 0:
-                        s = choice['name']
-                        if count > 1: s = f"{count}x {s}"
-                        opts.append(s)
+    res = get_resolved_roster()
+    txt = [f"{codex_name} - {st.session_state.roster_name}", f"Total: {res.total}/{limit} pts", "-"*30]
+
+    def print_entry(r):
+        indent = "  " * r.depth
+        prefix = "• " if r.depth == 0 else "> "
+        name_str = r.title
+        if r.size > 1: name_str += f" x{r.size}"
+        lines = [f"{indent}{prefix}{name_str} [{r.cost} pts]"]
+        opts = [f"{count}x {name}" if count > 1 else name for name, count in r.options]
         if opts: lines.append(f"{indent}  + {', '.join(opts)}")
         return lines
 
-    slots_order = ["HQ", "Troops", "Elites", "Fast Attack", "Heavy Support", "Dedicated Transport"]
-    for slot in slots_order:
-        slot_units = [e for e in roster if not e.get("parent_id") and get_unit_by_id(e['unit_id'])['slot'] == slot]
-        if not slot_units: continue
-        txt.append(f"\n[{slot}]")
-        
-        def recursive_text(units, depth):
-            for entry in units:
-                txt.extend(print_entry(entry, depth))
-                children = [c for c in roster if c.get("parent_id") == entry["id"]]
-                recursive_text(children, depth + 1)
-        
-        recursive_text(slot_units, 0)
+    last_slot = None
+    for slot, r in res.walk():
+        if slot != last_slot:
+            txt.append(f"\n[{slot}]")
+            last_slot = slot
+        txt.extend(print_entry(r))
 
     return "\n".join(txt)
 
 # --- CALLBACKS ---
+# Keyed fragments that show roster-wide figures; a card edit reruns these and the card, not the app
+PAGE_FRAGMENTS = ["roster_totals", "text_export", "fill_list"]
+
+def card_key(entry_id): return f"card_{entry_id}"
+
+def entry_edited(entry):
+    roster = st.session_state.roster
+    roster.touch(entry["id"])
+    roster.refresh()  # only the touched entry is recosted
+    st.rerun([card_key(entry["id"])] + PAGE_FRAGMENTS)
+
 def cb_update_roster_name(): st.session_state.roster_name = st.session_state.roster_name_input
 def cb_update_custom_name(entry, key):
     st.session_state.active_unit_id = entry["id"] 
     entry["custom_name"] = st.session_state[key]
+    entry_edited(entry)
 def cb_update_size(entry, key):
     st.session_state.active_unit_id = entry["id"] 
     entry["size"] = st.session_state[key]
+    entry_edited(entry)
 def cb_update_counter(entry, gid, cid, key):
     st.session_state.active_unit_id = entry["id"]
     qty = st.session_state[key]
@@ -213,6 +177,7 @@ def cb_update_counter(entry, gid, cid, key):
     current_picks.extend([cid] * qty)
     if "selected" not in entry: entry["selected"] = {}
     entry["selected"][gid] = current_picks
+    entry_edited(entry)
 def cb_update_radio(entry, gid, name_to_id_map, key):
     st.session_state.active_unit_id = entry["id"]
     selected_name = st.session_state[key]
@@ -221,6 +186,7 @@ def cb_update_radio(entry, gid, name_to_id_map, key):
     else:
         cid = name_to_id_map.get(selected_name)
         if cid: entry["selected"][gid] = [cid]
+    entry_edited(entry)
 def cb_update_checkbox(entry, gid, cid, key):
     st.session_state.active_unit_id = entry["id"]
     is_checked = st.session_state[key]
@@ -231,8 +197,9 @@ def cb_update_checkbox(entry, gid, cid, key):
     else:
         if cid in current_picks: current_picks.remove(cid)
     entry["selected"][gid] = current_picks
+    entry_edited(entry)
 
-def render_unit_options(entry, unit, codex_data):
+def render_unit_options(entry, unit, codex):
     k_name = f"name_{entry['id']}"
     st.text_input("Custom Name (Optional)", value=entry.get("custom_name", ""), 
                   placeholder=f"e.g. {unit['name']} Squad Alpha", key=k_name,
@@ -274,7 +241,7 @@ def render_unit_options(entry, unit, codex_data):
                 cid = c["id"]
                 qty = current_picks.count(cid)
                 k = f"opt_{entry['id']}_{gid}_{cid}"
-                tooltip = get_tooltip(c["name"], codex_data)
+                tooltip = get_tooltip(c["name"], codex)
                 
                 with cols[i % 3]:
                     st.number_input(f"{c['name']} (+{c['points']} pts)", min_value=0, max_value=max_sel, value=qty, 
@@ -300,7 +267,7 @@ def render_unit_options(entry, unit, codex_data):
             dropdown_tooltip = "Select an option to see rules."
             if current_selected_name != "(None)":
                 clean_name = re.sub(r' \(\+\d+.*\)', '', current_selected_name)
-                desc = get_tooltip(clean_name, codex_data)
+                desc = get_tooltip(clean_name, codex)
                 if desc: dropdown_tooltip = desc
 
             k = f"opt_{entry['id']}_{gid}"
@@ -308,7 +275,7 @@ def render_unit_options(entry, unit, codex_data):
                          on_change=cb_update_radio, args=(entry, gid, name_map, k))
             if selected != "(None)":
                 clean_name = re.sub(r' \(\+\d+.*\)', '', selected)
-                desc = get_tooltip(clean_name, codex_data)
+                desc = get_tooltip(clean_name, codex)
                 if desc: st.caption(f"↳ {desc}")
         else:
             # Grid Layout for checkboxes too
@@ -317,11 +284,31 @@ def render_unit_options(entry, unit, codex_data):
                 cid = c["id"]
                 is_checked = cid in current_picks
                 k = f"opt_{entry['id']}_{gid}_{cid}"
-                tooltip = get_tooltip(c["name"], codex_data)
+                tooltip = get_tooltip(c["name"], codex)
                 with cols[i % 3]:
                     st.checkbox(f"{c['name']} (+{c['points']})", value=is_checked, key=k, help=tooltip,
                                 on_change=cb_update_checkbox, args=(entry, gid, cid, k))
 
+@st.fragment(key="text_export")
+def render_text_export(points_limit):
+    st.caption("Perfect for Reddit/Discord")
+    if st.session_state.get("codex_data"):
+        # Only rebuilt when the roster, codex, limit or name actually changed
+        txt_key = (st.session_state.roster.revision, get_codex().version, points_limit, st.session_state.roster_name)
+        cached = st.session_state.get("text_export_cache")
+        if not cached or cached[0] != txt_key:
+            cached = (txt_key, generate_text_summary(st.session_state.roster, st.session_state.codex_data.get("codex_name", "Army"), points_limit))
+            st.session_state.text_export_cache = cached
+        txt_out = cached[1]
+        st.code(txt_out, language="text")
+    else:
+        st.info("Load a Codex to generate text summary.")
+
+# Pick up codex files edited on disk (a stat per run; parsed again only if changed)
+if st.session_state.get("current_codex_path"):
+    _codex = load_codex(st.session_state.current_codex_path)
+    if _codex is not None: set_codex(_codex)
+
 # --- SIDEBAR ---
 with st.sidebar:
     col1, col2 = st.columns([1, 4])
@@ -342,28 +329,59 @@ with st.sidebar:
         if "current_codex_name" in st.session_state and st.session_state.current_codex_name in codex_names:
             index = codex_names.index(st.session_state.current_codex_name)
         selected_codex_name = st.selectbox("Select Codex", codex_names, index=index)
+        cache_stats = CODEX_CACHE.stats()
+        st.caption(f"Codex cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
         
         if selected_codex_name:
             path = CODEX_DIR / selected_codex_name
             if st.session_state.get("current_codex_path") != str(path):
-                st.session_state.codex_data = load_codex(path)
+                set_codex(load_codex(path))
                 st.session_state.current_codex_path = str(path)
                 st.session_state.current_codex_name = selected_codex_name
                 if not st.session_state.get("is_loading_file", False):
-                    st.session_state.roster = [] 
+                    replace_roster(Roster())
                     st.session_state.roster_name = "My Army List"
                 st.session_state.is_loading_file = False
                 st.rerun()
 
         st.text_input("Roster Name", value=st.session_state.roster_name, key="roster_name_input", on_change=cb_update_roster_name)
         points_limit = st.number_input("Points Limit", value=1500, step=250, key="points_limit_input")
-        
+
+        with st.expander("🧮 List Optimiser"):
+            objective = st.selectbox("Maximise", list(OBJECTIVES), format_func=OBJECTIVES.get)
+            weights = {}
+            if objective == "weights" and get_codex():
+                units = [u for u in get_codex().units if u.get("slot") != "Dedicated Transport"]
+                table = st.data_editor(pd.DataFrame({"Unit": [u["name"] for u in units], "Weight": [0.0] * len(units)}),
+                                       disabled=["Unit"], hide_index=True, key="optimiser_weights")
+                weights = {u["id"]: w for u, w in zip(units, table["Weight"]) if w}
+            top_n = st.slider("Lists to keep", 1, 10, 3)
+            time_budget = st.slider("Time budget (s)", 1, 30, 5)
+            if st.button("Search") and get_codex():
+                bar = st.progress(0.0)
+                def report(fraction, nodes, best):
+                    bar.progress(fraction, text=f"{nodes:,} lists explored" + (f", best {best:g}" if best is not None else ""))
+                st.session_state.optimiser_result = (get_codex().version, solve(
+                    get_codex(), points_limit, objective, weights, top_n=top_n, time_budget=time_budget, progress=report))
+            version, result = st.session_state.get("optimiser_result", (None, None))
+            if result and get_codex() and version == get_codex().version:
+                st.caption(f"{result.nodes:,} lists in {result.elapsed:.1f}s" + ("" if result.complete else " (stopped early)"))
+                if not result.solutions: st.warning("No legal list fits the points limit.")
+                for i, sol in enumerate(result.solutions):
+                    st.markdown(f"**#{i + 1}: {sol.value:g}** ({sol.cost:g} pts)")
+                    st.text(describe(sol, get_codex()))
+                    if st.button("Use this list", key=f"use_solution_{i}"):
+                        replace_roster(Roster(sol.to_entries()))
+                        st.rerun()
+
         st.divider()
         st.subheader("Save / Load")
         safe_filename = re.sub(r'[^a-zA-Z0-9_\-]', '_', st.session_state.roster_name)
         if not safe_filename: safe_filename = "army_list"
         save_data = {"roster_name": st.session_state.roster_name, "roster": st.session_state.roster, "codex_file": selected_codex_name, "points_limit": points_limit}
-        st.download_button("💾 Download Roster", json.dumps(save_data, indent=2), f"{safe_filename}.json", "application/json")
+        # Serialised on click: card edits since this run only reran their fragments
+        st.download_button("💾 Download Roster", lambda: json.dumps(save_data | {"roster": save_data["roster"].entries}, indent=2),
+                           f"{safe_filename}.json", "application/json")
 
         uploaded_file = st.file_uploader("📂 Load Roster", type=["json"])
         if uploaded_file is not None:
@@ -378,14 +396,44 @@ with st.sidebar:
                     if target_path and target_path.exists():
                         st.session_state.current_codex_name = saved_codex
                         st.session_state.current_codex_path = str(target_path)
-                        st.session_state.codex_data = load_codex(target_path)
+                        set_codex(load_codex(target_path))
                         st.success(f"Loaded '{saved_codex}'.")
                     else: st.warning(f"⚠️ Original Codex '{saved_codex}' missing. Using current Codex.")
-                    st.session_state.roster = data.get("roster", [])
+                    replace_roster(Roster(data.get("roster", [])))
                     st.session_state.roster_name = data.get("roster_name", "My Army List")
                     st.rerun()
                 except Exception as e: st.error(f"Error reading file: {e}")
 
+        with st.expander("📚 Roster Library"):
+            store = library(BASE_DIR / "rosters" / "library.db")
+            if st.button("Save to library", disabled=not len(st.session_state.roster)):
+                # Re-saving under the same name updates the library copy this roster came from
+                same = st.session_state.get("library_name") == st.session_state.roster_name
+                st.session_state.library_id = store.save(st.session_state.roster, get_codex(), st.session_state.roster_name,
+                                                         points_limit, selected_codex_name,
+                                                         st.session_state.get("library_id") if same else None)
+                st.session_state.library_name = st.session_state.roster_name
+                st.success(f"Saved '{st.session_state.roster_name}'.")
+            lib_search = st.text_input("Search names", key="library_search")
+            lib_unit = st.selectbox("Containing unit", [""] + store.unit_names(), key="library_unit")
+            lib_codex_only = st.checkbox("Current codex only", value=True, key="library_codex_only")
+            found = store.list(codex_file=selected_codex_name if lib_codex_only else None, search=lib_search, unit=lib_unit)
+            if not found: st.caption("No saved rosters match.")
+            else:
+                pick = st.selectbox("Saved rosters", found, format_func=lambda r: r.label, key="library_pick")
+                if st.button("Open", key="library_open"):
+                    data = store.load(pick.id)
+                    target_path = CODEX_DIR / data["codex_file"] if data.get("codex_file") else None
+                    if target_path and target_path.exists():
+                        st.session_state.current_codex_name = data["codex_file"]
+                        st.session_state.current_codex_path = str(target_path)
+                        set_codex(load_codex(target_path))
+                    st.session_state.is_loading_file = True
+                    replace_roster(Roster(data["roster"]))
+                    st.session_state.roster_name = data["roster_name"]
+                    st.session_state.library_id, st.session_state.library_name = data["id"], data["roster_name"]
+                    st.rerun()
+
         if st.button("⚠️ Reset App", type="primary"):
             for key in list(st.session_state.keys()): del st.session_state[key]
             st.rerun()
@@ -394,18 +442,12 @@ with st.sidebar:
         st.write("### Export")
         include_tables = st.checkbox("Include Ref Tables", value=True)
         if st.button("📄 Generate PDF"):
-            pdf_path = BASE_DIR / "temp_roster.pdf"
-            write_roster_pdf(st.session_state.roster, st.session_state.codex_data, points_limit, str(pdf_path), get_unit_by_id, include_ref_tables=include_tables, roster_name=st.session_state.roster_name)
-            with open(pdf_path, "rb") as f: st.download_button("Download PDF", f, f"{safe_filename}.pdf", "application/pdf")
+            pdf_bytes = render_roster_pdf(st.session_state.roster, get_codex(), points_limit, include_ref_tables=include_tables, roster_name=st.session_state.roster_name)
+            st.download_button("Download PDF", pdf_bytes, f"{safe_filename}.pdf", "application/pdf")
 
         # --- TEXT EXPORT ---
         with st.expander("📋 Text Export (Copy/Paste)"):
-            st.caption("Perfect for Reddit/Discord")
-            if st.session_state.get("codex_data"):
-                txt_out = generate_text_summary(st.session_state.roster, st.session_state.codex_data.get("codex_name", "Army"), points_limit)
-                st.code(txt_out, language="text")
-            else:
-                st.info("Load a Codex to generate text summary.")
+            render_text_export(points_limit)
 
         # --- CODEX AUDITOR ---
         st.divider()
@@ -413,6 +455,7 @@ with st.sidebar:
             if st.button("Run Audit"):
                 if "codex_data" in st.session_state and st.session_state.codex_data:
                     data = st.session_state.codex_data
+                    codex = get_codex()
                     issues = []
                     all_defs = set(data.get("weapons", {}).keys()) | set(data.get("wargear", {}).keys()) | set(data.get("rules", {}).keys())
                     for unit in data.get("units", []):
@@ -424,10 +467,8 @@ with st.sidebar:
                         for opt in unit.get("options", []):
                             for ch in opt.get("choices", []):
                                 c_name = ch.get("name", "")
-                                parts = re.split(r' & | and |, | / | \+ ', c_name)
-                                for p in parts:
-                                    p = p.strip()
-                                    if p and "Upgrade" not in p and "Twin-linked" not in p and p not in all_defs:
+                                for p in codex.audit_parts(c_name):
+                                    if "Upgrade" not in p and "Twin-linked" not in p and p not in all_defs:
                                          issues.append(f"⚠️ Option **'{c_name}'**: Part **'{p}'** is undefined.")
                     if not issues: st.success("✅ Codex looks healthy!")
                     else:
@@ -436,6 +477,34 @@ with st.sidebar:
                 else:
                     st.error("No Codex Loaded.")
 
+        with st.expander("🌐 Search All Codexes"):
+            index = codex_index(CODEX_DIR)
+            mode = st.radio("Search", ["Weapons", "Units", "Rules"], horizontal=True, key="xcodex_mode")
+            name = st.text_input("Name contains", key="xcodex_name")
+            codex_filter = st.selectbox("Codex", [""] + index.codexes, format_func=lambda c: c or "All codexes", key="xcodex_codex")
+            if mode == "Weapons":
+                c1, c2, c3 = st.columns(3)
+                min_s = c1.number_input("S at least", 0, 10, 0, key="xcodex_s")
+                max_ap = c2.number_input("AP at most", 0, 6, 0, key="xcodex_ap", help="2 = AP2 or AP1; 0 = any")
+                min_range = c3.number_input("Range at least", 0, 120, 0, key="xcodex_range")
+                rows = index.weapons(min_s=min_s or None, max_ap=max_ap or None, min_range=min_range or None,
+                                     name=name, codex=codex_filter)
+                table = [{"Weapon": w.name, "Codex": w.codex, "Range": w.range_text, "S": w.S_text, "AP": w.AP_text,
+                          "Type": w.type} for w in rows]
+            elif mode == "Units":
+                slot = st.selectbox("Slot", [""] + SLOTS, format_func=lambda s: s or "Any slot", key="xcodex_slot")
+                rule = st.text_input("Has rule", key="xcodex_rule", placeholder="e.g. Deep Strike")
+                lo, hi = st.slider("Points", 0, 500, (0, 500), step=5, key="xcodex_points")
+                rows = index.units(slot=slot, min_points=lo or None, max_points=hi if hi < 500 else None, rule=rule,
+                                   name=name, codex=codex_filter)
+                table = [{"Unit": u.name, "Codex": u.codex, "Slot": u.slot, "Points": u.points,
+                          "Rules": ", ".join(u.rules)} for u in rows]
+            else:
+                rows = index.rules(name=name, codex=codex_filter)
+                table = [{"Rule": r.name, "Codex": r.codex, "Units": ", ".join(r.units), "Summary": r.summary} for r in rows]
+            st.caption(f"{len(rows)} {mode.lower()} across {len(index.codexes)} codexes")
+            if table: st.dataframe(table, hide_index=True, use_container_width=True)
+
         st.divider()
         st.subheader("Project Tracker")
         with st.expander("Status"):
@@ -450,102 +519,154 @@ with st.sidebar:
             feedback_msg = st.text_area("Description")
             if st.form_submit_button("Report"):
                 if not feedback_title: st.error("Summary required.")
+                elif get_issue_tracker() is None: st.error("Feedback is not configured.")
                 else:
-                    try:
-                        token, owner, repo = st.secrets["github"]["token"], st.secrets["github"]["owner"], st.secrets["github"]["repo"]
-                        api_url = f"https://api.github.com/repos/{owner}/{repo}/issues"
-                        requests.post(api_url, json={"title": f"[{feedback_type}] {feedback_title}", "body": feedback_msg}, headers={"Authorization": f"token {token}"})
-                        st.success("Sent!")
-                    except Exception as e: st.error(f"Error: {e}")
+                    job = get_issue_tracker().submit(f"[{feedback_type}] {feedback_title}", feedback_msg)
+                    st.session_state.feedback_jobs = st.session_state.get("feedback_jobs", []) + [(feedback_title, job)]
+                    st.info("Queued, sending in the background.")
+        pending = []
+        for title, job in st.session_state.get("feedback_jobs", []):
+            if not job.done(): pending.append((title, job))
+            elif job.exception(): st.error(f"Could not send '{title}': {job.exception()}")
+            else: st.success(f"Sent '{title}'.")
+        st.session_state.feedback_jobs = pending
     else:
         st.info("🎲 Play Mode Active. Editing is disabled.")
         # Ensure points_limit is set in Play Mode
         points_limit = st.session_state.get("points_limit_input", 1500)
 
 # --- RENDER FUNCTIONS ---
-def render_play_mode_unit(entry, data, depth=0):
-    u = get_unit_by_id(entry["unit_id"])
-    if not u: return
-
+def render_play_mode_unit(r):
     # Indentation visual
-    indent = "&nbsp;" * (depth * 4)
-    prefix = "" if depth == 0 else "↳ "
-    
-    title_str = f"{u['name']}"
-    if entry.get("custom_name"): title_str = f"{entry['custom_name']} ({u['name']})"
-    if entry.get("size", 1) > 1: title_str += f" x{entry['size']}"
-    
+    indent = "&nbsp;" * (r.depth * 4)
+    prefix = "" if r.depth == 0 else "↳ "
+
+    title_str = r.title
+    if r.size > 1: title_str += f" x{r.size}"
+
     with st.container(border=True):
-        st.markdown(f"{indent}**{prefix}{title_str}** [{entry.get('calculated_cost', 0)} pts]")
-        
+        st.markdown(f"{indent}**{prefix}{title_str}** [{r.cost} pts]")
+
         # 1. Profiles (Main + Sub)
         all_profiles = []
-        
-        # Main Model
-        main_prof = u.get("profile", {})
-        if main_prof:
-            main_entry = {"Model": u.get("name", "Unit")}
-            main_entry.update(main_prof)
-            all_profiles.append(main_entry)
-            
-        # Sub Profiles (Exarchs, Sergeants, etc.)
-        subs = u.get("sub_profiles", {})
-        for sub_key, sub_data in subs.items():
-            sub_name = sub_data.get("name", sub_key.capitalize())
-            sub_entry = {"Model": sub_name}
-            sub_entry.update({k: v for k, v in sub_data.items() if k != "name"})
-            all_profiles.append(sub_entry)
+        for name, prof in r.all_profiles:
+            row = {"Model": r.unit.get("name", "Unit") if name == "Unit Profile" else name}
+            row.update({k: v for k, v in prof.items() if k != "name"})
+            all_profiles.append(row)
 
         if all_profiles:
             st.caption("Unit Profiles")
             st.dataframe(pd.DataFrame(all_profiles), hide_index=True, use_container_width=True)
-        
-        # 2. Gather All Active Items (Base + Selected)
-        active_items = list(u.get("wargear", [])) + list(u.get("special_rules", []))
-        if "selected" in entry:
-            for gid, picks in entry["selected"].items():
-                opt_def = next((o for o in u.get("options", []) if o.get("group_id") == gid), None)
-                if not opt_def: continue
-                for choice in opt_def.get("choices", []):
-                    qty = picks.count(choice["id"]) if isinstance(picks, list) else (1 if picks == choice["id"] else 0)
-                    if qty > 0:
-                        # Clean name to find definition (remove points cost string)
-                        clean = choice['name'].split(" (")[0]
-                        active_items.append(clean)
-        
-        # 3. Weapons Table
-        weapons_to_show = []
-        rules_to_show = []
-        
-        for item in active_items:
-            # Check Weapons
-            w_stats = data.get("weapons", {}).get(item)
-            if w_stats:
-                weapons_to_show.append({"Name": item, **w_stats})
-            # Check Rules/Wargear
-            elif item in data.get("rules", {}):
-                rules_to_show.append(f"**{item}:** {data['rules'][item].get('summary', '')}")
-            elif item in data.get("wargear", {}):
-                rules_to_show.append(f"**{item}:** {data['wargear'][item].get('summary', '')}")
-        
-        if weapons_to_show:
+
+        # 2. Weapons Table
+        if r.weapons:
             st.caption("Weapons")
-            st.dataframe(weapons_to_show, hide_index=True)
-            
-        if rules_to_show:
+            st.dataframe([{"Name": name, **stats} for name, stats in r.weapons], hide_index=True)
+
+        # 3. Rules & Wargear
+        if r.rules:
             st.caption("Rules & Wargear")
-            for r in rules_to_show:
-                st.markdown(f"- {r}")
+            for name, summary in r.rules:
+                st.markdown(f"- **{name}:** {summary}")
 
     # Render Children
-    children = [c for c in st.session_state.roster if c.get("parent_id") == entry["id"]]
-    for child in children:
-        render_play_mode_unit(child, data, depth + 1)
-
-def recursive_render_edit_unit(entry, depth=0):
-    u = get_unit_by_id(entry["unit_id"])
+    for child in r.children:
+        render_play_mode_unit(child)
+
+MATHHAMMER_METRICS = {"Average kills": ("kills", False), "Chance to kill": ("kills", True),
+                      "Average unsaved wounds": ("unsaved", False), "Average hits": ("hits", False)}
+
+def render_mathhammer(codex):
+    with st.expander("🎯 Mathhammer"):
+        if not HAVE_NUMPY:
+            st.caption("Install numpy to enable the mathhammer engine.")
+            return
+        c1, c2, c3, c4 = st.columns(4)
+        names = sorted(p.name for p in CODEX_DIR.glob("*.json"))
+        enemy_name = c1.selectbox("Target codex", names, key="mh_enemy")
+        bs = c2.number_input("Firer BS", 1, 10, 4, key="mh_bs")
+        models = c3.number_input("Models firing", 1, 20, 1, key="mh_models")
+        facing = c4.selectbox("Vehicle facing", ["Front", "Side", "Rear"], key="mh_facing")
+        c1, c2, c3 = st.columns(3)
+        cover = c1.select_slider("Cover save", ["None", "6+", "5+", "4+", "3+"], key="mh_cover")
+        close = c2.checkbox("Rapid fire at half range", key="mh_rf")
+        only_roster = c3.checkbox("Only weapons in this roster", value=True, key="mh_only")
+        enemy = load_codex(CODEX_DIR / enemy_name) if enemy_name else None
+        if not enemy: return
+
+        m = cross_matrix(codex, enemy, int(bs), int(models), facing, None if cover == "None" else int(cover[0]), close)
+        in_roster = get_resolved_roster().weapons
+        rows = [i for i, w in enumerate(m.weapons) if not only_roster or w.name in in_roster]
+        if not rows or not m.targets:
+            st.caption("No shooting weapons or target profiles to compare.")
+            return
+        metric = st.radio("Show", list(MATHHAMMER_METRICS), horizontal=True, key="mh_metric")
+        which, as_chance = MATHHAMMER_METRICS[metric]
+        values = m.p_kill() if as_chance else m.mean(which)
+        df = pd.DataFrame(values[rows], index=[m.weapons[i].label for i in rows], columns=[t.name for t in m.targets])
+        st.dataframe(df.round(2), use_container_width=True)
+
+        c1, c2 = st.columns(2)
+        wi = c1.selectbox("Weapon", rows, format_func=lambda i: m.weapons[i].label, key="mh_weapon")
+        ti = c2.selectbox("Target", range(len(m.targets)), format_func=lambda j: m.targets[j].name, key="mh_target")
+        pmf = getattr(m, which)[wi, ti]
+        last = max(1, int((pmf > 1e-4).nonzero()[0].max()))
+        st.caption(f"Distribution of {which} ({m.weapons[wi].label} vs {m.targets[ti].name})")
+        st.bar_chart(pd.DataFrame({"probability": pmf[:last + 1]}))
+
+def render_battle_simulator(codex):
+    with st.expander("⚔️ Battle Simulator"):
+        if not HAVE_NUMPY:
+            st.caption("Install numpy to enable the battle simulator.")
+            return
+        mine = get_resolved_roster().roots
+        if not mine:
+            st.caption("Add a unit to simulate.")
+            return
+        c1, c2, c3 = st.columns(3)
+        ai = c1.selectbox("Attacker", range(len(mine)), format_func=lambda i: mine[i].title, key="sim_attacker")
+        names = sorted(p.name for p in CODEX_DIR.glob("*.json"))
+        enemy = load_codex(CODEX_DIR / c2.selectbox("Defender codex", names, key="sim_enemy"))
+        if not enemy: return
+        units = [u for u in enemy.units if u.get("slot") != "Dedicated Transport"]
+        # Indices, not the units: widget values are deep-copied and codex units are read-only mappings
+        du = units[c3.selectbox("Defender", range(len(units)), format_func=lambda i: units[i]["name"], key="sim_defender")]
+        c1, c2, c3, c4 = st.columns(4)
+        size = c1.number_input("Defender size", du.get("min_size", 1), max(du.get("min_size", 1), du.get("max_size", 1)),
+                               du.get("default_size", 1), key=f"sim_size_{du['id']}")
+        trials = c2.select_slider("Trials", [10_000, 100_000, 1_000_000, 5_000_000], value=100_000, key="sim_trials")
+        cover = c3.select_slider("Cover save", ["None", "6+", "5+", "4+", "3+"], key="sim_cover")
+        seed = c4.number_input("Seed", 0, 2**31 - 1, 0, key="sim_seed")
+        close = st.checkbox("Rapid fire at half range", key="sim_rf")
+        if st.button("Run simulation", key="sim_run"):
+            target = resolve_roster([{"unit_id": du["id"], "size": int(size), "selected": {}}], enemy).roots[0]
+            try:
+                st.session_state.sim_result = simulate(side_from(mine[ai], codex), side_from(target, enemy), trials, int(seed),
+                                                       cover=None if cover == "None" else int(cover[0]),
+                                                       workers=SIM_WORKERS, rapid_fire_close=close)
+            except ValueError as e:
+                st.session_state.sim_result = None
+                st.warning(str(e))
+        res = st.session_state.get("sim_result")
+        if res:
+            cols = st.columns(len(OUTCOMES))
+            for col, name in zip(cols, OUTCOMES):
+                col.metric(name.replace("_", " ").capitalize(), f"{res.share(name):.1%}")
+            st.caption("Defender models removed")
+            st.bar_chart(pd.DataFrame({"trials": res.defender_losses / res.trials}))
+            st.caption("Attacker models removed")
+            st.bar_chart(pd.DataFrame({"trials": res.attacker_losses / res.trials}))
+            st.caption(f"{res.trials:,} trials in {res.elapsed:.2f}s ({res.trials_per_sec:,.0f}/s on {res.workers} workers)")
+
+def render_unit_card(entry_id, depth=0):
+    # Run as a keyed fragment: an edit reruns this card and PAGE_FRAGMENTS (see entry_edited),
+    # not the whole page. Adding or removing units changes the page layout, so those rerun the app.
+    roster = st.session_state.roster
+    entry = roster.get(entry_id)
+    u = get_unit_by_id(entry["unit_id"]) if entry else None
     if not u: return
-    
+    roster.refresh()
+
     if depth > 0:
         st.markdown(f"&nbsp;&nbsp;&nbsp;&nbsp;" * depth + f"↳ **{u['name']}**")
     
@@ -558,7 +679,7 @@ def recursive_render_edit_unit(entry, depth=0):
     is_expanded = (entry['id'] == st.session_state.get('active_unit_id'))
 
     with st.expander(display_title, expanded=is_expanded):
-        render_unit_options(entry, u, data)
+        render_unit_options(entry, u, get_codex())
         
         valid_transports = u.get("dedicated_transports", [])
         if valid_transports:
@@ -570,32 +691,21 @@ def recursive_render_edit_unit(entry, depth=0):
             if cols[1].button("Add", key=f"add_trans_{entry['id']}"):
                 tid = next(t["id"] for t in t_opts if t["name"] == sel_t)
                 child_entry = {"id": str(uuid.uuid4()), "unit_id": tid, "size": int(get_unit_by_id(tid).get("default_size", 1)), "selected": {}, "parent_id": entry["id"]}
-                st.session_state.roster.append(child_entry)
+                st.session_state.roster.add(child_entry)
                 st.rerun()
         st.divider()
         
         if st.button(f"Remove {u['name']}", key=f"del_{entry['id']}", type="primary" if depth==0 else "secondary"):
-            ids_to_remove = [entry["id"]]
-            def find_kids(eid):
-                kids = [c for c in st.session_state.roster if c.get("parent_id") == eid]
-                for k in kids:
-                    ids_to_remove.append(k["id"])
-                    find_kids(k["id"])
-            find_kids(entry["id"])
-            st.session_state.roster = [e for e in st.session_state.roster if e["id"] not in ids_to_remove]
+            st.session_state.roster.remove(entry["id"])
             st.rerun()
 
-    children = [e for e in st.session_state.roster if e.get("parent_id") == entry["id"]]
-    for child in children:
+def recursive_render_edit_unit(entry, depth=0):
+    st.fragment(render_unit_card, key=card_key(entry["id"]))(entry["id"], depth)
+    for child in st.session_state.roster.children(entry):
         recursive_render_edit_unit(child, depth + 1)
 
-# --- MAIN PAGE ---
-if "codex_data" in st.session_state and st.session_state.codex_data:
-    data = st.session_state.codex_data
-    st.title(f"{st.session_state.roster_name}")
-    st.caption(f"Using: {data.get('codex_name', 'Army')}")
-    
-    # --- VALIDATOR & METRICS ---
+@st.fragment(key="roster_totals")
+def render_roster_metrics(points_limit, play_mode):
     curr_pts, slots = calculate_roster()
     issues = validate_roster(points_limit, curr_pts, slots)
     
@@ -613,17 +723,7 @@ if "codex_data" in st.session_state and st.session_state.codex_data:
 
     # 2. POINTS BREAKDOWN
     if curr_pts > 0 and not play_mode:
-        breakdown = {}
-        for entry in st.session_state.roster:
-            u = get_unit_by_id(entry["unit_id"])
-            if not u: continue
-            slot = u["slot"]
-            if entry.get("parent_id"):
-                parent = next((p for p in st.session_state.roster if p["id"] == entry["parent_id"]), None)
-                if parent:
-                    pu = get_unit_by_id(parent["unit_id"])
-                    if pu: slot = pu["slot"]
-            breakdown[slot] = breakdown.get(slot, 0) + entry.get("calculated_cost", 0)
+        breakdown = st.session_state.roster.breakdown
         
         st.caption("Investment Breakdown")
         cols = st.columns(len(breakdown))
@@ -631,37 +731,76 @@ if "codex_data" in st.session_state and st.session_state.codex_data:
             pct = int((pts / curr_pts) * 100)
             cols[i].write(f"**{slot}**: {pct}%")
             cols[i].progress(pct / 100)
+
+@st.fragment(key="fill_list")
+def render_fill_list(codex, points_limit):
+    remaining = points_limit - st.session_state.roster.total
+    if remaining <= 0: return
+    fits = suggest(st.session_state.roster, codex, points_limit, limit=15)
+    with st.expander(f"💡 Fill remaining {remaining:g} pts"):
+        if not fits: st.caption("Nothing fits in the remaining points.")
+        for i, s in enumerate(fits):
+            c1, c2 = st.columns([4, 1])
+            kind = {"unit": "New", "size": "Models", "option": "Upgrade", "transport": "Transport"}[s.kind]
+            c1.markdown(f"**{kind}** · {s.label} (+{s.cost:g} pts)")
+            if c2.button("Add", key=f"fill_{i}_{s.kind}_{s.entry_id}_{s.label}"):
+                apply_suggestion(st.session_state.roster, s)
+                st.rerun()
+
+# --- MAIN PAGE ---
+if "codex_data" in st.session_state and st.session_state.codex_data:
+    data = st.session_state.codex_data
+    codex = get_codex()
+    st.title(f"{st.session_state.roster_name}")
+    st.caption(f"Using: {codex.name}")
     
+    # --- VALIDATOR & METRICS ---
+    render_roster_metrics(points_limit, play_mode)
     st.divider()
 
     st.header(f"Current Roster ({len(st.session_state.roster)} Units)")
-    parents = [e for e in st.session_state.roster if not e.get("parent_id")]
+    parents = st.session_state.roster.roots()
     
     if not parents: st.info("Your roster is empty. Add a unit below!")
     else:
-        for entry in parents:
-            if play_mode:
-                render_play_mode_unit(entry, data, depth=0)
-            else:
+        if play_mode:
+            for r in get_resolved_roster().roots:
+                render_play_mode_unit(r)
+            render_mathhammer(codex)
+            render_battle_simulator(codex)
+        else:
+            for entry in parents:
                 recursive_render_edit_unit(entry, depth=0)
 
     if not play_mode:
         st.divider()
         st.subheader("Add New Unit")
+        query = st.text_input("🔎 Search units, weapons, rules and wargear", key="unit_search", placeholder="e.g. melta, fleet, psychic hood")
+        if query.strip():
+            hits = [h for h in codex.search.query(query.strip(), 50) if codex.unit_slot(h.unit_id) != "Dedicated Transport"]
+            if not hits: st.caption("No matches.")
+            for h in hits[:12]:
+                unit_def = codex.unit(h.unit_id)
+                c1, c2 = st.columns([4, 1])
+                c1.markdown(f"**{unit_def.get('name')}** · {unit_def.get('slot')}" + (f"  \n:gray[{h.reason}]" if h.reason else ""))
+                if c2.button("Add", key=f"search_add_{h.unit_id}"):
+                    st.session_state.roster.add({"id": str(uuid.uuid4()), "unit_id": h.unit_id, "size": int(unit_def.get("default_size", 1)), "selected": {}, "parent_id": None})
+                    st.rerun()
         slots_map = ["HQ", "Troops", "Elites", "Fast Attack", "Heavy Support"]
         selected_slot = st.radio("Force Organisation Slot", slots_map, horizontal=True, label_visibility="collapsed", key="add_unit_slot_selection")
         
-        slot_units = [u for u in data.get("units", []) if u.get("slot") == selected_slot]
-        slot_units.sort(key=lambda x: x["name"])
+        slot_units = codex.units_in_slot(selected_slot)
         
         if not slot_units: st.caption(f"No units found for {selected_slot}")
         else:
             unit_options = [u["name"] for u in slot_units]
             selected_unit_name = st.selectbox(f"Select {selected_slot} Unit", unit_options, key=f"sel_unit_{selected_slot}")
             if st.button(f"Add {selected_unit_name}", key=f"btn_add_{selected_slot}"):
-                uid = next(u["id"] for u in slot_units if u["name"] == selected_unit_name)
-                unit_def = get_unit_by_id(uid)
+                unit_def = slot_units[unit_options.index(selected_unit_name)]
+                uid = unit_def["id"]
                 new_entry = {"id": str(uuid.uuid4()), "unit_id": uid, "size": int(unit_def.get("default_size", 1)), "selected": {}, "parent_id": None}
-                st.session_state.roster.append(new_entry)
+                st.session_state.roster.add(new_entry)
                 st.rerun()
+
+        render_fill_list(codex, points_limit)
 else: st.info("⬅️ Please select a Codex from the sidebar to begin.")
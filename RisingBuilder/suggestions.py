@@ -0,0 +1,146 @@
+"""
+"What fits in my remaining points": new units (any legal size, with or
+without one optional upgrade) and upgrades to entries already in the roster
+whose cost fits the budget without breaking force-org limits.
+
+New-unit candidates come from a per-codex index sorted by cost, built once,
+so a query is a bisect plus a walk over the candidates that fit.
+"""
+import bisect
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from constants import FORCE_ORG_LIMITS_5E
+from points import entry_cost, mandatory_picks
+
+@dataclass(frozen=True)
+class Suggestion:
+    kind: str                 # "unit", "size", "option" or "transport"
+    cost: float               # points added to the roster
+    label: str
+    unit_id: str
+    size: int = 1
+    selected: Tuple[Tuple[str, Tuple[str, ...]], ...] = ()
+    entry_id: Optional[str] = None   # entry the upgrade applies to (parent, for transports)
+    group_id: Optional[str] = None
+    choice_id: Optional[str] = None
+
+@dataclass
+class CostIndex:
+    """Every new-unit candidate of a codex, sorted by cost."""
+    costs: List[float] = field(default_factory=list)
+    candidates: List[Suggestion] = field(default_factory=list)
+
+def _selected(sel: Dict[str, List[str]]):
+    return tuple((g, tuple(p)) for g, p in sel.items())
+
+@lru_cache(maxsize=16)
+def cost_index(codex) -> CostIndex:
+    """Built once per Codex object; a reloaded or re-saved codex gets a new one."""
+    rows = []
+    for u in codex.units:
+        if u.get("slot") not in FORCE_ORG_LIMITS_5E: continue
+        cu = codex.compiled(u["id"])
+        if cu is None: continue
+        lo = u.get("min_size", 1)
+        for size in range(lo, max(lo, u.get("max_size", 1)) + 1):
+            sel = mandatory_picks(u, size, cu)
+            base = entry_cost({"size": size, "selected": sel}, cu)
+            name = u.get("name", u["id"]) + (f" x{size}" if size > 1 else "")
+            rows.append(Suggestion("unit", base, name, u["id"], size, _selected(sel)))
+            for g in u.get("options", []):
+                most = size if g.get("linked_to_size") else g.get("max_select", 1)
+                taken = sel.get(g.get("group_id"), [])
+                if len(taken) >= most: continue
+                for c in g.get("choices", []):
+                    if c.get("id") in taken and not (g.get("linked_to_size") or len(g.get("choices", [])) == 1): continue
+                    with_pick = dict(sel)
+                    with_pick[g["group_id"]] = taken + [c["id"]]
+                    cost = entry_cost({"size": size, "selected": with_pick}, cu)
+                    rows.append(Suggestion("unit", cost, f"{name} + {c.get('name', c['id'])}", u["id"], size,
+                                           _selected(with_pick)))
+    rows.sort(key=lambda s: s.cost)
+    return CostIndex([s.cost for s in rows], rows)
+
+def _upgrades(roster, codex, budget) -> List[Suggestion]:
+    out = []
+    for entry in roster:
+        u = codex.unit(entry.get("unit_id"))
+        cu = codex.compiled(entry.get("unit_id"))
+        if not u or cu is None: continue
+        size = entry.get("size", 1)
+        current = roster.cost(entry["id"])
+        title = entry.get("custom_name") or u.get("name", "")
+        # Larger unit
+        for extra in range(1, u.get("max_size", 1) - size + 1):
+            delta = entry_cost({**entry, "size": size + extra}, cu) - current
+            if delta > budget: break
+            out.append(Suggestion("size", delta, f"{title}: +{extra} model{'s' if extra > 1 else ''}",
+                                  u["id"], size + extra, entry_id=entry["id"]))
+        # One more pick in an option group
+        selected = entry.get("selected", {})
+        for g in u.get("options", []):
+            gid = g.get("group_id")
+            picks = selected.get(gid, [])
+            picks = picks if isinstance(picks, list) else [picks]
+            most = size if g.get("linked_to_size") else g.get("max_select", 1)
+            if len(picks) >= most: continue
+            repeatable = g.get("linked_to_size") or len(g.get("choices", [])) == 1
+            for c in g.get("choices", []):
+                if c.get("id") in picks and not repeatable: continue
+                delta = entry_cost({**entry, "selected": {**selected, gid: picks + [c["id"]]}}, cu) - current
+                if 0 < delta <= budget:
+                    out.append(Suggestion("option", delta, f"{title}: {c.get('name', c['id'])}", u["id"], size,
+                                          entry_id=entry["id"], group_id=gid, choice_id=c["id"]))
+        # Dedicated transport for a unit that has none attached yet
+        if not entry.get("parent_id") and u.get("dedicated_transports"):
+            attached = {c.get("unit_id") for c in roster.children(entry)}
+            if attached & set(u["dedicated_transports"]): continue
+            for tid in u["dedicated_transports"]:
+                t, tcu = codex.unit(tid), codex.compiled(tid)
+                if not t or tcu is None: continue
+                tsize = t.get("min_size", 1)
+                sel = mandatory_picks(t, tsize, tcu)
+                cost = entry_cost({"size": tsize, "selected": sel}, tcu)
+                if cost <= budget:
+                    out.append(Suggestion("transport", cost, f"{title}: {t.get('name', tid)}", tid, tsize,
+                                          _selected(sel), entry_id=entry["id"]))
+    return out
+
+def suggest(roster, codex, points_limit, limit: int = 50, kinds=("unit", "size", "option", "transport")) -> List[Suggestion]:
+    """Additions that fit the remaining points, closest to filling them first."""
+    roster.bind(codex)
+    roster.refresh()
+    budget = points_limit - roster.total
+    if budget <= 0: return []
+    out: List[Suggestion] = []
+    if "unit" in kinds:
+        idx = cost_index(codex)
+        full = {s for s, (_, hi) in FORCE_ORG_LIMITS_5E.items() if roster.slot_counts.get(s, 0) >= hi}
+        taken = {name for name, n in roster.unique_counts.items() if n > 0}
+        # Walk down from the most expensive candidate that still fits
+        for i in range(bisect.bisect_right(idx.costs, budget) - 1, -1, -1):
+            s = idx.candidates[i]
+            u = codex.unit(s.unit_id)
+            if u.get("slot") in full or (u.get("unique") and u.get("name") in taken): continue
+            out.append(s)
+            if len(out) >= limit: break
+    out.extend(s for s in _upgrades(roster, codex, budget) if s.kind in kinds)
+    out.sort(key=lambda s: -s.cost)
+    return out[:limit]
+
+def apply_suggestion(roster, suggestion: Suggestion) -> Dict[str, Any]:
+    """Applies a suggestion to the roster; returns the added or changed entry."""
+    s = suggestion
+    if s.kind in ("unit", "transport"):
+        return roster.add({"unit_id": s.unit_id, "size": s.size, "selected": {g: list(p) for g, p in s.selected},
+                           "parent_id": s.entry_id if s.kind == "transport" else None})
+    entry = roster.get(s.entry_id)
+    if s.kind == "size":
+        entry["size"] = s.size
+    else:
+        picks = entry.setdefault("selected", {}).get(s.group_id, [])
+        entry["selected"][s.group_id] = (picks if isinstance(picks, list) else [picks]) + [s.choice_id]
+    roster.touch(entry["id"])
+    return entry
\ No newline at end of file
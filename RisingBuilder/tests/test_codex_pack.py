@@ -0,0 +1,43 @@
+import copy
+import json
+from pathlib import Path
+
+import pytest
+
+from codex import thaw
+from codex_pack import build_pack, load_pack
+
+CODEXES = sorted((Path(__file__).resolve().parent.parent / "codexes").glob("*.json"))
+
+def round_trip(data, tmp_path):
+    path = tmp_path / "codex.rbpack"
+    path.write_bytes(build_pack(data))
+    return thaw(load_pack(path))
+
+@pytest.mark.parametrize("path", CODEXES, ids=lambda p: p.stem)
+def test_codex_files_round_trip(path, tmp_path):
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert round_trip(data, tmp_path) == data
+
+def test_irregular_unit_values_round_trip(tmp_path):
+    data = json.loads(CODEXES[0].read_text(encoding="utf-8"))
+    unit = copy.deepcopy(data["units"][0])
+    unit.update({
+        "id": "irregular",
+        "wargear": ["Frag Grenades", {"name": "Bolt Pistol", "count": 2}],
+        "special_rules": "Fearless",
+        "dedicated_transports": None,
+        "options_text": [1, 2],
+        "profile": ["WS4", "BS4"],
+        "sub_profiles": {"Sergeant": "as above"},
+        "options": [{"group_id": "g", "group_name": "Upgrades", "choices": "see page 12"},
+                    {"group_id": "h", "group_name": "Gear", "choices": [{"id": "c", "name": "Melta Bombs", "points": 5}]}],
+    })
+    data["units"].append(unit)
+    decoded = round_trip(data, tmp_path)
+    assert decoded == data
+    assert list(decoded["units"][-1]) == list(unit)
+
+def test_options_that_are_not_groups_round_trip(tmp_path):
+    data = {"codex_name": "Test", "units": [{"id": "u", "name": "U", "options": ["Bolter", "Chainsword"]}]}
+    assert round_trip(data, tmp_path) == data
\ No newline at end of file
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from issue_tracker import IssueTracker
+
+class FakeGitHub(ThreadingHTTPServer):
+    """GitHub issues endpoint on an ephemeral port; `gate` holds every response until it is set."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.gate = threading.Event()
+        self.gate.set()
+        self.gets = 0
+        self.posts = 0
+        self.issues = [{"number": 1, "title": "first"}]
+        self.status = 200
+        self.headers = {}
+        self.drop = False   # close the connection without answering
+
+    @property
+    def root(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body):
+        self.server.gate.wait(10)
+        if self.server.drop:
+            self.close_connection = True
+            return
+        data = json.dumps(body).encode()
+        self.send_response(self.server.status)
+        for k, v in self.server.headers.items(): self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.server.gets += 1
+        self.reply(self.server.issues)
+
+    def do_POST(self):
+        self.server.posts += 1
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.reply({"number": 2, **body})
+
+@pytest.fixture
+def github():
+    server = FakeGitHub()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.gate.set()
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def make_tracker(github):
+    made = []
+    def make(**kw):
+        t = IssueTracker("owner", "repo", "token", api_root=github.root, **kw)
+        made.append(t)
+        return t
+    yield make
+    github.gate.set()
+    for t in made: t.close()
+
+def settle(tracker):
+    """Waits for the background refresh, if any, to finish."""
+    worker = tracker._refreshing
+    if worker is not None: worker.join(5)
+
+def test_first_call_does_not_block(github, make_tracker):
+    t = make_tracker()
+    github.gate.clear()
+    start = time.perf_counter()
+    assert t.issues() == []
+    assert time.perf_counter() - start < 0.5
+    github.gate.set()
+    assert t.issues(wait=5) == github.issues
+
+def test_rapid_calls_make_one_request(github, make_tracker):
+    t = make_tracker()
+    github.gate.clear()
+    for _ in range(20): t.issues()
+    github.gate.set()
+    settle(t)
+    for _ in range(20): t.issues()
+    assert github.gets == 1
+    assert t.issues() == github.issues
+
+def test_stale_value_served_during_refresh(github, make_tracker):
+    t = make_tracker(ttl=0.0)
+    old = github.issues
+    assert t.issues(wait=5) == old
+    github.issues = [{"number": 3, "title": "newer"}]
+    github.gate.clear()
+    start = time.perf_counter()
+    assert t.issues() == old
+    assert time.perf_counter() - start < 0.5
+    github.gate.set()
+    settle(t)
+    assert t.issues() == github.issues
+
+def test_submit_does_not_block(github, make_tracker):
+    t = make_tracker()
+    github.gate.clear()
+    start = time.perf_counter()
+    future = t.submit("Bug", "details")
+    assert time.perf_counter() - start < 0.5
+    assert not future.done()
+    github.gate.set()
+    assert future.result(5) == {"number": 2, "title": "Bug", "body": "details"}
+    assert github.posts == 1
+
+def test_rate_limit_holds_off_refreshes(github, make_tracker):
+    t = make_tracker(ttl=0.0, retry_after=0.0)
+    github.status = 403
+    github.headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()) + 60)}
+    assert t.issues(wait=5) == []
+    assert t.error == "GitHub returned 403"
+    t.invalidate()
+    for _ in range(5): t.issues()
+    assert t._refreshing is None
+    assert github.gets == 1
+
+def test_offline_backs_off(github, make_tracker):
+    t = make_tracker(retry_after=60.0)
+    github.drop = True
+    assert t.issues(wait=5) == []
+    assert t.error
+    for _ in range(5): t.issues()
+    assert t._refreshing is None
+    assert github.gets == 1
+    assert t.age is None
\ No newline at end of file
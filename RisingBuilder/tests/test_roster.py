@@ -0,0 +1,103 @@
+import copy
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+from codex import Codex
+from constants import FORCE_ORG_LIMITS_5E
+from points import entry_cost
+from roster import Roster
+
+CODEXES = sorted((Path(__file__).resolve().parent.parent / "codexes").glob("*.json"))
+
+def full_recost(roster, codex):
+    """Totals recomputed from scratch for every entry."""
+    costs, slots, unique = {}, {k: 0 for k in FORCE_ORG_LIMITS_5E}, {}
+    for e in roster:
+        u, cu = codex.unit(e["unit_id"]), codex.compiled(e["unit_id"])
+        if u is None: continue
+        costs[e["id"]] = entry_cost(e, cu)
+        if not e.get("parent_id") and u.get("slot") in slots: slots[u["slot"]] += 1
+        if u.get("unique"): unique[u["name"]] = unique.get(u["name"], 0) + 1
+    return costs, slots, unique
+
+def check(roster, codex):
+    roster.refresh()
+    costs, slots, unique = full_recost(roster, codex)
+    assert roster.total == pytest.approx(sum(costs.values()))
+    assert roster.slot_counts == slots
+    assert {k: v for k, v in roster.unique_counts.items() if v} == unique
+    for e in roster:
+        assert roster.cost(e["id"]) == pytest.approx(costs.get(e["id"], 0))
+        assert roster.subtree_cost(e["id"]) == pytest.approx(sum(costs.get(x["id"], 0) for x, _ in roster.walk(e)))
+
+def random_picks(rng, unit, size):
+    selected = {}
+    for g in unit.get("options", []):
+        choices = g.get("choices", [])
+        if not choices: continue
+        most = size if g.get("linked_to_size") else g.get("max_select", 1)
+        selected[g["group_id"]] = [rng.choice(choices)["id"] for _ in range(rng.randint(0, most))]
+    return selected
+
+def random_entry(rng, codex, parent=None):
+    if parent is not None:
+        tid = rng.choice(codex.unit(parent["unit_id"]).get("dedicated_transports") or [None])
+        u = codex.unit(tid) if tid else None
+        if u is None: return None
+    else:
+        u = rng.choice(codex.units)
+    size = rng.randint(u.get("min_size", 1), max(u.get("min_size", 1), u.get("max_size", 1)))
+    return {"unit_id": u["id"], "size": size, "selected": random_picks(rng, u, size),
+            "parent_id": parent["id"] if parent else None}
+
+@pytest.mark.parametrize("path", CODEXES, ids=lambda p: p.stem)
+def test_incremental_totals_match_a_full_recost(path):
+    rng = random.Random(path.stem)
+    data = json.loads(path.read_text(encoding="utf-8"))
+    codex = Codex(data)
+    roster = Roster(codex=codex)
+    for step in range(300):
+        op = rng.random()
+        entries = roster.entries
+        if op < 0.35 or not entries:
+            parent = rng.choice(entries) if entries and rng.random() < 0.3 else None
+            e = random_entry(rng, codex, parent)
+            if e is not None: roster.add(e)
+        elif op < 0.75:
+            e = rng.choice(entries)
+            u = codex.unit(e["unit_id"])
+            e["size"] = rng.randint(u.get("min_size", 1), max(u.get("min_size", 1), u.get("max_size", 1)) + 1)
+            e["selected"] = random_picks(rng, u, e["size"])
+            roster.touch(e["id"])
+        elif op < 0.95:
+            roster.remove(rng.choice(entries)["id"])
+        else:
+            # A new codex version with every price changed recosts everything on bind
+            data = copy.deepcopy(data)
+            for u in data["units"]:
+                u["base_points"] = u.get("base_points", 0) + rng.randint(1, 20)
+            codex = Codex(data)
+            roster.bind(codex)
+        check(roster, codex)
+
+def test_touch_only_recosts_the_touched_entry():
+    codex = Codex(json.loads(CODEXES[0].read_text(encoding="utf-8")))
+    roster = Roster([{"unit_id": u["id"], "size": u.get("min_size", 1)} for u in codex.units[:10]], codex)
+    assert roster.refresh() == 10
+    roster.touch(roster.entries[3]["id"])
+    assert roster.refresh() == 1
+    assert roster.refresh() == 0
+    check(roster, codex)
+
+def test_replaced_roster_never_repeats_a_revision():
+    old = Roster([{"unit_id": "a"}, {"unit_id": "b"}])
+    new = Roster([{"unit_id": "c"}, {"unit_id": "d"}])
+    assert new.revision != old.revision
+    seen = {old.revision, new.revision}
+    for r in (old, new):
+        r.touch(r.entries[0]["id"])
+        assert r.revision not in seen
+        seen.add(r.revision)
\ No newline at end of file
@@ -0,0 +1,34 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from codex import Codex
+from mathhammer import cross_matrix
+from simulator import OUTCOMES, SHARD_TRIALS, Attack, Side, simulate
+
+MARINES = Side("Marines", 10, BS=4, Sv=3, shooting=(Attack("Bolter", 10, 4, 5, "RF"),))
+BOYZ = Side("Boyz", 30, WS=4, S=3, T=4, Sv=6, A=2)
+
+def test_fixed_seed_gives_the_same_histograms_for_any_worker_count():
+    trials = 2 * SHARD_TRIALS + 12_345   # three shards, the last one short
+    one = simulate(MARINES, BOYZ, trials, seed=7, workers=1)
+    two = simulate(MARINES, BOYZ, trials, seed=7, workers=2)
+    assert two.workers == 2
+    assert np.array_equal(one.defender_losses, two.defender_losses)
+    assert np.array_equal(one.attacker_losses, two.attacker_losses)
+    assert one.outcomes == two.outcomes
+    assert sum(one.outcomes[k] for k in OUTCOMES) == trials
+    other = simulate(MARINES, BOYZ, trials, seed=8, workers=1)
+    assert not np.array_equal(one.defender_losses, other.defender_losses)
+
+@pytest.mark.parametrize("close", [False, True])
+def test_shooting_mean_matches_mathhammer(close):
+    attacker = Codex({"codex_name": "A", "units": [],
+                      "weapons": {"Bolter": {"range": "24\"", "S": "4", "AP": "5", "type": "Rapid Fire"}}})
+    defender = Codex({"codex_name": "B", "units": [
+        {"id": "boyz", "name": "Boyz", "slot": "Troops", "profile": {"T": "4", "W": "1", "Sv": "6+"}}]})
+    expected = cross_matrix(attacker, defender, bs=4, models=10, rapid_fire_close=close).mean("kills")[0, 0]
+
+    res = simulate(MARINES, BOYZ, 200_000, seed=1, workers=1, rapid_fire_close=close, assault=False)
+    mean = (res.defender_losses * np.arange(len(res.defender_losses))).sum() / res.trials
+    assert mean == pytest.approx(expected, abs=0.02)
\ No newline at end of file
@@ -0,0 +1,74 @@
+import json
+from collections import Counter
+from itertools import product
+from pathlib import Path
+
+import pytest
+
+from codex import Codex
+from constants import FORCE_ORG_LIMITS_5E
+from roster import Roster
+from solver import solve
+
+CODEXES = sorted((Path(__file__).resolve().parent.parent / "codexes").glob("*.json"))
+
+def unit(uid, slot, points, **kw):
+    return {"id": uid, "name": uid, "slot": slot, "base_points": points, "min_size": 1, "max_size": 1, **kw}
+
+def check_legal(sol, codex, limit):
+    roster = Roster(sol.to_entries(), codex)
+    roster.refresh()
+    assert roster.total == sol.cost <= limit
+    for slot, (lo, hi) in FORCE_ORG_LIMITS_5E.items():
+        assert lo <= roster.slot_counts[slot] <= hi
+    assert all(n == 1 for n in roster.unique_counts.values())
+    for e in roster:
+        u = codex.unit(e["unit_id"])
+        assert u.get("min_size", 1) <= e["size"] <= max(u.get("min_size", 1), u.get("max_size", 1))
+        for g in u.get("options", []):
+            if g.get("choices"):
+                most = e["size"] if g.get("linked_to_size") else g.get("max_select", 1)
+                assert len(e["selected"].get(g["group_id"], [])) >= min(g.get("min_select", 0), most)
+
+@pytest.mark.parametrize("objective", ["models", "scoring"])
+@pytest.mark.parametrize("path", CODEXES, ids=lambda p: p.stem)
+def test_solutions_are_legal_and_ranked(path, objective):
+    codex = Codex(json.loads(path.read_text(encoding="utf-8")))
+    result = solve(codex, 1500, objective, top_n=3, time_budget=30)
+    assert result.complete and result.solutions
+    for sol in result.solutions: check_legal(sol, codex, 1500)
+    ranks = [(-s.value, -s.cost) for s in result.solutions]
+    assert ranks == sorted(ranks)
+
+def best_by_brute_force(codex, limit):
+    """(troops, points) of the best scoring list, trying every count of every single-model unit."""
+    units = [u for u in codex.units]
+    best = None
+    for counts in product(*(range(FORCE_ORG_LIMITS_5E[u["slot"]][1] + 1) for u in units)):
+        per_slot = Counter()
+        for u, n in zip(units, counts): per_slot[u["slot"]] += n
+        if any(not lo <= per_slot[s] <= hi for s, (lo, hi) in FORCE_ORG_LIMITS_5E.items()): continue
+        cost = sum(u["base_points"] * n for u, n in zip(units, counts))
+        if cost <= limit: best = max(best or (0, 0), (per_slot["Troops"], cost))
+    return best
+
+def test_ties_are_broken_by_points_spent():
+    # Many lists reach the most Troops; the best of them spends the most points
+    codex = Codex({"codex_name": "Test", "units": [
+        unit("hq", "HQ", 45), unit("big_hq", "HQ", 120),
+        unit("squad", "Troops", 95), unit("big_squad", "Troops", 110),
+        unit("elite", "Elites", 70),
+    ]})
+    for limit in (400, 555, 700):
+        best = solve(codex, limit, "scoring", top_n=1).solutions[0]
+        assert (best.value, best.cost) == best_by_brute_force(codex, limit)
+        check_legal(best, codex, limit)
+
+def test_unique_units_are_taken_once():
+    codex = Codex({"codex_name": "Test", "units": [
+        unit("lord", "HQ", 10, unique=True), unit("hq", "HQ", 200),
+        unit("squad", "Troops", 10, min_size=1, max_size=10, base_points=0, points_per_model=10),
+    ]})
+    for sol in solve(codex, 300, "models", top_n=5).solutions:
+        check_legal(sol, codex, 300)
+        assert sum(c.unit_id == "lord" for c in sol.configs) <= 1
\ No newline at end of file
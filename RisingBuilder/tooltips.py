@@ -0,0 +1,71 @@
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Section order matters: matches are reported weapons first, then wargear, then rules
+TOOLTIP_SECTIONS = ("weapons", "wargear", "rules")
+
+Match = Tuple[str, str, Dict[str, Any]]  # (section, name, definition)
+
+class AhoCorasick:
+    """Multi-pattern substring matcher: one pass over the text finds every pattern it contains."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self.patterns: List[str] = []
+
+        for pid, pat in enumerate(patterns):
+            self.patterns.append(pat)
+            if not pat: continue
+            node = 0
+            for ch in pat:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({}); self._fail.append(0); self._out.append([])
+                node = nxt
+            self._out[node].append(pid)
+
+        # Breadth-first failure links; outputs are merged along them
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def search(self, text: str) -> List[int]:
+        """Returns the ids of all patterns occurring in text, in first-seen order."""
+        found: Dict[int, None] = {}
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pid in out[node]:
+                found[pid] = None
+        return list(found)
+
+class TooltipIndex:
+    """Case-insensitive lookup of every weapon/wargear/rule whose name appears in an option label."""
+
+    def __init__(self, codex_data: Dict[str, Any], cache_size: int = 4096):
+        # Definitions are looked up on match, so lazily decoded sections stay undecoded
+        self._sections = {s: codex_data.get(s) or {} for s in TOOLTIP_SECTIONS}
+        self._defs: List[Tuple[str, str]] = [(s, name) for s in TOOLTIP_SECTIONS for name in self._sections[s]]
+        self._matcher = AhoCorasick(name.lower() for _, name in self._defs)
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, label: str) -> Tuple[Match, ...]:
+        if not label: return ()
+        hits = (self._defs[i] for i in sorted(self._matcher.search(label.lower())))
+        return tuple((s, name, self._sections[s][name]) for s, name in hits)
@@ -1,3 +1,4 @@
+import time
 from typing import Any, Dict, List, Optional, Tuple, Set
 from PySide6.QtCore import Qt
 from PySide6.QtWidgets import (
@@ -5,11 +6,14 @@ from PySide6.QtWidgets import (
     QComboBox, QTextEdit, QDialogButtonBox, QMessageBox, 
     QGroupBox, QScrollArea, QWidget, QGridLayout, QLabel, 
     QHBoxLayout, QListWidget, QListWidgetItem, QCheckBox, 
-    QStackedWidget, QPushButton, QSplitter
+    QStackedWidget, QPushButton, QSplitter, QProgressBar, QTableWidget,
+    QTableWidgetItem, QApplication
 )
 
 from utils import unique_id, slugify, lines_to_list, list_to_lines
 from constants import SLOTS, POINTS_MODES, PROFILE_TYPES
+from search import FuzzyMatcher
+from solver import OBJECTIVES, describe, solve
 
 class OptionGroupDialog(QDialog):
     def __init__(self, parent=None):
@@ -159,6 +163,273 @@ class DedicatedTransportPicker(QDialog):
     def selected_id(self) -> Optional[str]:
         return self._selected_id
 
+class ListOptimiserDialog(QDialog):
+    """Searches for the best legal rosters under the points limit; accept() with a result picked to use it."""
+    def __init__(self, parent=None, codex=None, points_limit: int = 1500):
+        super().__init__(parent)
+        self.setWindowTitle(f"Optimise List ({points_limit} pts)")
+        self.setSizeGripEnabled(True)
+        self.resize(640, 620)
+        self._codex = codex
+        self._points_limit = points_limit
+        self._solutions = []
+        self._cancelled = False
+
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+        self.objective = QComboBox()
+        for key, label in OBJECTIVES.items(): self.objective.addItem(label, key)
+        self.objective.currentIndexChanged.connect(self._on_objective_changed)
+        self.top_n = QSpinBox(); self.top_n.setRange(1, 20); self.top_n.setValue(5)
+        self.budget = QSpinBox(); self.budget.setRange(1, 120); self.budget.setValue(5); self.budget.setSuffix(" s")
+        form.addRow("Maximise", self.objective)
+        form.addRow("Lists to keep", self.top_n)
+        form.addRow("Time budget", self.budget)
+        layout.addLayout(form)
+
+        self.weights = QTableWidget(0, 2)
+        self.weights.setHorizontalHeaderLabels(["Unit", "Weight"])
+        self.weights.horizontalHeader().setStretchLastSection(True)
+        for u in codex.units if codex else ():
+            if u.get("slot") == "Dedicated Transport": continue
+            row = self.weights.rowCount()
+            self.weights.insertRow(row)
+            name = QTableWidgetItem(u.get("name", "Unnamed"))
+            name.setData(Qt.UserRole, u.get("id"))
+            name.setFlags(name.flags() & ~Qt.ItemIsEditable)
+            self.weights.setItem(row, 0, name)
+            self.weights.setItem(row, 1, QTableWidgetItem("0"))
+        self.weights.setVisible(False)
+        layout.addWidget(self.weights, stretch=1)
+
+        run_row = QHBoxLayout()
+        self.run_btn = QPushButton("Search")
+        self.run_btn.clicked.connect(self._run)
+        self.cancel_btn = QPushButton("Stop")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self._cancel)
+        self.progress = QProgressBar(); self.progress.setRange(0, 100)
+        run_row.addWidget(self.run_btn); run_row.addWidget(self.cancel_btn); run_row.addWidget(self.progress, stretch=1)
+        layout.addLayout(run_row)
+        self.status = QLabel("")
+        layout.addWidget(self.status)
+
+        self.results = QListWidget()
+        self.results.currentRowChanged.connect(self._show_result)
+        layout.addWidget(self.results, stretch=1)
+        self.detail = QTextEdit(); self.detail.setReadOnly(True)
+        layout.addWidget(self.detail, stretch=1)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.button(QDialogButtonBox.Ok).setText("Use this list")
+        buttons.accepted.connect(self._on_ok)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def _on_objective_changed(self):
+        self.weights.setVisible(self.objective.currentData() == "weights")
+
+    def _weights(self) -> Dict[str, float]:
+        out = {}
+        for row in range(self.weights.rowCount()):
+            try: w = float(self.weights.item(row, 1).text())
+            except (TypeError, ValueError): continue
+            if w: out[self.weights.item(row, 0).data(Qt.UserRole)] = w
+        return out
+
+    def _cancel(self):
+        self._cancelled = True
+
+    def _progress(self, fraction, nodes, best):
+        self.progress.setValue(int(fraction * 100))
+        self.status.setText(f"{nodes:,} lists explored" + (f", best {best:g}" if best is not None else ""))
+        QApplication.processEvents()
+        return not self._cancelled
+
+    def _run(self):
+        self._cancelled = False
+        self.run_btn.setEnabled(False); self.cancel_btn.setEnabled(True)
+        try:
+            result = solve(self._codex, self._points_limit, self.objective.currentData(), self._weights(),
+                           top_n=self.top_n.value(), time_budget=self.budget.value(), progress=self._progress)
+        finally:
+            self.run_btn.setEnabled(True); self.cancel_btn.setEnabled(False)
+        self._solutions = result.solutions
+        state = "complete" if result.complete else "stopped early"
+        self.status.setText(f"{result.nodes:,} lists explored in {result.elapsed:.1f}s ({state})")
+        self.results.clear()
+        for i, s in enumerate(self._solutions, 1):
+            self.results.addItem(f"#{i}: {s.value:g} ({s.cost:g} pts, {len(s.configs)} units)")
+        if self._solutions: self.results.setCurrentRow(0)
+        else: self.detail.setPlainText("No legal list fits the points limit.")
+
+    def _show_result(self, row):
+        if 0 <= row < len(self._solutions):
+            self.detail.setPlainText(describe(self._solutions[row], self._codex))
+
+    def _on_ok(self):
+        if self.results.currentRow() < 0:
+            QMessageBox.information(self, "No selection", "Run a search and pick a list first.")
+            return
+        self.accept()
+
+    def selected_entries(self) -> List[Dict[str, Any]]:
+        row = self.results.currentRow()
+        return self._solutions[row].to_entries() if 0 <= row < len(self._solutions) else []
+
+class RosterLibraryDialog(QDialog):
+    """Browses the shared roster library; accept() with a roster picked to open it."""
+    def __init__(self, parent=None, store=None, codex_file: Optional[str] = None):
+        super().__init__(parent)
+        self.setWindowTitle("Roster Library")
+        self.setSizeGripEnabled(True)
+        self.resize(620, 520)
+        self._store = store
+        self._codex_file = codex_file
+        self._rows = []
+
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+        self.search_edit = QLineEdit(); self.search_edit.setPlaceholderText("Roster name…")
+        self.unit_combo = QComboBox(); self.unit_combo.setEditable(True)
+        self.unit_combo.addItem("")
+        self.unit_combo.addItems(store.unit_names() if store else [])
+        self.codex_only = QCheckBox("Current codex only")
+        self.codex_only.setChecked(bool(codex_file))
+        self.codex_only.setEnabled(bool(codex_file))
+        form.addRow("Search", self.search_edit)
+        form.addRow("Contains unit", self.unit_combo)
+        form.addRow("", self.codex_only)
+        layout.addLayout(form)
+
+        self.results = QListWidget()
+        self.results.itemDoubleClicked.connect(lambda _item: self._on_ok())
+        layout.addWidget(self.results, stretch=1)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.button(QDialogButtonBox.Ok).setText("Open")
+        self.delete_btn = buttons.addButton("Delete", QDialogButtonBox.ActionRole)
+        self.delete_btn.clicked.connect(self._delete)
+        buttons.accepted.connect(self._on_ok)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        self.search_edit.textChanged.connect(self._refresh)
+        self.unit_combo.currentTextChanged.connect(self._refresh)
+        self.codex_only.toggled.connect(self._refresh)
+        self._refresh()
+
+    def _refresh(self):
+        self.results.clear()
+        if not self._store: return
+        self._rows = self._store.list(codex_file=self._codex_file if self.codex_only.isChecked() else None,
+                                      search=self.search_edit.text().strip(),
+                                      unit=self.unit_combo.currentText().strip())
+        for r in self._rows: self.results.addItem(r.label)
+        if self._rows: self.results.setCurrentRow(0)
+
+    def _delete(self):
+        row = self.results.currentRow()
+        if not 0 <= row < len(self._rows): return
+        if QMessageBox.question(self, "Delete roster", f"Delete '{self._rows[row].name}' from the library?") != QMessageBox.Yes:
+            return
+        self._store.delete(self._rows[row].id)
+        self._refresh()
+
+    def _on_ok(self):
+        if self.results.currentRow() < 0:
+            QMessageBox.information(self, "No selection", "Pick a roster to open.")
+            return
+        self.accept()
+
+    def selected_id(self) -> Optional[str]:
+        row = self.results.currentRow()
+        return self._rows[row].id if 0 <= row < len(self._rows) else None
+
+class CodexIndexDialog(QDialog):
+    """Weapons, units and rules across every codex in the folder (see codex_index.py)."""
+    def __init__(self, parent=None, index=None):
+        super().__init__(parent)
+        self.setWindowTitle("Search All Codexes")
+        self.setSizeGripEnabled(True)
+        self.resize(760, 560)
+        self._index = index
+
+        layout = QVBoxLayout(self)
+        top = QFormLayout()
+        self.mode_combo = QComboBox(); self.mode_combo.addItems(["Weapons", "Units", "Rules"])
+        self.name_edit = QLineEdit(); self.name_edit.setPlaceholderText("Name contains…")
+        self.codex_combo = QComboBox(); self.codex_combo.addItem("All codexes", "")
+        for name in (index.codexes if index else []): self.codex_combo.addItem(name, name)
+        top.addRow("Search", self.mode_combo)
+        top.addRow("Name", self.name_edit)
+        top.addRow("Codex", self.codex_combo)
+        layout.addLayout(top)
+
+        def any_spin(hi, text="any"):
+            spin = QSpinBox(); spin.setRange(0, hi); spin.setSpecialValueText(text)
+            return spin
+        self.filters = QStackedWidget()
+        wf = QWidget(); wl = QFormLayout(wf)
+        self.min_s = any_spin(10); self.max_ap = any_spin(6); self.min_range = any_spin(120)
+        self.type_edit = QLineEdit(); self.type_edit.setPlaceholderText("e.g. Heavy, Assault, Melee")
+        wl.addRow("Strength at least", self.min_s)
+        wl.addRow("AP this good or better", self.max_ap)
+        wl.addRow("Range at least (\")", self.min_range)
+        wl.addRow("Type contains", self.type_edit)
+        uf = QWidget(); ul = QFormLayout(uf)
+        self.slot_combo = QComboBox(); self.slot_combo.addItem("Any slot", "")
+        for slot in SLOTS: self.slot_combo.addItem(slot, slot)
+        self.rule_edit = QLineEdit(); self.rule_edit.setPlaceholderText("e.g. Deep Strike")
+        self.min_points = any_spin(2000); self.max_points = any_spin(2000)
+        ul.addRow("Slot", self.slot_combo)
+        ul.addRow("Has rule", self.rule_edit)
+        ul.addRow("Points at least", self.min_points)
+        ul.addRow("Points at most", self.max_points)
+        self.filters.addWidget(wf); self.filters.addWidget(uf); self.filters.addWidget(QWidget())
+        layout.addWidget(self.filters)
+
+        self.results = QListWidget()
+        layout.addWidget(self.results, stretch=1)
+        self.status = QLabel("")
+        layout.addWidget(self.status)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        self.mode_combo.currentIndexChanged.connect(self.filters.setCurrentIndex)
+        for w in (self.mode_combo, self.codex_combo, self.slot_combo):
+            w.currentIndexChanged.connect(self._refresh)
+        for w in (self.name_edit, self.type_edit, self.rule_edit):
+            w.textChanged.connect(self._refresh)
+        for w in (self.min_s, self.max_ap, self.min_range, self.min_points, self.max_points):
+            w.valueChanged.connect(self._refresh)
+        self._refresh()
+
+    def _refresh(self):
+        self.results.clear()
+        if not self._index: return
+        any_ = lambda spin: spin.value() or None
+        name, codex = self.name_edit.text().strip(), self.codex_combo.currentData() or ""
+        t = time.perf_counter()
+        mode = self.mode_combo.currentText()
+        if mode == "Weapons":
+            rows = self._index.weapons(min_s=any_(self.min_s), max_ap=any_(self.max_ap), min_range=any_(self.min_range),
+                                       name=name, type=self.type_edit.text().strip(), codex=codex)
+        elif mode == "Units":
+            rows = self._index.units(slot=self.slot_combo.currentData() or "", min_points=any_(self.min_points),
+                                     max_points=any_(self.max_points), rule=self.rule_edit.text().strip(),
+                                     name=name, codex=codex)
+        else:
+            rows = self._index.rules(name=name, codex=codex)
+        took = (time.perf_counter() - t) * 1000
+        for r in rows:
+            item = QListWidgetItem(r.label)
+            if mode == "Rules": item.setToolTip(r.summary + ("\n\nUnits: " + ", ".join(r.units) if r.units else ""))
+            elif mode == "Units": item.setToolTip(", ".join(r.rules))
+            self.results.addItem(item)
+        self.status.setText(f"{len(rows)} {mode.lower()} ({took:.1f} ms)")
+
 class MultiPickDialog(QDialog):
     def __init__(self, parent=None, title: str = "Select items", items: Optional[List[str]] = None):
         super().__init__(parent)
@@ -175,7 +446,8 @@ class MultiPickDialog(QDialog):
         self.listw.setSelectionMode(QListWidget.MultiSelection)
         layout.addWidget(self.listw, stretch=1)
         
-        self._all_items = list(items)
+        self._all_items = sorted(items, key=lambda x: x.lower())
+        self._matcher: Optional[FuzzyMatcher] = None   # built on the first filter keystroke
         self._populate()
         self.filter_edit.textChanged.connect(self._populate)
         
@@ -185,11 +457,13 @@ class MultiPickDialog(QDialog):
         layout.addWidget(buttons)
 
     def _populate(self):
-        f = self.filter_edit.text().strip().lower()
+        f = self.filter_edit.text().strip()
         self.listw.clear()
-        for it in sorted(self._all_items, key=lambda x: x.lower()):
-            if f and f not in it.lower(): continue
-            self.listw.addItem(it)
+        if not f:
+            self.listw.addItems(self._all_items)
+            return
+        if self._matcher is None: self._matcher = FuzzyMatcher(self._all_items)
+        self.listw.addItems([self._all_items[i] for _, i in self._matcher.query(f)])
 
     def selected_items(self) -> List[str]:
         return [i.text() for i in self.listw.selectedItems()]
@@ -1,29 +1,236 @@
-import re
 import uuid
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QAbstractListModel, QEvent, QModelIndex, QObject, QTimer
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QPushButton, QSpinBox, 
-    QLabel, QSplitter, QLineEdit, QListWidget, QListWidgetItem, QMessageBox,
+    QLabel, QSplitter, QLineEdit, QListView, QListWidget, QListWidgetItem, QMessageBox,
     QFileDialog, QGroupBox, QFormLayout, QScrollArea, QTextEdit, 
-    QButtonGroup, QRadioButton, QCheckBox, QDialog, QDialogButtonBox
+    QButtonGroup, QRadioButton, QCheckBox, QDialog, QDialogButtonBox, QInputDialog
 )
 
 from utils import ensure_folder, read_json, write_json, slugify
 from constants import SLOTS, FORCE_ORG_LIMITS_5E
-from ui_editors import DedicatedTransportPicker
+from ui_editors import DedicatedTransportPicker, ListOptimiserDialog, RosterLibraryDialog
 from reports import write_roster_pdf, HAVE_REPORTLAB
+from roster import Roster
+from roster_store import library
+from suggestions import apply_suggestion, suggest
+
+FRAME_MS = 16   # edits arriving within one frame share a single recompute
+
+class RosterListModel(QAbstractListModel):
+    """Roster rows (roots in slot order, each followed by its transports) keyed by entry id.
+
+    Structural changes insert, remove or move rows rather than rebuilding them, so the view's
+    selection follows its entry; edits only emit dataChanged for rows whose text changed."""
+    EntryIdRole = Qt.UserRole
+
+    def __init__(self, roster: Roster, label, sort_key, parent=None):
+        super().__init__(parent)
+        self.roster, self._label, self._sort_key = roster, label, sort_key
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._labels: Dict[str, str] = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._ids): return None
+        eid = self._ids[index.row()]
+        if role == Qt.DisplayRole: return self._labels.get(eid, "")
+        if role == self.EntryIdRole: return eid
+        return None
+
+    def index_of(self, entry_id: Optional[str]) -> QModelIndex:
+        row = self._rows.get(entry_id)
+        return self.index(row) if row is not None else QModelIndex()
+
+    def _order(self) -> List[str]:
+        out = []
+        for root in sorted(self.roster.roots(), key=self._sort_key):
+            out.append(root["id"])
+            out.extend(c["id"] for c in self.roster.children(root))
+        return out
+
+    def _reindex(self):
+        self._rows = {eid: row for row, eid in enumerate(self._ids)}
+
+    def set_roster(self, roster: Roster):
+        self.beginResetModel()
+        self.roster = roster
+        self._ids = self._order()
+        self._labels = {eid: self._label(roster.get(eid)) for eid in self._ids}
+        self._reindex()
+        self.endResetModel()
+
+    def sync(self):
+        """Brings the rows in line with the roster, then relabels the rows whose text changed."""
+        order = self._order()
+        if order != self._ids:
+            keep = set(order)
+            for row in range(len(self._ids) - 1, -1, -1):
+                if self._ids[row] in keep: continue
+                self.beginRemoveRows(QModelIndex(), row, row)
+                self._labels.pop(self._ids.pop(row), None)
+                self._reindex()
+                self.endRemoveRows()
+            present = set(self._ids)
+            for row, eid in enumerate(order):
+                if eid in present: continue
+                self.beginInsertRows(QModelIndex(), row, row)
+                self._ids.insert(row, eid)
+                self._labels[eid] = self._label(self.roster.get(eid))
+                self._reindex()
+                self.endInsertRows()
+            if self._ids != order:
+                # Re-sorted (a slot or name changed): move the rows, keeping persistent indexes on their entries
+                self.layoutAboutToBeChanged.emit()
+                old = self.persistentIndexList()
+                moved = [self._ids[i.row()] for i in old]
+                self._ids = order
+                self._reindex()
+                self.changePersistentIndexList(old, [self.index_of(eid) for eid in moved])
+                self.layoutChanged.emit()
+        self.relabel(self._ids)
+
+    def relabel(self, entry_ids):
+        """Emits dataChanged for each of `entry_ids` whose label is not what the view last saw."""
+        for eid in entry_ids:
+            row, entry = self._rows.get(eid), self.roster.get(eid)
+            if row is None or entry is None: continue
+            text = self._label(entry)
+            if text == self._labels.get(eid): continue
+            self._labels[eid] = text
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole])
+
+class OptionsPanel(QWidget):
+    """The option groups of one unit definition. Built once, then bound to whichever entry of the unit is
+    selected by setting values in place. Choice tooltips are generated on first hover."""
+    def __init__(self, owner: "RosterBuilderWidget", unit: Dict[str, Any], size: int):
+        super().__init__()
+        self.owner, self.unit = owner, unit
+        self._groups: List[Dict[str, Any]] = []
+        layout = QVBoxLayout(self); layout.setContentsMargins(0, 0, 0, 0)
+        for i, g in enumerate(unit.get("options", [])):
+            try:
+                grp = {"g": g, "gid": g.get("group_id") or f"group_{i}", "kind": self._kind(g, size),
+                       "max": self._limits(g, size)[1], "choices": [], "none": None, "buttons": None}
+                grp["box"] = box = QGroupBox(); vb = QVBoxLayout(box)
+                gid = grp["gid"]
+                if grp["kind"] in ("mixed", "count"):
+                    handler = owner._opt_mixed_quantity_changed if grp["kind"] == "mixed" else owner._opt_quantity_changed
+                    choices = g.get("choices", []) if grp["kind"] == "mixed" else g["choices"][:1]
+                    for c in choices:
+                        cid = c.get("id")
+                        row = QHBoxLayout()
+                        lbl = QLabel(c.get("name", "Unknown")); self._lazy_tooltip(lbl, cid, c.get("name", ""))
+                        spin = QSpinBox()
+                        row.addWidget(lbl); row.addWidget(spin); row.addWidget(QLabel(f"+{c.get('points',0)} pts"))
+                        vb.addLayout(row)
+                        spin.valueChanged.connect(lambda val, x=gid, c=cid, h=handler: h(x, c, val))
+                        grp["choices"].append((cid, spin))
+                elif grp["kind"] == "radio":
+                    bg = grp["buttons"] = QButtonGroup(box); bg.setExclusive(True)
+                    if g.get("min_select", 0) == 0:
+                        rb = grp["none"] = QRadioButton("(none)"); bg.addButton(rb); vb.addWidget(rb)
+                        rb.toggled.connect(lambda c, x=gid: owner._opt_changed(x, [], c) if c else None)
+                    for c in g.get("choices", []):
+                        rb = QRadioButton(f"{c.get('name', 'Unknown')} (+{c.get('points',0)})")
+                        self._lazy_tooltip(rb, c.get("id"), c.get("name", ""))
+                        bg.addButton(rb); vb.addWidget(rb)
+                        rb.toggled.connect(lambda c, x=gid, y=c.get("id"): owner._opt_changed(x, [y], c) if c else None)
+                        grp["choices"].append((c.get("id"), rb))
+                else:
+                    for c in g.get("choices", []):
+                        cb = QCheckBox(f"{c.get('name', 'Unknown')} (+{c.get('points',0)})")
+                        self._lazy_tooltip(cb, c.get("id"), c.get("name", ""))
+                        vb.addWidget(cb)
+                        cb.toggled.connect(lambda c, x=gid, y=c.get("id"), w=cb, grp=grp: owner._opt_multi_changed(c, x, y, w, grp["max"]))
+                        grp["choices"].append((c.get("id"), cb))
+                layout.addWidget(box)
+                self._groups.append(grp)
+            except Exception as e: print(f"Error building option group: {e}")
+
+    @staticmethod
+    def _limits(g, size) -> Tuple[int, int]:
+        return g.get("min_select", 0), size if g.get("linked_to_size") else g.get("max_select", 1)
+
+    @classmethod
+    def _kind(cls, g, size) -> str:
+        n, max_select = len(g.get("choices", [])), cls._limits(g, size)[1]
+        if g.get("linked_to_size") and n > 1: return "mixed"
+        if n == 1 and max_select > 1: return "count"
+        return "radio" if max_select <= 1 else "multi"
+
+    @classmethod
+    def layout_key(cls, unit, size) -> Tuple[str, ...]:
+        """Which widgets each group needs at this size; a squad-size change can turn radio buttons into a spinbox."""
+        return tuple(cls._kind(g, size) for g in unit.get("options", []))
+
+    def bind(self, entry):
+        """Shows `entry`'s size limits and picks (caller suppresses the option signals)."""
+        selected = entry.setdefault("selected", {})
+        size = entry.get("size", 1)
+        for grp in self._groups:
+            try:
+                g, gid = grp["g"], grp["gid"]
+                min_select, max_select = self._limits(g, size)
+                grp["max"] = max_select
+                picks = selected.get(gid, [])
+                picks = picks if isinstance(picks, list) else ([picks] if picks else [])
+                if grp["kind"] == "multi" and len(picks) > max_select:
+                    picks = selected[gid] = picks[:max_select]
+                limit_text = f"Up to {size}" if max_select == size and size > 1 else f"{min_select}–{max_select}"
+                grp["box"].setTitle(f"{g.get('group_name', 'Option')} ({limit_text}) [Selected: {len(picks)}]")
+                if grp["kind"] in ("mixed", "count"):
+                    for cid, spin in grp["choices"]:
+                        spin.setRange(0, max_select); spin.setValue(picks.count(cid))
+                elif grp["kind"] == "radio":
+                    grp["buttons"].setExclusive(False)
+                    if grp["none"] is not None: grp["none"].setChecked(not picks)
+                    for cid, rb in grp["choices"]: rb.setChecked(cid in picks)
+                    grp["buttons"].setExclusive(True)
+                else:
+                    for cid, cb in grp["choices"]: cb.setChecked(cid in picks)
+            except Exception as e: print(f"Error binding option group: {e}")
+
+    def _lazy_tooltip(self, widget, choice_id, choice_name):
+        widget.setProperty("choice", (choice_id, choice_name))
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        if event.type() == QEvent.ToolTip and obj.property("choice") is not None:
+            choice_id, choice_name = obj.property("choice")
+            obj.setProperty("choice", None)
+            text = self.owner._choice_tooltip(self.unit, choice_id, choice_name)
+            if text: obj.setToolTip(text)
+        return False
 
 class RosterBuilderWidget(QWidget):
     def __init__(self, main_window):
         super().__init__()
         self.mw = main_window
-        self.roster_entries: List[Dict[str, Any]] = []
-        self._current_real_index: Optional[int] = None
+        self.roster = Roster()
+        self._library_id: Optional[str] = None   # library row the current roster was opened from / saved to
+        self._library_name = ""
+        self._current_entry_id: Optional[str] = None
         self._suppress_option_signals = False
+        self._options_panels: Dict[Tuple[Any, ...], OptionsPanel] = {}   # (unit id, group layout) -> panel
+        self._options_panel: Optional[OptionsPanel] = None
+        self._options_codex = None
+        # Spinbox bursts: entry dicts change at once, recosting/relabelling runs once per frame
+        self._pending_entries: List[str] = []
+        self._pending_options: Optional[str] = None   # entry whose option panel needs rebinding
+        self.refresh_stats = {"requested": 0, "coalesced": 0, "executed": 0}
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(FRAME_MS)
+        self._refresh_timer.timeout.connect(self._flush_refresh)
 
         outer = QVBoxLayout(self)
         top = QHBoxLayout()
@@ -64,10 +271,14 @@ class RosterBuilderWidget(QWidget):
         self.slot_filter.addItems(SLOTS)
         self.slot_filter.currentTextChanged.connect(self._refresh_available_units)
         self.search_edit = QLineEdit()
-        self.search_edit.setPlaceholderText("Search unit name…")
+        self.search_edit.setPlaceholderText("Search units, weapons, rules, wargear…")
         self.search_edit.textChanged.connect(self._refresh_available_units)
         filter_row.addWidget(QLabel("Filter")); filter_row.addWidget(self.slot_filter)
         filter_row.addWidget(self.search_edit, stretch=1)
+        self.fits_check = QCheckBox("Fits remaining points")
+        self.fits_check.setToolTip("Only show units and upgrades that fit in the remaining points")
+        self.fits_check.toggled.connect(self._refresh_available_units)
+        filter_row.addWidget(self.fits_check)
         left_layout.addLayout(filter_row)
         
         self.available_list = QListWidget()
@@ -86,8 +297,11 @@ class RosterBuilderWidget(QWidget):
 
         roster_panel = QWidget(); rpl = QVBoxLayout(roster_panel)
         rpl.addWidget(QLabel("Roster"))
-        self.roster_list = QListWidget()
-        self.roster_list.currentRowChanged.connect(self._on_roster_row_changed)
+        self.roster_model = RosterListModel(self.roster, self._entry_label, self._roster_sort_key, self)
+        self.roster_list = QListView()
+        self.roster_list.setUniformItemSizes(True)
+        self.roster_list.setModel(self.roster_model)
+        self.roster_list.selectionModel().currentChanged.connect(self._on_current_entry_changed)
         rpl.addWidget(self.roster_list, stretch=1)
         roster_btns = QHBoxLayout()
         self.remove_btn = QPushButton("Remove")
@@ -98,11 +312,19 @@ class RosterBuilderWidget(QWidget):
         self.save_roster_btn.clicked.connect(self._save_roster)
         self.load_roster_btn = QPushButton("Load...")
         self.load_roster_btn.clicked.connect(self._load_roster)
+        self.library_save_btn = QPushButton("Save to Library...")
+        self.library_save_btn.clicked.connect(self._save_to_library)
+        self.library_open_btn = QPushButton("Library...")
+        self.library_open_btn.clicked.connect(self._open_library)
         self.export_pdf_btn = QPushButton("Export PDF...")
         self.export_pdf_btn.clicked.connect(self._export_roster_pdf)
+        self.optimise_btn = QPushButton("Optimise...")
+        self.optimise_btn.clicked.connect(self._optimise_roster)
         roster_btns.addWidget(self.remove_btn); roster_btns.addWidget(self.clear_btn)
         roster_btns.addWidget(self.save_roster_btn); roster_btns.addWidget(self.load_roster_btn)
-        roster_btns.addWidget(self.export_pdf_btn); roster_btns.addStretch(1)
+        roster_btns.addWidget(self.library_save_btn); roster_btns.addWidget(self.library_open_btn)
+        roster_btns.addWidget(self.export_pdf_btn); roster_btns.addWidget(self.optimise_btn)
+        roster_btns.addStretch(1)
         rpl.addLayout(roster_btns)
         right_splitter.addWidget(roster_panel)
 
@@ -127,6 +349,7 @@ class RosterBuilderWidget(QWidget):
         self.options_scroll = QScrollArea(); self.options_scroll.setWidgetResizable(True)
         sl.addWidget(self.options_scroll, stretch=1)
         self.options_inner = QWidget(); self.options_layout = QVBoxLayout(self.options_inner)
+        self.options_layout.addStretch(1)
         self.options_scroll.setWidget(self.options_inner)
         fp = QWidget(); fl = QVBoxLayout(fp); fl.addWidget(QLabel("Options (free text / notes)"))
         self.free_text = QTextEdit(); self.free_text.setReadOnly(True); self.free_text.setMinimumHeight(90)
@@ -137,56 +360,75 @@ class RosterBuilderWidget(QWidget):
         splitter.setSizes([520, 820])
         
         self.entry_box.setEnabled(False)
+        self.mw.codex_dir.listingChanged.connect(self.refresh_codex_combo)
         self.refresh_codex_combo()
 
     def refresh_codex_combo(self):
         self.codex_combo.blockSignals(True)
         self.codex_combo.clear()
-        codex_dir = Path("codexes"); ensure_folder(codex_dir)
-        for p in sorted(codex_dir.glob("*.json")): self.codex_combo.addItem(p.name, str(p))
-        if self.mw.codex_path:
-            for i in range(self.codex_combo.count()):
-                if Path(self.codex_combo.itemData(i)).resolve() == self.mw.codex_path.resolve():
-                    self.codex_combo.setCurrentIndex(i); break
+        current = self.mw.codex_path.resolve() if self.mw.codex_path else None
+        for p in self.mw.codex_dir.paths:
+            self.codex_combo.addItem(p.name, str(p))
+            if p == current: self.codex_combo.setCurrentIndex(self.codex_combo.count() - 1)
         self.codex_combo.blockSignals(False)
 
     def _on_codex_combo_changed(self):
         data = self.codex_combo.currentData()
-        if data and (not self.mw.codex_path or Path(data).resolve() != self.mw.codex_path.resolve()):
+        # Combo paths are already resolved and preloaded, so this is normally a cache hit
+        if data and (not self.mw.codex_path or Path(data) != self.mw.codex_path.resolve()):
             self.mw.load_codex(Path(data))
 
     def _open_codex(self):
         self.mw.open_codex()
         self.refresh_codex_combo()
 
-    def on_codex_loaded(self):
+    def on_codex_loaded(self, keep_roster: bool = False):
+        """Another codex clears the roster; a reload of the same file keeps it and recosts it."""
         self.refresh_codex_combo()
+        self._clear_options_panels()
         self._refresh_available_units()
-        self._clear_roster()
+        if not keep_roster:
+            self._clear_roster()
+            return
+        self._refresh_roster_list()
+        self._on_current_entry_changed(self.roster_list.currentIndex())   # its options panel was dropped
 
     def _refresh_available_units(self):
         self.available_list.clear()
         slot_filter = self.slot_filter.currentText()
         q = self.search_edit.text().strip().lower()
-        
-        slot_order = { "HQ": 0, "Troops": 1, "Elites": 2, "Fast Attack": 3, "Heavy Support": 4, "Dedicated Transport": 5 }
-        
-        units = sorted(
-            self.mw.codex_data.get("units", []), 
-            key=lambda u: (slot_order.get(u.get("slot", ""), 99), u.get("name", ""))
-        )
 
-        for u in units:
+        if self.fits_check.isChecked():
+            kinds = {"unit": "New", "size": "Models", "option": "Upgrade", "transport": "Transport"}
+            for sg in suggest(self.roster, self.mw.codex, self.points_limit.value(), limit=200):
+                u = self.mw.get_unit_by_id(sg.unit_id) or {}
+                if slot_filter != "All slots" and u.get("slot") != slot_filter: continue
+                if q and q not in sg.label.lower(): continue
+                item = QListWidgetItem(f"[{kinds[sg.kind]}] {sg.label} (+{sg.cost:g} pts)")
+                item.setData(Qt.UserRole, sg.unit_id)
+                item.setData(Qt.UserRole + 1, sg)
+                self.available_list.addItem(item)
+            return
+
+        # Ranked fuzzy hits over names, weapons, wargear, rules and option choices
+        if q: rows = [(self.mw.get_unit_by_id(h.unit_id), h.reason) for h in self.mw.codex.search.query(q, 200)]
+        else: rows = [(u, "") for u in self.mw.codex.units]
+        for u, reason in rows:
             if u.get("slot") == "Dedicated Transport": continue
             if slot_filter != "All slots" and u.get("slot") != slot_filter: continue
-            if q and q not in u.get("name", "").lower(): continue
-            item = QListWidgetItem(f"[{u.get('slot')}] {u.get('name')}")
+            item = QListWidgetItem(f"[{u.get('slot')}] {u.get('name')}" + (f"  — {reason}" if reason else ""))
+            if reason: item.setToolTip(reason)
             item.setData(Qt.UserRole, u.get("id"))
             self.available_list.addItem(item)
 
     def _add_selected_unit(self):
         item = self.available_list.currentItem()
         if not item: return
+        sg = item.data(Qt.UserRole + 1)
+        if sg is not None:
+            entry = apply_suggestion(self.roster, sg)
+            self._refresh_roster_list(select_entry_id=entry["id"])
+            return
         unit_id = item.data(Qt.UserRole)
         unit = self.mw.get_unit_by_id(unit_id)
         if unit:
@@ -198,12 +440,12 @@ class RosterBuilderWidget(QWidget):
                 "selected": {}, 
                 "parent_id": None
             }
-            self.roster_entries.append(new_entry)
+            self.roster.add(new_entry)
             self._refresh_roster_list(select_entry_id=new_id)
 
     def _add_dt_for_selected_entry(self):
-        if self._current_real_index is None: return
-        parent_entry = self.roster_entries[self._current_real_index]
+        parent_entry = self._current_entry()
+        if parent_entry is None: return
         parent_unit = self.mw.get_unit_by_id(parent_entry["unit_id"])
         
         dt_ids = parent_unit.get("dedicated_transports", [])
@@ -223,113 +465,87 @@ class RosterBuilderWidget(QWidget):
                  "selected": {}, 
                  "parent_id": parent_entry["id"]
              }
-             self.roster_entries.append(new_entry)
+             self.roster.add(new_entry)
              self._refresh_roster_list(select_entry_id=new_id)
 
     def _remove_selected_entry(self):
-        if self._current_real_index is None: return
-        
-        entry_to_remove = self.roster_entries[self._current_real_index]
-        remove_id = entry_to_remove["id"]
-        
-        ids_to_remove = {remove_id}
-        for e in self.roster_entries:
-            if e.get("parent_id") == remove_id:
-                ids_to_remove.add(e["id"])
-                
-        self.roster_entries = [e for e in self.roster_entries if e["id"] not in ids_to_remove]
-        self._current_real_index = None
+        if self._current_entry_id not in self.roster: return
+        self.roster.remove(self._current_entry_id)
         self._refresh_roster_list()
 
     def _clear_roster(self):
-        self.roster_entries = []
-        self._current_real_index = None
+        self.roster.clear()
+        self._library_id, self._library_name = None, ""
         self._refresh_roster_list()
 
-    def _refresh_roster_list(self, select_entry_id=None):
-        self.roster_list.clear()
-
-        children_map = {}
-        roots = []
-        for e in self.roster_entries:
-            pid = e.get("parent_id")
-            if pid:
-                if pid not in children_map: children_map[pid] = []
-                children_map[pid].append(e)
-            else:
-                roots.append(e)
-
+    def _roster_sort_key(self, entry):
+        u = self.mw.get_unit_by_id(entry["unit_id"])
+        if not u: return (99, "")
         slot_order = {"HQ": 0, "Troops": 1, "Elites": 2, "Fast Attack": 3, "Heavy Support": 4}
-        def get_sort_key(e):
-            u = self.mw.get_unit_by_id(e["unit_id"])
-            if not u: return (99, "")
-            return (slot_order.get(u.get("slot", ""), 99), u.get("name", ""))
-        roots.sort(key=get_sort_key)
-
-        item_to_select = None
-        
-        def add_entry_visual(entry, indent=False):
-            real_idx = self.roster_entries.index(entry)
-            u = self.mw.get_unit_by_id(entry["unit_id"])
-            if not u:
-                item = QListWidgetItem("Unknown Unit")
-            else:
-                cost = u.get("base_points", 0) + u.get("points_per_model", 0) * entry.get("size", 1)
-                for gid, picks in entry.get("selected", {}).items():
-                    for opt in u.get("options", []):
-                        if opt["group_id"] == gid:
-                            for c in opt.get("choices", []):
-                                count = 0
-                                if isinstance(picks, list): count = picks.count(c["id"])
-                                elif picks == c["id"]: count = 1
-                                if count > 0:
-                                    pts = c.get("points", 0)
-                                    mode = c.get("points_mode", "flat")
-                                    cost += (pts * entry.get("size", 1)) if mode == "per_model" else (pts * count)
-                
-                prefix = "    ↳ [DT] " if indent else f"[{u.get('slot','?')}] "
-                text = f"{prefix}{u.get('name','?')} (x{entry.get('size',1)}) - {cost} pts"
-                item = QListWidgetItem(text)
-            
-            item.setData(Qt.UserRole, real_idx)
-            self.roster_list.addItem(item)
-            return item
-
-        for root in roots:
-            it = add_entry_visual(root, False)
-            if root["id"] == select_entry_id: item_to_select = it
-            if root["id"] in children_map:
-                for child in children_map[root["id"]]:
-                    it_c = add_entry_visual(child, True)
-                    if child["id"] == select_entry_id: item_to_select = it_c
-
-        if item_to_select:
-            self.roster_list.setCurrentItem(item_to_select)
-        elif self.roster_list.count() > 0:
-            self.roster_list.setCurrentRow(0)
-        else:
-            self._on_roster_row_changed(-1)
-
-        self._refresh_all()
+        return (slot_order.get(u.get("slot", ""), 99), u.get("name", ""))
 
-    def _on_roster_row_changed(self, visual_row):
-        if visual_row < 0:
-            self._current_real_index = None
-            self.entry_box.setEnabled(False)
-            return
-            
-        item = self.roster_list.item(visual_row)
-        real_idx = item.data(Qt.UserRole)
-        
-        if real_idx is None or real_idx < 0 or real_idx >= len(self.roster_entries):
-            self._current_real_index = None
+    def _refresh_roster_list(self, select_entry_id=None):
+        """Syncs the list model with the roster; keeps the current entry selected unless `select_entry_id` is given."""
+        self._flush_refresh()
+        self.roster.bind(self.mw.codex)
+        self.roster.refresh()
+        if self.roster_model.roster is not self.roster: self.roster_model.set_roster(self.roster)
+        else: self.roster_model.sync()
+
+        target = select_entry_id if select_entry_id in self.roster else self._current_entry_id
+        index = self.roster_model.index_of(target) if target in self.roster else self.roster_model.index(0)
+        if index.isValid(): self.roster_list.setCurrentIndex(index)
+        else: self._on_current_entry_changed(index)
+
+        self._update_summary()
+
+    def _entry_label(self, entry):
+        u = self.mw.get_unit_by_id(entry["unit_id"])
+        if not u: return "Unknown Unit"
+        prefix = "    ↳ [DT] " if entry.get("parent_id") else f"[{u.get('slot','?')}] "
+        return f"{prefix}{u.get('name','?')} (x{entry.get('size',1)}) - {entry.get('calculated_cost', 0)} pts"
+
+    def _refresh_entry(self, entry):
+        """Single-entry edit: marks it dirty now; recosting, relabelling and totals follow within a frame."""
+        self.roster.touch(entry["id"])
+        self.refresh_stats["requested"] += 1
+        if entry["id"] not in self._pending_entries: self._pending_entries.append(entry["id"])
+        if self._refresh_timer.isActive(): self.refresh_stats["coalesced"] += 1
+        else: self._refresh_timer.start()
+
+    def _flush_refresh(self):
+        """Runs the pending recompute now (the timer calls this; so does anything that needs current totals)."""
+        self._refresh_timer.stop()
+        if not self._pending_entries and self._pending_options is None: return
+        entry = self._current_entry()
+        if entry is not None and self._pending_options == entry["id"]:
+            unit = self.mw.get_unit_by_id(entry["unit_id"])
+            if unit: self._build_options_ui(unit, entry)   # may trim picks above a smaller squad's limit
+        ids, self._pending_entries, self._pending_options = self._pending_entries, [], None
+        rows = []
+        for eid in ids:
+            e = self.roster.get(eid)
+            if e is None: continue
+            self.roster.touch(eid)
+            rows += [eid] + [a["id"] for a in self.roster.ancestors(e)]
+        self.roster.refresh()
+        self.roster_model.relabel(rows)
+        self._update_summary()
+        self.refresh_stats["executed"] += 1
+
+    def _current_entry(self) -> Optional[Dict[str, Any]]:
+        return self.roster.get(self._current_entry_id)
+
+    def _on_current_entry_changed(self, current, previous=None):
+        e = self.roster.get(current.data(RosterListModel.EntryIdRole)) if current.isValid() else None
+        if e is None:
+            self._current_entry_id = None
             self.entry_box.setEnabled(False)
             return
 
-        self._current_real_index = real_idx
+        self._current_entry_id = e["id"]
         self.entry_box.setEnabled(True)
         
-        e = self.roster_entries[real_idx]
         unit = self.mw.get_unit_by_id(e["unit_id"])
         
         if unit:
@@ -350,163 +566,84 @@ class RosterBuilderWidget(QWidget):
             self.add_dt_for_unit_btn.setEnabled(has_dt and not is_child)
 
     def _on_size_changed(self, val):
-        if self._current_real_index is not None:
-            entry = self.roster_entries[self._current_real_index]
+        entry = self._current_entry()
+        if entry is not None:
             entry["size"] = val
-            unit = self.mw.get_unit_by_id(entry["unit_id"])
-            if unit: self._build_options_ui(unit, entry)
-            self._refresh_roster_list(select_entry_id=entry["id"])
+            self._pending_options = entry["id"]
+            self._refresh_entry(entry)
 
     def _get_tooltip(self, choice_id, name):
-        """Generates a tooltip by searching sub-profiles, weapons, rules, and wargear."""
+        """Generates a tooltip for every weapon, rule and wargear named in the choice."""
         lines = []
-        data = self.mw.codex_data
-        
-        clean = re.sub(r'\s*\(.*?\)', '', name).strip()
-        
-        # Weapons
-        weapons = data.get("weapons", {})
-        w_key = next((k for k in weapons if k.lower() == clean.lower()), None)
-        if w_key:
-            w = weapons[w_key]
-            lines.append(f"WEAPON PROFILE: {w_key}")
-            lines.append(f"Range: {w.get('range','-')} | S: {w.get('S','-')} | AP: {w.get('AP','-')}")
-            lines.append(f"Type: {w.get('type','-')}")
-            if w.get("notes"): lines.append(f"Notes: {w.get('notes')}")
-            
-        # Rules
-        rules = data.get("rules", {})
-        r_key = next((k for k in rules if k.lower() == clean.lower()), None)
-        if r_key:
-            lines.append(f"RULE: {r_key}")
-            lines.append(rules[r_key].get("summary", ""))
-            
-        # Wargear
-        wargear = data.get("wargear", {})
-        wg_key = next((k for k in wargear if k.lower() == clean.lower()), None)
-        if wg_key:
-            lines.append(f"WARGEAR: {wg_key}")
-            lines.append(wargear[wg_key].get("summary", ""))
+        for section, key, d in self.mw.codex.tooltip_matches(name):
+            if section == "weapons":
+                lines.append(f"WEAPON PROFILE: {key}")
+                lines.append(f"Range: {d.get('range','-')} | S: {d.get('S','-')} | AP: {d.get('AP','-')}")
+                lines.append(f"Type: {d.get('type','-')}")
+                if d.get("notes"): lines.append(f"Notes: {d.get('notes')}")
+            elif section == "rules":
+                lines.append(f"RULE: {key}")
+                lines.append(d.get("summary", ""))
+            else:
+                lines.append(f"WARGEAR: {key}")
+                lines.append(d.get("summary", ""))
             
         return "\n\n".join(lines) if lines else None
 
+    def _choice_tooltip(self, unit, choice_id, choice_name):
+        prof_text = ""
+        if "sub_profiles" in unit and choice_id in unit["sub_profiles"]:
+            p = unit["sub_profiles"][choice_id]
+            prof_text = f"PROFILE: {p.get('name', 'Unit')}\nWS{p.get('WS')} BS{p.get('BS')} S{p.get('S')} T{p.get('T')} W{p.get('W')} I{p.get('I')} A{p.get('A')} Ld{p.get('Ld')} Sv{p.get('Sv')}\n\n"
+        gen_text = self._get_tooltip(choice_id, choice_name)
+        return (prof_text + (gen_text or "")).strip()
+
     def _build_options_ui(self, unit, entry):
+        """Shows the options panel for this unit, built on first use and rebound to `entry` after that."""
+        if self._options_codex is not self.mw.codex: self._clear_options_panels()
+        size = entry.get("size", 1)
+        key = (unit.get("id"), OptionsPanel.layout_key(unit, size))
+        panel = self._options_panels.get(key)
+        if panel is None:
+            panel = self._options_panels[key] = OptionsPanel(self, unit, size)
+            self.options_layout.insertWidget(self.options_layout.count() - 1, panel)
         self._suppress_option_signals = True
-        
-        while self.options_layout.count(): 
-            child = self.options_layout.takeAt(0)
-            if child.widget(): child.widget().deleteLater()
-            
-        selected = entry.setdefault("selected", {})
-        current_size = entry.get("size", 1)
-        
-        for i, g in enumerate(unit.get("options", [])):
-            try:
-                gid = g.get("group_id") or f"group_{i}"
-                max_select = g.get("max_select", 1)
-                min_select = g.get("min_select", 0)
-                if g.get("linked_to_size"): max_select = current_size
-                
-                limit_text = f"{min_select}–{max_select}"
-                if max_select == current_size and current_size > 1: limit_text = f"Up to {current_size}"
-                
-                current_picks = selected.get(gid, [])
-                total_selected = len(current_picks) if isinstance(current_picks, list) else (1 if current_picks else 0)
-                
-                box = QGroupBox(f"{g.get('group_name', 'Option')} ({limit_text}) [Selected: {total_selected}]")
-                vb = QVBoxLayout(box)
-                
-                def apply_tooltip(widget, choice_id, choice_name):
-                    prof_text = ""
-                    if "sub_profiles" in unit and choice_id in unit["sub_profiles"]:
-                        p = unit["sub_profiles"][choice_id]
-                        prof_text = f"PROFILE: {p.get('name', 'Unit')}\nWS{p.get('WS')} BS{p.get('BS')} S{p.get('S')} T{p.get('T')} W{p.get('W')} I{p.get('I')} A{p.get('A')} Ld{p.get('Ld')} Sv{p.get('Sv')}\n\n"
-                    
-                    gen_text = self._get_tooltip(choice_id, choice_name)
-                    final = (prof_text + (gen_text or "")).strip()
-                    if final:
-                        widget.setToolTip(final)
-
-                if g.get("linked_to_size") and len(g.get("choices", [])) > 1:
-                    for c in g.get("choices", []):
-                        cid = c.get("id")
-                        current_qty = selected.get(gid, []).count(cid)
-                        row = QHBoxLayout()
-                        lbl = QLabel(c.get("name", "Unknown"))
-                        apply_tooltip(lbl, cid, c.get("name", ""))
-                        
-                        spin = QSpinBox(); spin.setRange(0, max_select); spin.setValue(current_qty)
-                        row.addWidget(lbl); row.addWidget(spin); row.addWidget(QLabel(f"+{c.get('points',0)} pts"))
-                        vb.addLayout(row)
-                        spin.valueChanged.connect(lambda val, x=gid, c=cid: self._opt_mixed_quantity_changed(x, c, val))
-
-                elif len(g.get("choices", [])) == 1 and max_select > 1:
-                    choice = g["choices"][0]; cid = choice.get("id")
-                    current_count = selected.get(gid, []).count(cid)
-                    row = QHBoxLayout()
-                    lbl = QLabel(choice.get("name", "Unknown"))
-                    apply_tooltip(lbl, cid, choice.get("name", ""))
-                    
-                    spin = QSpinBox(); spin.setRange(0, max_select); spin.setValue(current_count)
-                    row.addWidget(lbl); row.addWidget(spin); row.addWidget(QLabel(f"+{choice.get('points',0)} pts"))
-                    vb.addLayout(row)
-                    spin.valueChanged.connect(lambda val, x=gid, c=cid: self._opt_quantity_changed(x, c, val))
-
-                elif max_select <= 1:
-                    bg = QButtonGroup(box); bg.setExclusive(True)
-                    if min_select == 0:
-                        rb = QRadioButton("(none)"); bg.addButton(rb); vb.addWidget(rb)
-                        if not selected.get(gid): rb.setChecked(True)
-                        rb.toggled.connect(lambda c, x=gid: self._opt_changed(x, [], c) if c else None)
-                    for c in g.get("choices", []):
-                        rb = QRadioButton(f"{c.get('name', 'Unknown')} (+{c.get('points',0)})")
-                        apply_tooltip(rb, c.get("id"), c.get("name", ""))
-                        
-                        bg.addButton(rb); vb.addWidget(rb)
-                        if c.get("id") in selected.get(gid, []): rb.setChecked(True)
-                        rb.toggled.connect(lambda c, x=gid, y=c.get("id"): self._opt_changed(x, [y], c) if c else None)
-                
-                else:
-                    current_picks = selected.get(gid, [])
-                    if len(current_picks) > max_select:
-                        current_picks = current_picks[:max_select]; selected[gid] = current_picks
-                    for c in g.get("choices", []):
-                        cb = QCheckBox(f"{c.get('name', 'Unknown')} (+{c.get('points',0)})")
-                        apply_tooltip(cb, c.get("id"), c.get("name", ""))
-                        
-                        vb.addWidget(cb)
-                        if c.get("id") in current_picks: cb.setChecked(True)
-                        cb.toggled.connect(lambda c, x=gid, y=c.get("id"), w=cb, m=max_select: self._opt_multi_changed(c, x, y, w, m))
-                
-                self.options_layout.addWidget(box)
-            except Exception as e: print(f"Error building option group: {e}")
-        self.options_layout.addStretch(1)
+        panel.bind(entry)
         self._suppress_option_signals = False
+        if self._options_panel is not panel:
+            if self._options_panel is not None: self._options_panel.hide()
+            panel.show()
+            self._options_panel = panel
+
+    def _clear_options_panels(self):
+        for panel in self._options_panels.values(): panel.hide(); panel.deleteLater()
+        self._options_panels.clear()
+        self._options_panel, self._options_codex = None, self.mw.codex
 
     def _opt_quantity_changed(self, gid, cid, count):
-        if self._suppress_option_signals or self._current_real_index is None: return
-        entry = self.roster_entries[self._current_real_index]
+        entry = self._current_entry()
+        if self._suppress_option_signals or entry is None: return
         entry["selected"][gid] = [cid] * count
-        self._refresh_roster_list(select_entry_id=entry["id"])
+        self._refresh_entry(entry)
 
     def _opt_mixed_quantity_changed(self, gid, cid, count):
-        if self._suppress_option_signals or self._current_real_index is None: return
-        entry = self.roster_entries[self._current_real_index]
+        entry = self._current_entry()
+        if self._suppress_option_signals or entry is None: return
         current_picks = entry["selected"].get(gid, [])
         current_picks = [x for x in current_picks if x != cid]
         for _ in range(count): current_picks.append(cid)
         entry["selected"][gid] = current_picks
-        self._refresh_roster_list(select_entry_id=entry["id"])
+        self._refresh_entry(entry)
 
     def _opt_changed(self, gid, picks, checked):
-        if not self._suppress_option_signals and checked and self._current_real_index is not None:
-            entry = self.roster_entries[self._current_real_index]
+        entry = self._current_entry()
+        if not self._suppress_option_signals and checked and entry is not None:
             entry["selected"][gid] = picks
-            self._refresh_roster_list(select_entry_id=entry["id"])
+            self._refresh_entry(entry)
 
     def _opt_multi_changed(self, checked, gid, cid, widget, mx):
-        if self._suppress_option_signals or self._current_real_index is None: return
-        entry = self.roster_entries[self._current_real_index]
+        entry = self._current_entry()
+        if self._suppress_option_signals or entry is None: return
         picks = entry["selected"].setdefault(gid, [])
         if checked:
             if len(picks) >= mx:
@@ -514,30 +651,15 @@ class RosterBuilderWidget(QWidget):
             if cid not in picks: picks.append(cid)
         else:
             if cid in picks: picks.remove(cid)
-        self._refresh_roster_list(select_entry_id=entry["id"])
+        self._refresh_entry(entry)
 
     def _refresh_all(self):
-        total = 0
-        counts = {k: 0 for k in FORCE_ORG_LIMITS_5E}
-        for entry in self.roster_entries:
-            u = self.mw.get_unit_by_id(entry["unit_id"])
-            if not u: continue
-            
-            cost = u.get("base_points", 0) + u.get("points_per_model", 0) * entry.get("size", 1)
-            for gid, picks in entry.get("selected", {}).items():
-                for opt in u.get("options", []):
-                    if opt["group_id"] == gid:
-                        for c in opt.get("choices", []):
-                            count = 0
-                            if isinstance(picks, list): count = picks.count(c["id"])
-                            elif picks == c["id"]: count = 1
-                            if count > 0:
-                                pts = c.get("points", 0)
-                                mode = c.get("points_mode", "flat")
-                                cost += (pts * entry.get("size", 1)) if mode == "per_model" else (pts * count)
-            total += cost
-            if entry.get("parent_id") is None and u.get("slot") in counts: counts[u.get("slot")] += 1
+        self.roster.bind(self.mw.codex)
+        self.roster.refresh()
+        self._update_summary()
 
+    def _update_summary(self):
+        total, counts = self.roster.total, self.roster.slot_counts
         limit = self.points_limit.value()
         self.points_label.setText(f"Total: {total} / {limit}")
         self.points_label.setStyleSheet("color: red; font-weight: bold;" if total > limit else "font-weight: bold;")
@@ -550,13 +672,15 @@ class RosterBuilderWidget(QWidget):
                 errs.append(f"{s}: {counts[s]}")
         self.force_org_label.setText("Force Org: " + ("OK" if valid else "INVALID (" + ", ".join(errs) + ")"))
         self.force_org_label.setStyleSheet("color: red;" if not valid else "")
+        if self.fits_check.isChecked(): self._refresh_available_units()
 
     def _save_roster(self):
+        self._flush_refresh()
         ensure_folder(Path("rosters"))
         path, _ = QFileDialog.getSaveFileName(self, "Save Roster", str(Path("rosters")), "JSON Files (*.json)")
         if path:
             data = {
-                "roster_entries": self.roster_entries,
+                "roster_entries": self.roster.entries,
                 "points_limit": self.points_limit.value(),
                 "codex_file": self.mw.codex_path.name if self.mw.codex_path else None
             }
@@ -566,22 +690,59 @@ class RosterBuilderWidget(QWidget):
         path, _ = QFileDialog.getOpenFileName(self, "Load Roster", str(Path("rosters")), "JSON Files (*.json)")
         if path:
             data = read_json(Path(path))
-            self.roster_entries = []
-            for e in data.get("roster_entries", []):
-                if "id" not in e: e["id"] = str(uuid.uuid4())
-                if "parent_id" not in e: e["parent_id"] = None
-                self.roster_entries.append(e)
+            self.roster = Roster(data.get("roster_entries", []))
+            self._library_id, self._library_name = None, ""
             self.points_limit.setValue(data.get("points_limit", 1500))
             self._refresh_roster_list()
 
+    def _save_to_library(self):
+        default = self._library_name or f"{self.mw.codex.name or 'Roster'} {self.points_limit.value()}pts"
+        name, ok = QInputDialog.getText(self, "Save to Library", "Roster name", text=default)
+        if not ok or not name.strip(): return
+        if name.strip() != self._library_name: self._library_id = None   # a new name saves a new copy
+        self._library_id = library().save(self.roster, self.mw.codex, name.strip(), self.points_limit.value(),
+                                          self.mw.codex_path.name if self.mw.codex_path else None, self._library_id)
+        self._library_name = name.strip()
+        self.mw.statusBar().showMessage(f"Saved '{self._library_name}' to the roster library")
+
+    def _open_library(self):
+        store = library()
+        dlg = RosterLibraryDialog(self, store, self.mw.codex_path.name if self.mw.codex_path else None)
+        if dlg.exec() != QDialog.Accepted or not dlg.selected_id(): return
+        data = store.load(dlg.selected_id())
+        if data is None: return
+        codex_file = data.get("codex_file")
+        if codex_file and (not self.mw.codex_path or self.mw.codex_path.name != codex_file):
+            path = Path("codexes") / codex_file
+            if path.exists(): self.mw.load_codex(path)
+            else: QMessageBox.warning(self, "Codex missing", f"'{codex_file}' not found; using the current codex.")
+        self.roster = Roster(data["roster"])
+        self.points_limit.setValue(data.get("points_limit") or 1500)
+        self._library_id, self._library_name = data["id"], data["roster_name"]
+        self._refresh_roster_list()
+
+    def _optimise_roster(self):
+        dlg = ListOptimiserDialog(self, self.mw.codex, self.points_limit.value())
+        if dlg.exec() != QDialog.Accepted: return
+        entries = dlg.selected_entries()
+        if not entries: return
+        if len(self.roster) and QMessageBox.question(self, "Replace roster", "Replace the current roster with this list?") != QMessageBox.Yes:
+            return
+        self.roster = Roster(entries)
+        self._refresh_roster_list()
+
     def _export_roster_pdf(self):
         if not HAVE_REPORTLAB:
             QMessageBox.critical(self, "Error", "ReportLab not installed.")
             return
         ensure_folder(Path("exports"))
-        default_name = f"{(self.mw.codex_data or {}).get('codex_name','roster')}_{self.points_limit.value()}pts_{datetime.now().strftime('%Y%m%d')}.pdf"
+        default_name = f"{self.mw.codex.name or 'roster'}_{self.points_limit.value()}pts_{datetime.now().strftime('%Y%m%d')}.pdf"
         default_name = slugify(default_name).replace("_pdf", "") + ".pdf"
         path, _ = QFileDialog.getSaveFileName(self, "Export PDF", str((Path("exports") / default_name).resolve()), "PDF Files (*.pdf)")
         if path:
-            write_roster_pdf(self.roster_entries, self.mw.codex_data, self.points_limit.value(), path, self.mw.get_unit_by_id)
+            try:
+                write_roster_pdf(self.roster.entries, self.mw.codex, self.points_limit.value(), path)
+            except Exception as e:
+                QMessageBox.critical(self, "Export failed", str(e))
+                return
             QMessageBox.information(self, "Success", "PDF Exported.")
\ No newline at end of file